@@ -0,0 +1,90 @@
+#
+# Benchmark: ASCIIComms parsing, line-oriented chunked parser vs. the previous character-at-a-time parser
+#
+# Usage:
+#   python benchmarks/ascii_scanner.py [--frames N] [--chunk BYTES]
+#
+# Both implementations are fed the same recorded ASCII stream, must produce identical frames, and the
+# frames per second of each is reported.
+#
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import Frame, FrameType
+from simplefoc.packets import ASCIIComms
+from binary_scanner import RecordedConnection
+from suite import ascii_stream
+
+
+class CharwiseASCIIComms(ASCIIComms):
+    """ The previous ASCIIComms implementation, appending one character at a time to the line buffer. """
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._buffer = ''
+
+    def _process_bytes(self, data):
+        frames = []
+        for character in data.decode('ascii'):
+            if character == '\n':
+                if self._in_sync:
+                    frame = self._ASCIIComms__parseFrame(self._buffer)
+                    self._buffer = ''
+                    if frame is not None:
+                        frames.append(frame)
+                else:
+                    self._buffer = ''
+                    self._in_sync = True
+                    self.send_frame(Frame(frame_type=FrameType.SYNC))
+            elif character == '\r':
+                pass
+            else:
+                self._buffer += character
+        return frames
+
+
+class WriteRecorder(RecordedConnection):
+    def __init__(self, data, chunk):
+        super().__init__(data, chunk)
+        self.written = b''
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+
+def run(cls, data, chunk):
+    comms = cls(WriteRecorder(data, chunk))
+    frames = []
+    start = time.perf_counter()
+    while comms.connection.in_waiting > 0:
+        frames.extend(comms.get_frames())
+    return frames, time.perf_counter() - start, comms.connection.written
+
+
+def same_frames(a, b):
+    if len(a) != len(b):
+        return False
+    for fa, fb in zip(a, b):
+        if fa.frame_type != fb.frame_type or fa.values != fb.values or getattr(fa, 'register', None) != getattr(fb, 'register', None):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ASCIIComms parser benchmark')
+    parser.add_argument('--frames', type=int, default=100000, help='Number of frames in the test stream')
+    parser.add_argument('--chunk', type=int, default=4096, help='Bytes available per read')
+    args = parser.parse_args()
+
+    # start mid-line with a carriage return, as when connecting to a running driver
+    data = b'0,1.5\r\n' + ascii_stream(args.frames).replace(b'\n', b'\r\n')
+    old_frames, old_time, old_written = run(CharwiseASCIIComms, data, args.chunk)
+    new_frames, new_time, new_written = run(ASCIIComms, data, args.chunk)
+    if not same_frames(old_frames, new_frames) or old_written != new_written:
+        print("ERROR: line parser output differs from character-at-a-time output")
+        sys.exit(1)
+    print(f"stream: {len(data)} bytes, {len(new_frames)} frames")
+    print(f"character-at-a-time: {len(old_frames)/old_time:12.0f} frames/s")
+    print(f"line-oriented:       {len(new_frames)/new_time:12.0f} frames/s  ({old_time/new_time:.1f}x)")
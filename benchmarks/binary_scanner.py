@@ -0,0 +1,149 @@
+#
+# Benchmark: BinaryComms frame scanning, chunked scanner vs. the previous byte-at-a-time state machine
+#
+# Usage:
+#   python benchmarks/binary_scanner.py [--frames N] [--chunk BYTES]
+#
+# Both implementations are fed the same recorded byte stream (telemetry and response frames, with some
+# line noise mixed in), and must produce identical frames. The frames per second of each is reported.
+#
+
+import argparse, contextlib, io, os, random, struct, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc.packets import BinaryComms, MARKER
+from simplefoc.registers import SimpleFOCRegisters
+
+
+class RecordedConnection:
+    """ Minimal stand-in for a serial port, which returns a pre-recorded byte stream in chunks. """
+    def __init__(self, data, chunk=4096):
+        self.data = data
+        self.chunk = chunk
+        self.pos = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.data) - self.pos)
+
+    def read(self, size=1):
+        result = self.data[self.pos:self.pos+size]
+        self.pos += len(result)
+        return result
+
+    def write(self, data):
+        return len(data)
+
+
+class BytewiseBinaryComms(BinaryComms):
+    """ The previous BinaryComms.get_frame implementation, reading and processing one byte at a time. """
+    def get_frame(self):
+        while self.connection.in_waiting > 0:
+            byte = self.connection.read()
+            frame = self.__processByte(byte[0])
+            if frame is not None:
+                return frame
+        return None
+
+    def get_frames(self):
+        frames = []
+        while self.connection.in_waiting > 0:
+            frame = self.get_frame()
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def __processByte(self, byte):
+        if byte == MARKER:
+            if self._expected == 0:
+                if self._marker:
+                    self._expected = byte
+                    self._marker = False
+                else:
+                    self._in_sync = False
+                    self._marker = True
+                    self._buffer.clear()
+                return None
+            if len(self._buffer) == self._expected:
+                self._in_sync = True
+                frame = self._BinaryComms__parseFrame(self._buffer)
+                if frame is None:
+                    self._in_sync = False
+                self._expected = 0
+                self._marker = True
+                self._buffer.clear()
+                return frame
+            else:
+                self._buffer.append(byte)
+                return None
+        elif ( len(self._buffer) >= self._expected and self._expected > 0 ) or len(self._buffer) >= 255:
+            self._in_sync = False
+            self._expected = 0
+            self._buffer.clear()
+            return None
+        if self._marker:
+            self._expected = byte
+            self._marker = False
+            return None
+        self._buffer.append(byte)
+        return None
+
+
+def frame_bytes(payload):
+    return bytes([MARKER, len(payload)]) + payload
+
+
+def make_stream(num_frames, seed=1):
+    rnd = random.Random(seed)
+    out = bytearray()
+    for i in range(num_frames):
+        if i % 50 == 0:
+            out += frame_bytes(b'r' + bytes([SimpleFOCRegisters.REG_TARGET.id]) + struct.pack('<f', rnd.uniform(-10, 10)))
+        else:
+            values = struct.pack('<ffIf', rnd.uniform(-100, 100), rnd.uniform(-100, 100), i, rnd.uniform(-1, 1))
+            out += frame_bytes(b'T\x00' + values)
+        if i % 997 == 0:
+            out += bytes(rnd.randrange(0x80, 0x100) for _ in range(rnd.randrange(1, 40)))  # line noise
+    out += bytes([MARKER])      # marker of the next frame completes the last one
+    return bytes(out)
+
+
+def run(cls, data, chunk):
+    comms = cls(RecordedConnection(data, chunk))
+    frames = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):     # silence the sync loss warnings caused by the noise
+        while comms.connection.in_waiting > 0:
+            frames.extend(comms.get_frames())
+    elapsed = time.perf_counter() - start
+    return frames, elapsed
+
+
+def same_frames(a, b):
+    if len(a) != len(b):
+        return False
+    for fa, fb in zip(a, b):
+        if fa.frame_type != fb.frame_type or bytes(fa.values if isinstance(fa.values, (bytes, bytearray)) else b'') != bytes(fb.values if isinstance(fb.values, (bytes, bytearray)) else b''):
+            return False
+        if getattr(fa, 'register', None) != getattr(fb, 'register', None):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BinaryComms scanner benchmark')
+    parser.add_argument('--frames', type=int, default=200000, help='Number of frames in the test stream')
+    parser.add_argument('--chunk', type=int, default=4096, help='Bytes available per read')
+    args = parser.parse_args()
+
+    data = make_stream(args.frames)
+    old_frames, old_time = run(BytewiseBinaryComms, data, args.chunk)
+    new_frames, new_time = run(BinaryComms, data, args.chunk)
+    if not same_frames(old_frames, new_frames):
+        print("ERROR: chunked scanner output differs from byte-at-a-time output")
+        sys.exit(1)
+    print(f"stream: {len(data)} bytes, {len(new_frames)} frames")
+    print(f"byte-at-a-time: {len(old_frames)/old_time:12.0f} frames/s")
+    print(f"chunked:        {len(new_frames)/new_time:12.0f} frames/s  ({old_time/new_time:.1f}x)")
@@ -0,0 +1,106 @@
+#
+# Benchmark: CPU cost of many connections, with a reader thread per connection vs. one MotorBus
+#
+# Starts N simulated drivers on pseudo-terminals in a child process, connects to all of them, and measures the
+# CPU time used by this process (all its threads) over a fixed period: first idle, then with every driver
+# sending telemetry. The threaded connections are measured both polling (read_timeout=None, sleeping 1ms
+# between polls) and with blocking reads (the default read timeout).
+#
+# Usage:
+#   python benchmarks/bus_scaling.py [--drivers N ...] [--seconds S] [--rate HZ]
+#
+
+import argparse, json, os, resource, subprocess, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import READ_TIMEOUT, packets, simulator
+from simplefoc.bus import MotorBus
+from simplefoc.registers import SimpleFOCRegisters
+
+
+def serve(num_drivers):
+    """ Child process: run the simulated drivers until stdin is closed """
+    drivers = [simulator.SimulatedDriver(packets.ProtocolType.binary) for i in range(num_drivers)]
+    print(json.dumps([d.pty() for d in drivers]), flush=True)
+    sys.stdin.read()
+    for d in drivers:
+        d.stop()
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(seconds):
+    start, cpu = time.perf_counter(), cpu_time()
+    time.sleep(seconds)
+    return (cpu_time() - cpu) / (time.perf_counter() - start) * 100.0
+
+
+def run(mode, ports, seconds, rate):
+    frames = [0]
+    def count(frame):
+        frames[0] += 1
+    bus = None
+    if mode == 'bus':
+        bus = MotorBus()
+        motors = [bus.serial(port, 1000000) for port in ports]
+        bus.connect()
+        bus.observable().subscribe(count)
+    else:
+        read_timeout = None if mode == 'polling threads' else READ_TIMEOUT
+        motors = [packets.serial(port, 1000000, read_timeout=read_timeout) for port in ports]
+        for m in motors:
+            m.connect()
+            m.connection.observable().subscribe(count)
+    threads = threading.active_count()
+    try:
+        for m in motors:
+            m.telemetry().set_downsample(0)
+        time.sleep(0.2)
+        idle = measure(seconds)
+        for m in motors:
+            telemetry = m.telemetry()
+            telemetry.set_registers([SimpleFOCRegisters.REG_ANGLE, SimpleFOCRegisters.REG_VELOCITY])
+            telemetry.set_downsample(int(simulator.SimulatedDriver().loop_rate / rate))
+        time.sleep(0.2)
+        frames[0] = 0
+        busy = measure(seconds)
+        received = frames[0] / seconds
+        for m in motors:
+            m.telemetry().set_downsample(0)
+    finally:
+        if bus is not None:
+            bus.disconnect()
+        else:
+            for m in motors:
+                m.disconnect()
+    return threads, idle, busy, received
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reader threads vs. MotorBus CPU usage')
+    parser.add_argument('--drivers', type=int, nargs='+', default=[1, 8, 32], help='Numbers of drivers to connect to')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Measurement period')
+    parser.add_argument('--rate', type=float, default=100.0, help='Telemetry frames per second sent by each driver')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve)
+        sys.exit(0)
+
+    print(f"CPU of this process in % of one core, idle and with {args.rate:.0f} telemetry frames/s per driver")
+    for num_drivers in args.drivers:
+        host = subprocess.Popen([sys.executable, __file__, '--serve', str(num_drivers)], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        try:
+            ports = json.loads(host.stdout.readline())
+            for mode in ('polling threads', 'blocking threads', 'bus'):
+                threads, idle, busy, received = run(mode, ports, args.seconds, args.rate)
+                print(f"{num_drivers:3d} drivers, {mode:>16}: {threads:3d} threads, idle {idle:5.1f}%, "
+                      f"telemetry {busy:5.1f}% ({received:7.0f} frames/s)")
+        finally:
+            host.stdin.close()
+            host.wait()
@@ -0,0 +1,142 @@
+#
+# Benchmark: telemetry decoding throughput of many ports, in process vs. with ProcessCapture workers
+#
+# Each simulated port replays a recorded binary telemetry stream (8 registers, 11 values per sample) as fast
+# as it is read, in chunks of the size a 2Mbaud port delivers every few milliseconds. The ports are read by
+# reader threads. The chunks are decoded into a SharedRing per port in batches, in the same way either in
+# process, by the reader threads, or with ProcessCapture, by the worker processes, so the ratios only show the
+# effect of moving the decoding to the workers. It should scale with the number of workers, up to the number
+# of CPU cores; with a single core, the workers only add the cost of passing the chunks to them.
+#
+# Usage:
+#   python benchmarks/capture_scaling.py [--ports N] [--samples N] [--workers N ...] [--chunk BYTES]
+#
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from simplefoc import Frame, FrameType
+from simplefoc.packets import BinaryComms, MARKER
+from simplefoc.motors import Motors
+from simplefoc.capture import ProcessCapture, _WorkerPort
+from simplefoc.ring import SharedRing
+from binary_scanner import frame_bytes
+from telemetry_decode import HEADER_REGISTERS, make_payloads
+
+
+class ReplayConnection:
+    """ Serial port stand-in returning a recorded byte stream in chunks, as fast as it is read """
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+        self.pos = 0
+        self.timeout = None
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        return len(data)
+
+    @property
+    def finished(self):
+        return self.pos >= len(self.data)
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.data) - self.pos)
+
+    def read(self, size=1):
+        if self.pos >= len(self.data):
+            time.sleep(0.001)
+        result = self.data[self.pos:self.pos + size]
+        self.pos += len(result)
+        return result
+
+
+def make_stream(num_samples, seed):
+    header = Frame(frame_type=FrameType.HEADER, telemetryid=0, registers=HEADER_REGISTERS, motors=[0] * len(HEADER_REGISTERS))
+    out = bytearray(frame_bytes(b'H\x00' + b''.join(bytes((0, r.id)) for r in HEADER_REGISTERS)))
+    for payload in make_payloads(header, num_samples, seed):
+        out += frame_bytes(b'T\x00' + payload)
+    return bytes(out + bytes([MARKER]))
+
+
+def wait(done, timeout=300.0):
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise RuntimeError("timed out")
+        time.sleep(0.005)
+
+
+class InProcessComms(BinaryComms):
+    """ BinaryComms decoding the received bytes on its reader thread, as a ProcessCapture worker would """
+    def __init__(self, connection, num_samples):
+        super().__init__(connection, 0.01)
+        self.ring = SharedRing(create=True, capacity=num_samples)
+        self.port = _WorkerPort(self.ring, 0)
+
+    def _receive(self, data):
+        return self.port.receive(data)
+
+
+def in_process(streams, chunk, num_samples):
+    connections = [ReplayConnection(data, chunk) for data in streams]
+    ports = [Motors(InProcessComms(c, num_samples)) for c in connections]
+    rings = [m.connection.ring for m in ports]
+    start = time.perf_counter()
+    for m in ports:
+        m.connect()
+    wait(lambda: all(r.sequence >= num_samples for r in rings))
+    elapsed = time.perf_counter() - start
+    samples = sum(r.sequence for r in rings)
+    for m in ports:
+        m.disconnect()
+        m.connection.ring.close()
+        m.connection.ring.unlink()
+    return samples, elapsed
+
+
+def with_workers(streams, chunk, workers, num_samples):
+    capture = ProcessCapture(workers=workers, capacity=num_samples)
+    connections = [ReplayConnection(data, chunk) for data in streams]
+    ports = [capture.add(c, "port{}".format(i)) for i, c in enumerate(connections)]
+    capture.start()
+    time.sleep(0.5)     # let the worker processes start up
+    start = time.perf_counter()
+    for m in ports:
+        m.connect()
+    rings = [capture.ring(m) for m in ports]
+    wait(lambda: all(r.sequence >= num_samples for r in rings))
+    elapsed = time.perf_counter() - start
+    samples = sum(r.sequence for r in rings)
+    capture.stop()
+    return samples, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ProcessCapture decoding scaling benchmark')
+    parser.add_argument('--ports', type=int, default=4, help='Number of simulated ports')
+    parser.add_argument('--samples', type=int, default=200000, help='Telemetry samples per port')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Numbers of worker processes to try')
+    parser.add_argument('--chunk', type=int, default=4096, help='Bytes per read from a port')
+    args = parser.parse_args()
+
+    streams = [make_stream(args.samples, seed) for seed in range(args.ports)]
+    print(f"{args.ports} ports x {args.samples} samples ({len(streams[0]) / 1e6:.1f} MB per port), {os.cpu_count()} CPUs")
+    samples, elapsed = in_process(streams, args.chunk, args.samples)
+    base = samples / elapsed
+    print(f"   in process: {samples:9d} samples in {elapsed:6.2f} s, {base:10.0f} samples/s")
+    first = None
+    for workers in args.workers:
+        samples, elapsed = with_workers(streams, args.chunk, workers, args.samples)
+        if first is None:
+            first = samples / elapsed
+        print(f"{workers:3d} workers: {samples:9d} samples in {elapsed:6.2f} s, {samples / elapsed:10.0f} samples/s "
+              f"({samples / elapsed / base:.1f}x in process, {samples / elapsed / first:.2f}x {args.workers[0]} workers)")
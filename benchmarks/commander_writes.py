@@ -0,0 +1,101 @@
+#
+# Benchmark: coalesced Commander writes vs. one write per command
+#
+# Applies a full set of motor settings (limits, motor parameters, PID gains, sensor offsets) through the
+# FullControl setters to a simulated Commander driver attached to a pseudo-terminal, and measures the
+# number of writes made and the wall-clock time until the driver has answered every command. The
+# unbatched case sends each command with its own writelines() call, as Commander did before batching.
+#
+# Usage:
+#   python benchmarks/commander_writes.py [--rounds N] [--max-write BYTES]
+#
+
+import argparse, os, sys, threading, time, serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import commander, simulator
+
+
+class CountingSerial:
+    """ Counts the write calls reaching the serial port """
+    def __init__(self, connection):
+        self.connection = connection
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return self.connection.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+class UnbatchedCommander(commander.Commander):
+    """ Sends each command as soon as it is given, with one writelines() call """
+    def send_command(self, command):
+        self.connection.writelines([command.encode('ascii'), '\n'.encode('ascii')])
+        self._echosubject.on_next(command)
+
+
+def apply_settings(motor, i):
+    motor.set_limits(max_voltage=12.0, max_current=2.0, max_velocity=50.0 + i)
+    motor.set_motor_parameters(resistance=5.6, kv=100.0, inductance=0.002)
+    motor.set_velocity_pid(p=0.2, i=20.0, d=0.0, limit=12.0, ramp=1000.0, tf=0.01)
+    motor.set_angle_pid(p=20.0, i=0.0, d=0.0, limit=20.0, ramp=0.0, tf=0.0)
+    motor.set_current_q_pid(p=3.0, i=300.0, d=0.0, limit=12.0, ramp=0.0, tf=0.005)
+    motor.set_current_p_pid(p=3.0, i=300.0, d=0.0, limit=12.0, ramp=0.0, tf=0.005)
+    motor.set_sensor_offsets(offset=0.0, zero_electrical_angle=1.5)
+
+COMMANDS_PER_ROUND = 3 + 3 + 6 * 4 + 2
+
+
+def run(cls, rounds, max_write):
+    driver = simulator.SimulatedDriver(simulator.COMMANDER)
+    connection = serial.Serial()
+    connection.port = driver.pty()
+    counting = CountingSerial(connection)
+    cmdr = cls(counting, max_write=max_write)
+    expected = rounds * COMMANDS_PER_ROUND
+    received = [0]
+    done = threading.Event()
+    def on_line(line):
+        received[0] += 1
+        if received[0] >= expected:
+            done.set()
+    cmdr.listen(on_line)
+    cmdr.connect()
+    try:
+        motor = cmdr.full_control('M')
+        start = time.perf_counter()
+        for i in range(rounds):
+            apply_settings(motor, i)
+        sent = time.perf_counter() - start
+        if not done.wait(30.0):
+            raise RuntimeError("driver answered {} of {} commands".format(received[0], expected))
+        total = time.perf_counter() - start
+    finally:
+        cmdr.disconnect()
+        driver.stop()
+    return counting.writes, sent, total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Commander write coalescing benchmark')
+    parser.add_argument('--rounds', type=int, default=200, help='Number of times to apply the full settings')
+    parser.add_argument('--max-write', type=int, default=commander.MAX_WRITE, help='Maximum bytes per coalesced write')
+    args = parser.parse_args()
+
+    print(f"{args.rounds} rounds of {COMMANDS_PER_ROUND} commands, max_write={args.max_write}")
+    results = {}
+    for name, cls in (('unbatched', UnbatchedCommander), ('batched', commander.Commander)):
+        writes, sent, total = run(cls, args.rounds, args.max_write)
+        results[name] = (writes, sent, total)
+        print(f"{name:>10}: {writes:7d} writes, sent in {sent*1000:8.1f} ms, all answered after {total*1000:8.1f} ms")
+    (w0, s0, t0), (w1, s1, t1) = results['unbatched'], results['batched']
+    print(f"     saved: {w0 - w1:7d} writes ({(1 - w1 / w0) * 100:.0f}%), "
+          f"{(s0 - s1)*1000:.1f} ms sending ({s0 / s1:.1f}x), {(t0 - t1)*1000:.1f} ms end to end ({t0 / t1:.1f}x)")
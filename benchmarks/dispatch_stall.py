@@ -0,0 +1,122 @@
+#
+# Benchmark: a bursty, slow subscriber stalling the serial reader, with and without the dispatcher
+#
+# A simulated UART delivers a binary telemetry stream at a fixed baud rate into a receive buffer of limited
+# size, like the OS serial driver: bytes arriving while the buffer is full are lost. The subscriber stalls
+# periodically (e.g. redrawing a plot). Delivering frames on the reader thread, the stalls overflow the
+# buffer and BinaryComms loses sync; with a dispatcher the reader keeps draining the port.
+#
+# Usage:
+#   python benchmarks/dispatch_stall.py [--frames N] [--baud BAUD] [--stall SECONDS] [--every FRAMES] [--queue N]
+#
+
+import argparse, contextlib, io, os, struct, sys, threading, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import FrameType
+from simplefoc.packets import BinaryComms
+from simplefoc.dispatch import DropPolicy, DISPATCH_QUEUE_SIZE
+from binary_scanner import frame_bytes, MARKER
+
+
+class UartConnection:
+    """ Serial port stand-in receiving data at baud/10 bytes per second into a buffer of buffer_size bytes """
+    def __init__(self, data, baud, buffer_size=4096):
+        self.data = data
+        self.rate = baud / 10
+        self.buffer_size = buffer_size
+        self.timeout = None
+        self.lost = 0
+        self._buffer = bytearray()
+        self._arrived = 0
+        self._start = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def open(self):
+        self._start = time.perf_counter()
+
+    def close(self):
+        pass
+
+    def cancel_read(self):
+        self._cancelled = True
+
+    def write(self, data):
+        return len(data)
+
+    @property
+    def finished(self):
+        with self._lock:
+            self.__receive()
+            return self._arrived == len(self.data) and len(self._buffer) == 0
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self.__receive()
+            return len(self._buffer)
+
+    def read(self, size=1):
+        deadline = time.perf_counter() + (self.timeout or 0)
+        while self.in_waiting == 0 and not self._cancelled and time.perf_counter() < deadline:
+            time.sleep(0.0005)
+        with self._lock:
+            result = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return result
+
+    def __receive(self):
+        arrived = min(len(self.data), int((time.perf_counter() - self._start) * self.rate))
+        new = self.data[self._arrived:arrived]
+        self._arrived = arrived
+        room = self.buffer_size - len(self._buffer)
+        self._buffer += new[:room]
+        self.lost += max(0, len(new) - room)
+
+
+def make_stream(num_frames):
+    # telemetry only, without the line noise of binary_scanner.make_stream, so every warning is a real loss of sync
+    out = bytearray()
+    for i in range(num_frames):
+        out += frame_bytes(b'T\x00' + struct.pack('<ffIf', 1.0, -1.0, i, 0.5))
+    return bytes(out + bytes([MARKER]))
+
+
+def run(data, baud, drop_policy, queue_size, stall, every):
+    connection = UartConnection(data, baud)
+    comms = BinaryComms(connection, 0.01, drop_policy, queue_size)
+    received = [0]
+    def on_frame(frame):
+        if frame.frame_type == FrameType.TELEMETRY:
+            received[0] += 1
+            if received[0] % every == 0:
+                time.sleep(stall)
+    comms.observable().subscribe(on_frame)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):      # count the sync loss warnings instead of printing them
+        comms.connect()
+        while not connection.finished:
+            time.sleep(0.01)
+        comms.disconnect()
+    return received[0], connection.lost, out.getvalue().count('WARNING'), comms.dispatcher
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Slow subscriber stalling the serial reader')
+    parser.add_argument('--frames', type=int, default=30000, help='Number of frames in the stream')
+    parser.add_argument('--baud', type=int, default=2000000, help='Simulated baud rate')
+    parser.add_argument('--stall', type=float, default=0.05, help='Subscriber stall, in seconds')
+    parser.add_argument('--every', type=int, default=1000, help='Subscriber stalls every this many frames')
+    parser.add_argument('--queue', type=int, default=DISPATCH_QUEUE_SIZE, help='Dispatcher queue size, up to twice as many frames can be held (see Dispatcher)')
+    args = parser.parse_args()
+
+    data = make_stream(args.frames)
+    sent = args.frames
+    print(f"{sent} telemetry frames, {len(data)} bytes at {args.baud} baud, subscriber stalls {args.stall*1000:.0f} ms every {args.every} frames")
+    for name, policy in (('reader thread', None), ('drop_oldest', DropPolicy.drop_oldest),
+                         ('drop_newest', DropPolicy.drop_newest), ('block', DropPolicy.block)):
+        received, lost, warnings, dispatcher = run(data, args.baud, policy, args.queue, args.stall, args.every)
+        counters = "" if dispatcher is None else f", queued {dispatcher.queued}, dropped {dispatcher.dropped}, high water {dispatcher.high_water}"
+        print(f"{name:>14}: received {received:6d} ({received / sent * 100:5.1f}%), bytes lost at the port {lost:7d}, sync warnings {warnings:4d}{counters}")
@@ -0,0 +1,66 @@
+#
+# Benchmark: allocation and construction cost of the generic Frame vs. the __slots__ frame types
+#
+# Measures the memory held by N telemetry frames and the frame construction rate, both with the generic
+# Frame (per-instance __dict__, time.time() per frame) and with TelemetryFrame (__slots__, one timestamp
+# per read chunk), and the end-to-end rate of BinaryComms decoding a telemetry stream.
+#
+# Usage:
+#   python benchmarks/frame_alloc.py [--frames N]
+#
+
+import argparse, os, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import Frame, FrameType, TelemetryFrame
+from simplefoc.packets import BinaryComms
+from binary_scanner import RecordedConnection, frame_bytes
+
+
+PAYLOAD = bytes(range(24))
+
+
+def make_generic(n):
+    return [Frame(frame_type=FrameType.TELEMETRY, telemetryid=0, values=PAYLOAD, payload=PAYLOAD) for i in range(n)]
+
+
+def make_slots(n):
+    timestamp = time.monotonic_ns()
+    return [TelemetryFrame(0, PAYLOAD, payload=PAYLOAD, timestamp=timestamp) for i in range(n)]
+
+
+def held_memory(func, n):
+    tracemalloc.start()
+    frames = func(n)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del frames
+    return size / n
+
+
+def rate(func, n):
+    start = time.perf_counter()
+    func(n)
+    return n / (time.perf_counter() - start)
+
+
+def decode_rate(n):
+    data = b''.join(frame_bytes(b'T\x00' + PAYLOAD) for i in range(n)) + b'\xa5'
+    comms = BinaryComms(RecordedConnection(data, 4096))
+    count = 0
+    start = time.perf_counter()
+    while comms.connection.in_waiting:
+        count += len(comms.get_frames())
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Frame allocation benchmark')
+    parser.add_argument('--frames', type=int, default=200000, help='Number of frames to create')
+    args = parser.parse_args()
+
+    print(f"bytes per frame:  Frame {held_memory(make_generic, args.frames):6.0f}   TelemetryFrame {held_memory(make_slots, args.frames):6.0f}")
+    generic, slots = rate(make_generic, args.frames), rate(make_slots, args.frames)
+    print(f"frames per sec:   Frame {generic:10.0f}   TelemetryFrame {slots:10.0f}  ({slots/generic:.1f}x)")
+    print(f"BinaryComms telemetry decode: {decode_rate(args.frames):10.0f} frames/s")
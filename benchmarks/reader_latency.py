@@ -0,0 +1,82 @@
+#
+# Benchmark: frame delivery latency of the Comms reader thread, polling vs. blocking reads
+#
+# Usage:
+#   python benchmarks/reader_latency.py [--frames N] [--interval SECONDS]
+#
+# A fake device on the master side of a pty writes binary response frames at random intervals, and the
+# time from the write until the frame is emitted by BinaryComms.observable() is measured. POSIX only.
+#
+
+import argparse, os, pty, random, statistics, sys, threading, time, tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import serial as ser
+from simplefoc.packets import BinaryComms, MARKER
+from simplefoc.registers import SimpleFOCRegisters
+
+
+def measure(read_timeout, num_frames, interval):
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    conn = ser.Serial()
+    conn.port = os.ttyname(slave)
+    conn.baudrate = 115200
+    comms = BinaryComms(conn, read_timeout)
+    sent = {}
+    latencies = []
+    done = threading.Event()
+
+    def on_frame(frame):
+        latencies.append(time.perf_counter() - sent[frame.values[0]])
+        if len(latencies) >= num_frames:
+            done.set()
+    comms.observable().subscribe(on_frame)
+    comms.connect()
+
+    # drain whatever the host writes, so the pty buffer doesn't fill up
+    draining = True
+    def drain():
+        while draining:
+            try:
+                os.read(master, 1024)
+            except OSError:
+                break
+    threading.Thread(target=drain, daemon=True).start()
+
+    rnd = random.Random(1)
+    os.write(master, bytes([MARKER]))
+    for i in range(num_frames):
+        time.sleep(rnd.uniform(0.5, 1.5) * interval)
+        # response frame carrying the sequence number, followed by the marker of the next frame which completes it
+        payload = b'r' + bytes([SimpleFOCRegisters.REG_SYS_TIME.id]) + i.to_bytes(4, 'little')
+        sent[i] = time.perf_counter()
+        os.write(master, bytes([len(payload)]) + payload + bytes([MARKER]))
+        while len(latencies) <= i and not done.is_set():
+            time.sleep(0.0001)
+    done.wait(5.0)
+    disconnect_start = time.perf_counter()
+    comms.disconnect()
+    disconnect_time = time.perf_counter() - disconnect_start
+    draining = False
+    os.close(master)
+    os.close(slave)
+    return latencies, disconnect_time
+
+
+def report(name, latencies, disconnect_time):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies)//2] * 1e6
+    p99 = latencies[min(len(latencies)-1, int(len(latencies)*0.99))] * 1e6
+    print(f"{name:10} p50 {p50:8.0f} us   p99 {p99:8.0f} us   mean {statistics.mean(latencies)*1e6:8.0f} us   disconnect {disconnect_time*1e3:6.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reader thread latency benchmark')
+    parser.add_argument('--frames', type=int, default=500, help='Number of frames to send')
+    parser.add_argument('--interval', type=float, default=0.002, help='Mean interval between frames, in seconds')
+    args = parser.parse_args()
+
+    report('polling', *measure(None, args.frames, args.interval))
+    report('blocking', *measure(0.1, args.frames, args.interval))
@@ -0,0 +1,83 @@
+#
+# Benchmark: a control loop reading configuration registers, with and without the register cache
+#
+# A simulated binary driver is attached to a pseudo-terminal. Each iteration of the loop reads a few
+# configuration registers and the angle (which is also streamed as telemetry), and writes the target,
+# which mostly doesn't change. Reports the loop rate and the bytes sent to the driver.
+#
+# Also checks that Motor.restore(verify=True) reads back from the driver rather than from the cache: the
+# simulated motor ignores a write, and the verification must report the mismatch.
+#
+# Usage:
+#   python benchmarks/register_cache.py [--iterations N] [--max-age SECONDS]
+#
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import packets, simulator
+from simplefoc.registers import SimpleFOCRegisters
+
+CONFIG = [SimpleFOCRegisters.REG_VOLTAGE_LIMIT, SimpleFOCRegisters.REG_VEL_LIMIT,
+          SimpleFOCRegisters.REG_VEL_PID_P, SimpleFOCRegisters.REG_VEL_PID_I]
+
+
+def run(iterations, cached, max_age):
+    driver = simulator.SimulatedDriver(packets.ProtocolType.binary)
+    motors = packets.serial(driver.pty(), 1000000)
+    motors.connect()
+    try:
+        motor = motors.motor(0)
+        telemetry = motors.telemetry()
+        telemetry.set_registers([SimpleFOCRegisters.REG_ANGLE])
+        telemetry.set_downsample(10)
+        cache = motor.enable_cache(max_age=max_age, skip_unchanged=True) if cached else None
+        time.sleep(0.2)
+        metrics = motors.connection.metrics
+        bytes_out, writes = metrics.bytes_out, metrics.writes
+        start = time.perf_counter()
+        for i in range(iterations):
+            config = motor.get_registers(CONFIG)
+            angle = motor.get_register(SimpleFOCRegisters.REG_ANGLE)
+            motor.set_target(1.0 if i < iterations // 2 else 2.0)
+        elapsed = time.perf_counter() - start
+        return iterations / elapsed, metrics.bytes_out - bytes_out, metrics.writes - writes, cache
+    finally:
+        motors.disconnect()
+        driver.stop()
+
+
+def check_restore_verify():
+    """ With the cache enabled, a write the driver ignores must show up as a mismatch in restore(verify=True) """
+    driver = simulator.SimulatedDriver(packets.ProtocolType.binary)
+    motors = packets.serial(driver.pty(), 1000000)
+    motors.connect()
+    try:
+        motor = motors.motor(0)
+        motor.enable_cache(max_age=None, skip_unchanged=True)
+        expected = motor.get_register(SimpleFOCRegisters.REG_VEL_PID_P)
+        simulated = driver.motors[0]
+        set_register = simulated.set
+        simulated.set = lambda reg, values: None if reg == SimpleFOCRegisters.REG_VEL_PID_P else set_register(reg, values)
+        mismatches = motor.restore({ 'REG_VEL_PID_P': 0.125, 'REG_VEL_PID_I': 2.5 }, verify=True)
+        if mismatches != { 'REG_VEL_PID_P': (0.125, expected) }:
+            raise RuntimeError("restore(verify=True) returned {}, expected the ignored write of REG_VEL_PID_P".format(mismatches))
+        return mismatches
+    finally:
+        motors.disconnect()
+        driver.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Register cache benchmark')
+    parser.add_argument('--iterations', type=int, default=2000, help='Loop iterations')
+    parser.add_argument('--max-age', type=float, default=0.5, help='Maximum age of cached values, in seconds')
+    args = parser.parse_args()
+
+    print(f"{args.iterations} iterations reading {len(CONFIG)} config registers and the angle, writing the target")
+    for name, cached in (('uncached', False), ('cached', True)):
+        rate, sent, writes, cache = run(args.iterations, cached, args.max_age)
+        counters = "" if cache is None else f", hits {cache.hits}, misses {cache.misses}, writes skipped {cache.skipped}"
+        print(f"{name:>9}: {rate:9.0f} iterations/s, {sent:7d} bytes in {writes:6d} writes to the driver{counters}")
+    print(f"restore(verify=True) with the cache, the driver ignoring a write: {check_restore_verify()}")
@@ -0,0 +1,50 @@
+#
+# Benchmark: SimpleFOCRegisters.by_id and parse_register lookup cost as custom registers are added
+#
+# Usage:
+#   python benchmarks/register_lookup.py [--lookups N]
+#
+# The indexed lookup should stay flat, while the previous implementation (a scan of the class __dict__)
+# grows linearly with the number of registers.
+#
+
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc.registers import SimpleFOCRegisters, Register, parse_register
+
+
+def scan_by_id(id):
+    """ The previous SimpleFOCRegisters.by_id implementation """
+    for k in SimpleFOCRegisters.__dict__:
+        r = SimpleFOCRegisters.__dict__[k]
+        if isinstance(r, Register) and r.id == id:
+            return r
+    return None
+
+
+def per_lookup(func, arg, lookups):
+    start = time.perf_counter()
+    for i in range(lookups):
+        func(arg)
+    return (time.perf_counter() - start) / lookups * 1e9
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Register lookup benchmark')
+    parser.add_argument('--lookups', type=int, default=20000, help='Number of lookups per measurement')
+    args = parser.parse_args()
+
+    print(f"{'custom regs':>12} {'scan ns':>10} {'by_id ns':>10} {'parse_register(name) ns':>24}")
+    added = 0
+    for target in [0, 16, 64, 128]:
+        while added < target:
+            SimpleFOCRegisters.add_register(f'REG_BENCH_{added}', 0x80 + added, ['f'], ['f'])
+            added += 1
+        # look up the most recently added register, the worst case for the scan
+        last = SimpleFOCRegisters.by_name(f'REG_BENCH_{added-1}') if added > 0 else SimpleFOCRegisters.REG_SYS_TIME
+        scan = per_lookup(scan_by_id, last.id, args.lookups)
+        indexed = per_lookup(SimpleFOCRegisters.by_id, last.id, args.lookups)
+        named = per_lookup(parse_register, last.name, args.lookups)
+        print(f"{added:>12} {scan:>10.0f} {indexed:>10.0f} {named:>24.0f}")
@@ -0,0 +1,313 @@
+#
+# Protocol performance benchmark suite
+#
+# Runs the protocol benchmarks from recorded byte streams and the simulated driver (no hardware needed),
+# writes the results as JSON, and compares them against a stored baseline:
+#
+#   python benchmarks/suite.py                                  # run, and compare with benchmarks/baseline.json
+#   python benchmarks/suite.py --output results.json            # also write the results to a file
+#   python benchmarks/suite.py --save-baseline                  # store the results as the new baseline
+#   python benchmarks/suite.py --only binary_parse ascii_parse  # run some of the benchmarks
+#
+# Each metric is the median of --repeat runs (default 5), the single runs are kept in the JSON as well.
+# The exit code is 1 if any result is worse than the baseline by more than the tolerance (default 25%), times
+# the metric's factor in TOLERANCE_FACTORS. Tail latencies are reported, but not compared.
+#
+# Baselines are machine specific, so compare results from the same machine, e.g. before and after a change.
+# The stored baseline is from the commit in its "meta", refresh it with --save-baseline in commits which
+# intentionally change the performance.
+#
+
+import argparse, contextlib, io, json, os, platform, random, statistics, struct, subprocess, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from simplefoc import Frame, FrameType, TelemetryFrame, HeaderFrame
+from simplefoc.packets import BinaryComms, ASCIIComms, ProtocolType
+from simplefoc.commander import Commander
+from simplefoc.registers import SimpleFOCRegisters as regs
+from simplefoc import simulator
+from binary_scanner import RecordedConnection, make_stream
+from telemetry_decode import HEADER_REGISTERS, make_payloads
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# allowed regression of noisy metrics, as a multiple of the tolerance, by metric name or suffix. The medians
+# of these varied by 15-30% between runs of unchanged code. None means reported, but not compared: tail
+# latencies depend on the OS scheduler.
+TOLERANCE_FACTORS = {
+    'binary_parse': 1.5,
+    'ascii_parse': 1.5,
+    'ascii_telemetry_decode': 1.5,
+    'encode_binary': 1.5,
+    'commander_query': 1.5,
+    '_p90': 2.0,
+    '_p99': None,
+}
+
+
+def tolerance_factor(metric):
+    for name, factor in TOLERANCE_FACTORS.items():
+        if metric == name or (name.startswith('_') and metric.endswith(name)):
+            return factor
+    return 1.0
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit, higher_is_better=True):
+    """ Register a benchmark function, which takes the size scale and returns a dict of metric name to value """
+    def register(func):
+        BENCHMARKS[name] = (func, unit, higher_is_better)
+        return func
+    return register
+
+
+def rate(count, func):
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+def ascii_stream(num_frames, seed=1):
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(num_frames):
+        if i % 50 == 0:
+            lines.append("r8={:.6f}".format(rnd.uniform(-10, 10)))
+        else:
+            lines.append("T0={:.6f},{:.6f},{},{:.6f}".format(rnd.uniform(-100, 100), rnd.uniform(-100, 100), i, rnd.uniform(-1, 1)))
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def parse_all(comms):
+    count = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        while comms.connection.in_waiting > 0:
+            count += len(comms.get_frames())
+    return count
+
+
+@benchmark('binary_parse', 'frames/s')
+def binary_parse(scale):
+    data = make_stream(200000 * scale // 10)
+    comms = BinaryComms(RecordedConnection(data, 4096))
+    count = [0]
+    result = rate(1, lambda: count.__setitem__(0, parse_all(comms)))
+    return { 'binary_parse': result * count[0] }
+
+
+@benchmark('ascii_parse', 'frames/s')
+def ascii_parse(scale):
+    data = ascii_stream(100000 * scale // 10)
+    comms = ASCIIComms(RecordedConnection(data, 4096))
+    comms._in_sync = True
+    count = [0]
+    result = rate(1, lambda: count.__setitem__(0, parse_all(comms)))
+    return { 'ascii_parse': result * count[0] }
+
+
+@benchmark('telemetry_decode', 'samples/s')
+def telemetry_decode(scale):
+    num = 100000 * scale // 10
+    header = HeaderFrame(0, HEADER_REGISTERS, [0] * len(HEADER_REGISTERS))
+    payloads = make_payloads(header, num)
+    comms = BinaryComms(None)
+    def decode():
+        for p in payloads:
+            comms.parse_telemetry(ASCIITelemetryFrame(0, None, payload=p), header)
+    results = { 'telemetry_decode': rate(num, decode) }
+    lines = [','.join("{:.6f}".format(v) if isinstance(v, float) else str(v) for v in comms.parse_telemetry(TelemetryFrame(0, p, payload=p), header).values) for p in payloads]
+    ascii_comms = ASCIIComms(None)
+    def decode_ascii():
+        for line in lines:
+            ascii_comms.parse_telemetry(TelemetryFrame(0, line, payload=line), header)
+    results['ascii_telemetry_decode'] = rate(num, decode_ascii)
+    if np is not None:
+        from simplefoc.packets import decode_telemetry_batch
+        def decode_batches():
+            for i in range(0, num, 1000):
+                decode_telemetry_batch(payloads[i:i + 1000], header)
+        results['telemetry_decode_batch'] = rate(num, decode_batches)
+    return results
+
+
+@benchmark('encode', 'frames/s')
+def encode(scale):
+    num = 100000 * scale // 10
+    frames = [Frame(frame_type=FrameType.REGISTER, register=regs.REG_TARGET, values=[float(i)]) for i in range(num)]
+    results = {}
+    for name, cls in (('encode_binary', BinaryComms), ('encode_ascii', ASCIIComms)):
+        comms = cls(RecordedConnection(b''))
+        def send():
+            for f in frames:
+                comms.send_frame(f)
+        results[name] = rate(num, send)
+    return results
+
+
+@benchmark('get_register_latency', 'us', higher_is_better=False)
+def get_register_latency(scale):
+    results = {}
+    for protocol in ('binary', 'ascii'):
+        motors = simulator.serial(ProtocolType[protocol])
+        motors.connect()
+        latencies = []
+        try:
+            for i in range(200 * scale // 10 + 20):
+                start = time.perf_counter()
+                motors.get_register(0, regs.REG_VELOCITY, timeout=1.0)
+                latencies.append((time.perf_counter() - start) * 1e6)
+        finally:
+            motors.disconnect()
+        latencies = sorted(latencies[20:])     # skip the warm-up
+        for p in (50, 90, 99):
+            results['get_register_{}_p{}'.format(protocol, p)] = latencies[min(len(latencies) - 1, len(latencies) * p // 100)]
+    return results
+
+
+@benchmark('commander_monitoring', 'lines/s')
+def commander_monitoring(scale):
+    num = 100000 * scale // 10
+    rnd = random.Random(1)
+    data = ''.join('\t'.join("{:.4f}".format(rnd.uniform(-10, 10)) for j in range(3)) + '\r\n' for i in range(num)).encode('ascii')
+    chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+    commander = Commander(None)
+    commander.use_monitoring_registers([regs.REG_TARGET, regs.REG_VELOCITY, regs.REG_ANGLE])
+    count = [0]
+    commander.telemetry().subscribe(lambda t: count.__setitem__(0, count[0] + 1))
+    def feed():
+        for chunk in chunks:
+            commander._process_bytes(chunk)
+    result = rate(num, feed)
+    if count[0] != num:
+        raise RuntimeError("commander parsed {} of {} monitoring lines".format(count[0], num))
+    return { 'commander_monitoring': result }
+
+
+@benchmark('commander_query', 'queries/s')
+def commander_query(scale):
+    commander = simulator.commander()
+    driver = commander.connection.driver
+    commander.connect()
+    try:
+        motor = commander.full_control('M')
+        motor.set_velocity_pid(p=0.25, i=12.5, d=0.001, limit=6.5, ramp=500.0, tf=0.01)
+        motor.set_angle_pid(p=15.0, i=0.5, d=0.125, limit=18.0, ramp=250.0, tf=0.002)
+        motor.set_current_q_pid(p=2.5, i=150.0, d=0.0, limit=5.5, ramp=100.0, tf=0.003)
+        motor.set_current_p_pid(p=2.25, i=125.0, d=0.0, limit=4.5, ramp=50.0, tf=0.004)
+        motor.set_sensor_offsets(offset=0.5, zero_electrical_angle=1.25)
+        getters = [(motor.get_target, ['']), (motor.get_limits, ['LU', 'LC', 'LV']),
+                   (motor.get_motor_parameters, ['R', 'K', 'I']), (motor.get_sensor_offsets, ['SM', 'SE'])]
+        getters += [(getter, [pid + c for c in 'PIDLRF']) for getter, pid in
+                    ((motor.get_velocity_pid, 'V'), (motor.get_angle_pid, 'A'), (motor.get_current_q_pid, 'Q'), (motor.get_current_d_pid, 'D'))]
+        # check each getter end to end against the simulated motor
+        simulated = driver.motors[0]
+        for getter, commands in getters:
+            expected = [simulated_setting(simulated, c) for c in commands]
+            values = getter().result()
+            values = values if isinstance(values, list) else [values]
+            if any(abs(v - e) > 0.001 for v, e in zip(values, expected)) or len(values) != len(expected):
+                raise RuntimeError("{} returned {}, the simulated driver has {}".format(getter.__name__, values, expected))
+        rounds = 200 * scale // 10
+        count = rounds * sum(len(commands) for getter, commands in getters)
+        def query():
+            futures = [getter() for i in range(rounds) for getter, commands in getters]
+            for f in futures:
+                f.result()
+        return { 'commander_query': rate(count, query) }
+    finally:
+        commander.disconnect()
+
+
+def simulated_setting(motor, command):
+    if command == '':
+        return motor.value(regs.REG_TARGET)
+    reg = simulator.COMMANDER_REGISTERS.get(command)
+    return motor.value(reg) if reg is not None else motor.settings[command]
+
+
+def run(names, scale, repeat):
+    results = {}
+    for name in names:
+        func, unit, higher_is_better = BENCHMARKS[name]
+        runs = [func(scale) for i in range(repeat)]
+        for metric in runs[0]:
+            values = [r[metric] for r in runs]
+            results[metric] = {
+                'value': statistics.median(values),
+                'runs': values,
+                'unit': unit,
+                'higher_is_better': higher_is_better,
+                'tolerance_factor': tolerance_factor(metric)
+            }
+            print(f"{metric:>32}: {results[metric]['value']:14.1f} {unit}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Print the comparison with the baseline, and return the list of regressed metrics """
+    regressions = []
+    print(f"\n{'metric':>32} {'baseline':>14} {'current':>14} {'change':>8}")
+    for metric, result in results.items():
+        base = baseline['results'].get(metric)
+        if base is None:
+            continue
+        change = result['value'] / base['value'] - 1.0 if base['value'] != 0 else 0.0
+        worse = -change if result['higher_is_better'] else change
+        factor = result.get('tolerance_factor', 1.0)
+        regressed = factor is not None and worse > tolerance * factor
+        flag = '  REGRESSION' if regressed else ('  (not compared)' if factor is None else '')
+        print(f"{metric:>32} {base['value']:14.1f} {result['value']:14.1f} {change*100:+7.1f}%{flag}")
+        if regressed:
+            regressions.append(metric)
+    return regressions
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine()
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PySimpleFOC protocol benchmark suite')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS.keys()), help='Benchmarks to run, default all')
+    parser.add_argument('--scale', type=int, default=10, help='Workload size, 10 is the default size')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per benchmark, the median is reported')
+    parser.add_argument('--output', type=str, help='Write the results to this JSON file')
+    parser.add_argument('--baseline', type=str, default=BASELINE, help='Baseline JSON file to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative regression, default 0.25')
+    args = parser.parse_args()
+
+    results = { 'meta': metadata(), 'results': run(args.only or list(BENCHMARKS.keys()), args.scale, args.repeat) }
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nbaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results['results'], baseline, args.tolerance)
+        if len(regressions) > 0:
+            print(f"\n{len(regressions)} regression(s) against the baseline from {baseline['meta'].get('commit', '?')}")
+            sys.exit(1)
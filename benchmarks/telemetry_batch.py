@@ -0,0 +1,69 @@
+#
+# Benchmark: decoding binary telemetry in batches with numpy (decode_telemetry_batch) vs. frame by frame
+#
+# Usage:
+#   python benchmarks/telemetry_batch.py [--samples N] [--batch N]
+#
+
+import argparse, os, sys, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import Frame, FrameType
+from simplefoc.packets import BinaryComms, decode_telemetry_batch
+from simplefoc.telemetry import column_name
+from telemetry_decode import HEADER_REGISTERS, make_payloads
+
+
+def decode_per_frame(comms, payloads, header):
+    result = []
+    for p in payloads:
+        frame = Frame(frame_type=FrameType.TELEMETRY, telemetryid=0, values=p, payload=p)
+        result.append(comms.parse_telemetry(frame, header).values)
+    return result
+
+
+def decode_batched(payloads, header, batch):
+    return [decode_telemetry_batch(payloads[i:i+batch], header) for i in range(0, len(payloads), batch)]
+
+
+def check(per_frame, arrays, header):
+    flat = []
+    for array in arrays:
+        for row in array.tolist():
+            values = []
+            for field in row:
+                if isinstance(field, (tuple, list, np.ndarray)):
+                    values.extend(float(v) if isinstance(v, np.floating) else v for v in field)
+                else:
+                    values.append(field)
+            flat.append(values)
+    if len(flat) != len(per_frame):
+        return False
+    # the per-frame decoder returns python floats from float32 values, so compare exactly
+    return all(a == b for a, b in zip(flat, per_frame))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch telemetry decode benchmark')
+    parser.add_argument('--samples', type=int, default=200000, help='Number of telemetry frames to decode')
+    parser.add_argument('--batch', type=int, default=1000, help='Number of frames per batch')
+    args = parser.parse_args()
+
+    header = Frame(frame_type=FrameType.HEADER, telemetryid=0, registers=HEADER_REGISTERS, motors=[0]*len(HEADER_REGISTERS))
+    comms = BinaryComms(None)
+    payloads = make_payloads(header, args.samples)
+
+    start = time.perf_counter()
+    per_frame = decode_per_frame(comms, payloads, header)
+    t_frame = time.perf_counter() - start
+    start = time.perf_counter()
+    arrays = decode_batched(payloads, header, args.batch)
+    t_batch = time.perf_counter() - start
+
+    print("header: {}".format(", ".join(column_name(r) for r in HEADER_REGISTERS)))
+    print("per frame: {:10.0f} frames/s".format(args.samples / t_frame))
+    print("batched:   {:10.0f} frames/s  (batches of {})".format(args.samples / t_batch, args.batch))
+    print("speedup:   {:.1f}x".format(t_frame / t_batch))
+    print("results match: {}".format(check(per_frame, arrays, header)))
@@ -0,0 +1,69 @@
+#
+# Benchmark: BinaryComms.parse_telemetry, compiled per-header struct decoder vs. decoding field by field
+#
+# Usage:
+#   python benchmarks/telemetry_decode.py [--samples N]
+#
+
+import argparse, os, random, struct, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from simplefoc import Frame, FrameType
+from simplefoc.packets import BinaryComms
+from simplefoc.registers import SimpleFOCRegisters as regs
+
+
+HEADER_REGISTERS = [regs.REG_TARGET, regs.REG_ANGLE, regs.REG_VELOCITY, regs.REG_POSITION,
+                    regs.REG_VOLTAGE_Q, regs.REG_CURRENT_ABC, regs.REG_ENABLE, regs.REG_ITERATIONS_SEC]
+
+
+def make_payloads(header, num_samples, seed=1):
+    rnd = random.Random(seed)
+    fmt = struct.Struct('<' + ''.join(r.read_format() for r in header.registers))
+    payloads = []
+    for i in range(num_samples):
+        values = []
+        for t in ''.join(r.read_format() for r in header.registers):
+            values.append(rnd.uniform(-100, 100) if t == 'f' else rnd.randrange(256))
+        payloads.append(fmt.pack(*values))
+    return payloads
+
+
+def decode_fieldwise(comms, payloads, header):
+    parse = comms._BinaryComms__parse_telemetry_values
+    return [parse(p, header) for p in payloads]
+
+
+def decode_compiled_only(comms, payloads, header):
+    frame = Frame(frame_type=FrameType.TELEMETRY, telemetryid=0, values=None)
+    result = []
+    for p in payloads:
+        frame.values = p
+        result.append(comms.parse_telemetry(frame, header).values)
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Telemetry decode benchmark')
+    parser.add_argument('--samples', type=int, default=200000, help='Number of telemetry frames to decode')
+    args = parser.parse_args()
+
+    header = Frame(frame_type=FrameType.HEADER, telemetryid=0, registers=HEADER_REGISTERS, motors=[0]*len(HEADER_REGISTERS))
+    comms = BinaryComms(None)
+    payloads = make_payloads(header, args.samples)
+
+    old, old_time = timed(decode_fieldwise, comms, payloads, header)
+    new, new_time = timed(decode_compiled_only, comms, payloads, header)
+    if old != new:
+        print("ERROR: compiled decoder output differs from field by field output")
+        sys.exit(1)
+    print(f"{len(HEADER_REGISTERS)} registers, {len(new[0])} values per sample")
+    print(f"field by field: {args.samples/old_time:12.0f} samples/s")
+    print(f"compiled:       {args.samples/new_time:12.0f} samples/s  ({old_time/new_time:.1f}x)")
@@ -0,0 +1,82 @@
+#
+# Benchmark: publishing decoded telemetry to reader processes through a shared memory ring
+#
+# Replays a recorded binary telemetry stream (8 registers, 11 values per sample) as fast as it can be decoded,
+# first with only the Telemetry decoding, then also recording into a TelemetryBuffer, then publishing into a
+# SharedRing while reader processes read from it. Reports the decoded samples per second, and for each reader
+# the samples it read and lost to lapping.
+#
+# Usage:
+#   python benchmarks/telemetry_publish.py [--samples N] [--readers N] [--capacity N]
+#
+
+import argparse, os, subprocess, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from simplefoc.packets import BinaryComms
+from simplefoc.motors import Motors
+from simplefoc.ring import SharedRing, RING_CAPACITY
+from capture_scaling import ReplayConnection, make_stream, wait
+
+
+def read(name, seconds):
+    """ Reader process: read the ring for the given time, and print the samples read and lost """
+    ring = SharedRing(name)
+    reader = ring.reader(latest=True)
+    samples = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        timestamps, values = reader.read()
+        if len(timestamps) == 0:
+            time.sleep(0.001)
+        samples += len(timestamps)
+    print(samples, reader.lost, flush=True)
+    del timestamps, values
+    ring.close()
+
+
+def run(data, mode, capacity, num_readers):
+    connection = ReplayConnection(data, 4096)
+    motors = Motors(BinaryComms(connection, 0.01))
+    telemetry = motors.telemetry()
+    decoded = [0]
+    telemetry.observable().subscribe(lambda frame: decoded.__setitem__(0, decoded[0] + 1))
+    target, readers = None, []
+    if mode == 'buffer':
+        target = telemetry.buffer(capacity)
+    elif mode == 'publish':
+        target = telemetry.publish(capacity=capacity)
+        readers = [subprocess.Popen([sys.executable, __file__, '--read', target.name], stdout=subprocess.PIPE, text=True)
+                   for i in range(num_readers)]
+        time.sleep(1.0)     # let the readers start up
+    start = time.perf_counter()
+    motors.connect()
+    wait(lambda: connection.finished)
+    elapsed = time.perf_counter() - start
+    motors.disconnect()
+    results = [tuple(int(v) for v in p.communicate()[0].split()) for p in readers]
+    if mode == 'publish':
+        target.close()
+    return decoded[0], elapsed, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shared memory telemetry publishing benchmark')
+    parser.add_argument('--samples', type=int, default=200000, help='Telemetry samples in the stream')
+    parser.add_argument('--readers', type=int, default=2, help='Number of reader processes')
+    parser.add_argument('--capacity', type=int, default=RING_CAPACITY, help='Samples kept in the ring')
+    parser.add_argument('--read', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.read is not None:
+        read(args.read, 5.0)
+        sys.exit(0)
+
+    data = make_stream(args.samples, 1)
+    print(f"{args.samples} samples, {args.readers} reader processes, ring capacity {args.capacity}")
+    for mode in ('decode only', 'buffer', 'publish'):
+        samples, elapsed, results = run(data, mode, args.capacity, args.readers)
+        readers = ''.join(f", reader {i}: {read} read, {lost} lost" for i, (read, lost) in enumerate(results))
+        print(f"{mode:>12}: {samples / elapsed:9.0f} samples/s{readers}")
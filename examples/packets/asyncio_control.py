@@ -0,0 +1,45 @@
+import asyncio
+import simplefoc.aio as aio
+from simplefoc.simulator import SimulatedDriver
+from simplefoc.registers import SimpleFOCRegisters
+from simplefoc import MotionControlType, TorqueControlType
+
+MOTOR_ID = 0
+TARGET_VELOCITY = 5.0
+SAMPLES = 10
+
+
+async def main():
+    # a simulated driver, connected via a socket, so this example runs without hardware
+    # with a real driver, use: motors = aio.serial('/dev/ttyUSB0', 115200)
+    with SimulatedDriver() as driver:
+        reader, writer = await asyncio.open_connection(sock=driver.socket())
+        motors = aio.streams(reader, writer)
+        await motors.connect()
+        motor = motors.motor(MOTOR_ID)
+
+        p, i = await motor.get_registers([SimpleFOCRegisters.REG_VEL_PID_P, SimpleFOCRegisters.REG_VEL_PID_I])
+        print("Velocity PID: P={:.3f} I={:.3f}".format(p, i))
+        limit = await motors.set_register_with_response(MOTOR_ID, SimpleFOCRegisters.REG_VOLTAGE_LIMIT, 6.0)
+        print("Voltage limit set to {:.1f}".format(limit))
+
+        telemetry = motors.telemetry()
+        telemetry.set_registers([SimpleFOCRegisters.REG_TARGET, SimpleFOCRegisters.REG_VELOCITY], motors=[MOTOR_ID, MOTOR_ID])
+        telemetry.set_downsample(1000)
+        motor.set_mode(MotionControlType.velocity, TorqueControlType.voltage)
+        motor.enable()
+        motor.set_target(TARGET_VELOCITY)
+
+        count = 0
+        async for sample in telemetry:
+            print("Target: {:.2f} Velocity: {:.2f}".format(*sample.values))
+            count += 1
+            if count == SAMPLES:
+                break
+
+        motor.disable()
+        print("Velocity: {:.2f}".format(await motor.get_register(SimpleFOCRegisters.REG_VELOCITY)))
+        await motors.disconnect()
+
+
+asyncio.run(main())
@@ -12,6 +12,10 @@ setup(
     author='Richard Unger',
     author_email="runger@simplefoc.com",
     install_requires=['serial', 'rx'],
+    extras_require={
+        'asyncio': ['pyserial-asyncio'],
+        'numpy': ['numpy'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
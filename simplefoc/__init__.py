@@ -2,6 +2,10 @@ from enum import Enum
 import time
 
 
+# Default timeout in seconds for the blocking reads of the connection reader threads
+READ_TIMEOUT = 0.1
+
+
 class Direction(Enum):
   CCW = -1
   UNKNOWN = 0
@@ -40,6 +44,13 @@ class FOCMotorStatus(Enum):
   motor_init_failed   = 0x0F
 
 
+class VerboseMode(Enum):
+  nothing            = 0x00
+  on_request         = 0x01
+  user_friendly      = 0x02
+  machine_readable   = 0x03
+
+
 class FrameType(Enum):
     REGISTER = 'R'
     RESPONSE = 'r'
@@ -51,7 +62,7 @@ class FrameType(Enum):
 
 
 class Frame(object):
-    def __init__(self, frame_type, register=None, values=None, alert=None, telemetryid=None, registers=None, motors=None, motor_id=None, header=None, timestamp=None):
+    def __init__(self, frame_type, register=None, values=None, alert=None, telemetryid=None, registers=None, motors=None, motor_id=None, header=None, timestamp=None, payload=None):
         self.frame_type = frame_type
         if register is not None:
           self.register = register
@@ -69,10 +80,89 @@ class Frame(object):
           self.motor_id = motor_id
         if header is not None:
           self.header = header
+        if payload is not None:
+          self.payload = payload
         if timestamp is not None:
           self.timestamp = timestamp
         else:
-          self.timestamp = time.time()
+          self.timestamp = time.monotonic_ns()
 
     def __repr__(self): # TODO prettify this output
         return self.__dict__.__str__()
+
+
+
+# Lightweight frame types, used for the frames received from the drivers. They have fixed attributes
+# (and no per-instance __dict__), so they are cheaper to create and hold than the generic Frame.
+# Timestamps are time.monotonic_ns() values, taken when the bytes containing the frame were read.
+
+
+class _SlotFrame(object):
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join("'{}': {!r}".format(name, getattr(self, name)) for name in self.__names())
+        return "{" + fields + "}"
+
+    def __names(self):
+        names = ['frame_type']
+        for cls in reversed(type(self).__mro__):
+            names += [n for n in getattr(cls, '__slots__', ()) if n != 'frame_type']
+        return names
+
+
+class RegisterFrame(_SlotFrame):
+    """ A register write (FrameType.REGISTER) or register read response (FrameType.RESPONSE) """
+    __slots__ = ('frame_type', 'register', 'values', 'motor_id', 'timestamp')
+
+    def __init__(self, frame_type, register, values, motor_id=None, timestamp=None):
+        self.frame_type = frame_type
+        self.register = register
+        self.values = values
+        self.motor_id = motor_id
+        self.timestamp = timestamp if timestamp is not None else time.monotonic_ns()
+
+
+class TelemetryFrame(_SlotFrame):
+    """ A telemetry sample. For binary telemetry, payload holds the raw bytes of the values. """
+    __slots__ = ('telemetryid', 'values', 'payload', 'header', 'timestamp')
+    frame_type = FrameType.TELEMETRY
+
+    def __init__(self, telemetryid, values, payload=None, header=None, timestamp=None):
+        self.telemetryid = telemetryid
+        self.values = values
+        self.payload = payload
+        self.header = header
+        self.timestamp = timestamp if timestamp is not None else time.monotonic_ns()
+
+
+class HeaderFrame(_SlotFrame):
+    """ A telemetry header, describing the motors and registers of the telemetry values """
+    __slots__ = ('telemetryid', 'registers', 'motors', 'timestamp')
+    frame_type = FrameType.HEADER
+
+    def __init__(self, telemetryid, registers, motors, timestamp=None):
+        self.telemetryid = telemetryid
+        self.registers = registers
+        self.motors = motors
+        self.timestamp = timestamp if timestamp is not None else time.monotonic_ns()
+
+
+class SyncFrame(_SlotFrame):
+    """ A sync frame, values is [remote_in_sync] """
+    __slots__ = ('values', 'timestamp')
+    frame_type = FrameType.SYNC
+
+    def __init__(self, values, timestamp=None):
+        self.values = values
+        self.timestamp = timestamp if timestamp is not None else time.monotonic_ns()
+
+
+class AlertFrame(_SlotFrame):
+    """ An alert message from the driver """
+    __slots__ = ('alert', 'timestamp')
+    frame_type = FrameType.ALERT
+
+    def __init__(self, alert, timestamp=None):
+        self.alert = alert
+        self.timestamp = timestamp if timestamp is not None else time.monotonic_ns()
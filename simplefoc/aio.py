@@ -0,0 +1,286 @@
+#
+# asyncio flavour of the packet based communication with SimpleFOC drivers (see packets.py)
+#
+# The connection is serviced by a task in the event loop instead of a reader thread, so one process can
+# drive many boards from a single loop. Frames are decoded by the same BinaryComms/ASCIIComms parsers
+# used by the threaded API, and the usual Motor, Motors and Telemetry objects work on top of it:
+#
+#   motors = simplefoc.aio.serial('/dev/ttyUSB0', 115200)
+#   await motors.connect()
+#   motor = motors.motor(0)
+#   angle = await motor.get_register(SimpleFOCRegisters.REG_ANGLE)
+#   async for sample in motors.telemetry():
+#       print(sample.values)
+#
+# Serial ports require the optional pyserial-asyncio package. Any asyncio stream pair can be used instead,
+# e.g. a TCP serial bridge or an in-process fake device, via simplefoc.aio.streams(reader, writer).
+#
+
+import asyncio, time
+from rx.subject import Subject
+from rx import operators as ops
+from .packets import ProtocolType, BinaryComms, ASCIIComms
+from .motors import Motors
+from .motor import Motor
+from .telemetry import Telemetry
+from .registers import parse_register, Register
+from simplefoc import Frame, FrameType
+try:
+    import serial_asyncio
+except ModuleNotFoundError:
+    serial_asyncio = None
+
+
+READ_SIZE = 4096
+
+
+
+def serial(port, baud, protocol=ProtocolType.binary):
+    """ Create an asyncio serial connection to a SimpleFOC driver, and return an AsyncMotors instance to interact with it.
+
+        Note that the serial port is not opened until you call await motors.connect().
+        Requires the pyserial-asyncio package.
+
+        @param port: the serial port to connect to
+        @param baud: the baud rate to use
+        @param protocol: the protocol to use (binary or ascii)
+    """
+    if serial_asyncio is None:
+        raise ModuleNotFoundError("pyserial-asyncio is required for asyncio serial connections, please install it")
+    async def open_streams():
+        return await serial_asyncio.open_serial_connection(url=port, baudrate=baud)
+    return AsyncMotors(AsyncComms(open_streams, protocol))
+
+
+def streams(reader, writer, protocol=ProtocolType.binary):
+    """ Create an AsyncMotors instance communicating over an already open pair of asyncio streams.
+
+        @param reader: the asyncio.StreamReader to receive from
+        @param writer: the asyncio.StreamWriter to send to
+        @param protocol: the protocol to use (binary or ascii)
+    """
+    async def open_streams():
+        return reader, writer
+    return AsyncMotors(AsyncComms(open_streams, protocol))
+
+
+async def iterate(observable):
+    """ Asynchronously iterate over the items of an observable, e.g. async for frame in iterate(motors.observable())
+
+        Items are queued until they are consumed. The iteration ends when the observable completes.
+    """
+    queue = asyncio.Queue()
+    completed = object()
+    disposable = observable.subscribe(
+        on_next=queue.put_nowait,
+        on_error=lambda e: queue.put_nowait(_Error(e)),
+        on_completed=lambda: queue.put_nowait(completed)
+    )
+    try:
+        while True:
+            item = await queue.get()
+            if item is completed:
+                return
+            if isinstance(item, _Error):
+                raise item.error
+            yield item
+    finally:
+        disposable.dispose()
+
+
+class _Error:
+    def __init__(self, error):
+        self.error = error
+
+
+class _StreamConnection:
+    """ Adapts an asyncio.StreamWriter to the write() API used by the frame encoders """
+    def __init__(self):
+        self.writer = None
+
+    def write(self, data):
+        self.writer.write(bytes(data))
+        return len(data)
+
+
+
+class AsyncComms(object):
+    """ Packet based communication in an asyncio event loop.
+
+        Incoming bytes are read by a task and decoded by a BinaryComms or ASCIIComms instance, which is also used
+        to encode outgoing frames. Sending frames doesn't block: they are buffered by the stream writer, use
+        await drain() to wait until they have been written.
+
+        @param open_streams: a coroutine function returning the (reader, writer) stream pair to use
+        @param protocol: the protocol to use (binary or ascii)
+    """
+    def __init__(self, open_streams, protocol=ProtocolType.binary):
+        self._open_streams = open_streams
+        self._connection = _StreamConnection()
+        if protocol == ProtocolType.binary:
+            self.codec = BinaryComms(self._connection)
+        elif protocol == ProtocolType.ascii:
+            self.codec = ASCIIComms(self._connection)
+        else:
+            raise ValueError("Unknown protocol type")
+        self.metrics = self.codec.metrics
+        self._subject = Subject()
+        self._observable = self._subject.pipe(
+            ops.share()
+        )
+        self._reader = None
+        self.is_running = False
+
+    async def connect(self):
+        self._reader, self._connection.writer = await self._open_streams()
+        self.is_running = True
+        self._read_task = asyncio.get_running_loop().create_task(self.__run())
+        self.send_frame(Frame(frame_type=FrameType.SYNC))
+
+    async def disconnect(self):
+        if self.is_running:
+            self.is_running = False
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+        if self._connection.writer is not None:
+            self._connection.writer.close()
+            await self._connection.writer.wait_closed()
+        self._subject.on_completed()
+
+    def send_frame(self, frame):
+        self.codec.send_frame(frame)
+
+    def send_frames(self, frames):
+        self.codec.send_frames(frames)
+
+    async def drain(self):
+        await self._connection.writer.drain()
+
+    def parse_telemetry(self, packet, header):
+        return self.codec.parse_telemetry(packet, header)
+
+    def parse_telemetry_batch(self, packets, header):
+        return self.codec.parse_telemetry_batch(packets, header)
+
+    def observable(self):
+        return self._observable
+
+    def echo(self):
+        return self.codec.echo()
+
+    def frames(self):
+        """ Asynchronously iterate over all received frames """
+        return iterate(self._observable)
+
+    async def __run(self):
+        while self.is_running:
+            data = await self._reader.read(READ_SIZE)
+            if len(data) == 0:
+                break   # end of stream
+            start = time.perf_counter_ns()
+            for f in self.codec._receive(data):
+                self._subject.on_next(f)
+            self.metrics.process_time.record(time.perf_counter_ns() - start)
+        self.is_running = False
+
+
+
+class AsyncMotors(Motors):
+    """ SimpleFOC Motors class for use with asyncio
+
+        Works like Motors, but connect(), disconnect() and reading registers are coroutines, e.g.
+            value = await motors.get_register(0, SimpleFOCRegisters.REG_TARGET)
+            value = await motors.motor(0).get_register(SimpleFOCRegisters.REG_TARGET)
+            values = await motors.get_registers(0, [SimpleFOCRegisters.REG_TARGET, SimpleFOCRegisters.REG_VELOCITY])
+
+        Reads are pending requests in the same table as for Motors, matched to the responses by motor id and
+        register, so several reads can be awaited concurrently. request_register() returns an asyncio future.
+
+        Typically, you will get an AsyncMotors instance by calling simplefoc.aio.serial(port, baud)
+
+        @param connection: the AsyncComms object
+    """
+    async def connect(self):
+        await self.connection.connect()
+
+    async def disconnect(self):
+        await self.connection.disconnect()
+        self._requests.cancel_all()
+
+    def motor(self, motor_id:int=0) -> 'AsyncMotor':
+        return AsyncMotor(self, motor_id)
+
+    async def get_register(self, motor_id:int, reg:int|str|Register, timeout=1.0):
+        return await self.request_register(motor_id, reg, timeout)
+
+    def request_register(self, motor_id:int, reg:int|str|Register, timeout=1.0, use_cache:bool=True) -> asyncio.Future:
+        """ Send a read request for the register, and return an asyncio future for its value, without waiting for
+            the response. Must be called from the event loop. See Motors.request_register().
+        """
+        return asyncio.wrap_future(super().request_register(motor_id, reg, timeout, use_cache))
+
+    async def get_registers(self, motor_id:int, regs, timeout=1.0, use_cache:bool=True):
+        """ Read several registers, with all the requests in flight at the same time. Returns the list of values. """
+        return list(await asyncio.gather(*[self.request_register(motor_id, reg, timeout, use_cache) for reg in regs]))
+
+    async def set_register_with_response(self, motor_id:int, reg:int|str|Register, values, timeout=1.0):
+        if not isinstance(reg, Register):
+            reg = parse_register(reg)
+        future = self._requests.expect((motor_id, reg.id), timeout)
+        cache = self.register_cache(motor_id)
+        if cache is not None:
+            cache.invalidate(reg)   # always send, the response is expected
+        self.set_register(motor_id, reg, values)
+        return await asyncio.wrap_future(future)
+
+    async def get_response(self, motor_id:int, reg:int|str|Register, timeout=1.0):
+        if not isinstance(reg, Register):
+            reg = parse_register(reg)
+        return await asyncio.wrap_future(self._requests.expect((motor_id, reg.id), timeout))
+
+    async def drain(self):
+        await self.connection.drain()
+
+    def telemetry(self) -> 'AsyncTelemetry':
+        return AsyncTelemetry(self)
+
+
+
+class AsyncMotor(Motor):
+    """ Motor for use with asyncio, reading registers, snapshot() and restore() are coroutines, e.g.
+            snapshot = await motors.motor(0).snapshot()
+    """
+    async def snapshot(self, timeout:float=1.0, strict:bool=True):
+        regs = self._snapshot_registers()
+        results = await asyncio.gather(*[self.request_register(r, timeout, use_cache=False) for r in regs], return_exceptions=True)
+        snapshot = {}
+        missing = []
+        for r, result in zip(regs, results):
+            if isinstance(result, TimeoutError):
+                missing.append(r.name)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                snapshot[r.name] = result
+        return self._check_snapshot(snapshot, missing, strict)
+
+    async def restore(self, snapshot, verify:bool=False, timeout:float=1.0):
+        writes = self._restore_writes(snapshot)
+        self._write_snapshot(writes)
+        if not verify:
+            return None
+        actual = await self.get_registers([reg for reg, value in writes], timeout, use_cache=False)
+        return self._mismatches(writes, actual)
+
+
+
+class AsyncTelemetry(Telemetry):
+    """ Telemetry for use with asyncio, which can be asynchronously iterated to receive the telemetry frames:
+            async for frame in motors.telemetry():
+                print(frame.values)
+    """
+    def __aiter__(self):
+        return iterate(self.observable())
@@ -0,0 +1,220 @@
+#
+# Many packet based connections serviced by one I/O thread
+#
+# Every connection made with packets.serial() has its own reader thread. With dozens of drivers on one host
+# that is dozens of threads, each waking up on every read timeout. A MotorBus instead waits for all of its
+# connections at once with a selector, and only wakes up when one of them has received bytes, so the CPU
+# used grows with the traffic, not with the number of drivers:
+#
+#   bus = simplefoc.bus.MotorBus()
+#   left = bus.serial('/dev/ttyUSB0', 115200, name='left')
+#   right = bus.serial('/dev/ttyUSB1', 115200, name='right')
+#   bus.connect()
+#   left.motor(0).set_target(1.0)
+#   bus.observable().subscribe(lambda f: print(f.port, f.frame))
+#
+# The connections must be file descriptors the selector can wait for, like serial ports and pseudo-terminals
+# on Linux and macOS. On Windows serial ports can't be selected, use a reader thread per connection there.
+#
+
+import os, selectors, threading, time
+from collections import namedtuple
+from concurrent.futures import Future
+from rx.subject import Subject
+from rx import operators as ops
+from .packets import ProtocolType, BinaryComms, ASCIIComms
+from .dispatch import DISPATCH_QUEUE_SIZE
+from .motors import Motors
+import serial as ser
+
+
+READ_SIZE = 4096
+
+BusFrame = namedtuple('BusFrame', ['port', 'frame'])
+
+
+
+class MotorBus(object):
+    """ Services many packet based connections (BinaryComms or ASCIIComms) from a single I/O thread
+
+        Each connection added to the bus gets the usual Motors object, and its frames are delivered to that
+        object's subscribers as before. The frames of all the connections are also merged into the bus'
+        observable, tagged with the name of their port as BusFrame(port, frame).
+
+        The subscribers are called on the bus thread, so a slow subscriber holds up all the connections.
+        Use a drop_policy on the connections to deliver their frames from dispatcher threads instead.
+
+        Connections can be added, connected and disconnected while the bus is running. Motors.connect() and
+        Motors.disconnect() work for a single port, bus.connect() and bus.disconnect() for all of them.
+        The counter wakeups is the number of times the bus thread has woken up to read.
+    """
+    def __init__(self):
+        self.wakeups = 0
+        self._ports = {}
+        self._subject = Subject()
+        self._observable = self._subject.pipe(
+            ops.share()
+        )
+        self._selector = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._changes = []
+        self._wakeup_read = None
+        self._wakeup_write = None
+
+    def serial(self, port, baud, protocol=ProtocolType.binary, name=None, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE) -> Motors:
+        """ Add a serial connection to a SimpleFOC driver, and return a Motors instance to interact with it.
+            The serial port is opened by bus.connect() or motors.connect().
+
+            @param port: the serial port to connect to
+            @param baud: the baud rate to use
+            @param protocol: the protocol to use (binary or ascii)
+            @param name: the name of the port in the merged stream, by default the port itself
+            @param drop_policy: a DropPolicy to deliver the frames from a separate dispatcher thread, or None
+                                to deliver them on the bus thread
+            @param queue_size: the maximum number of frames waiting in the dispatcher queue
+        """
+        ser_conn = ser.Serial()
+        ser_conn.port = port
+        ser_conn.baudrate = baud
+        if protocol == ProtocolType.binary:
+            comms = BinaryComms(ser_conn, None, drop_policy, queue_size)
+        elif protocol == ProtocolType.ascii:
+            comms = ASCIIComms(ser_conn, None, drop_policy, queue_size)
+        else:
+            raise ValueError("Unknown protocol type")
+        return self.add(comms, name if name is not None else port)
+
+    def add(self, comms, name=None) -> Motors:
+        """ Add a connection which is not yet connected, and return a Motors instance to interact with it
+
+            @param comms: the BinaryComms or ASCIIComms connection
+            @param name: the name of the port in the merged stream, by default the connection's port
+        """
+        if comms.is_running:
+            raise ValueError("Connection is already connected")
+        if name is None:
+            name = getattr(comms.connection, 'port', None)
+        if name is None or name in self._ports:
+            raise ValueError("Each connection on the bus needs a unique name: {}".format(name))
+        comms._bus = self
+        motors = Motors(comms)
+        self._ports[name] = motors
+        return motors
+
+    def motors(self, name) -> Motors:
+        return self._ports[name]
+
+    def names(self):
+        return list(self._ports.keys())
+
+    def observable(self):
+        """ Get the merged stream of frames of all the connections, as BusFrame(port, frame) """
+        return self._observable
+
+    def connect(self):
+        """ Connect all the connections which are not yet connected """
+        for motors in self._ports.values():
+            if not motors.connection.is_running:
+                motors.connect()
+
+    def disconnect(self):
+        """ Disconnect all the connections, and stop the bus thread """
+        for motors in self._ports.values():
+            if motors.connection.is_running:
+                motors.disconnect()
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            if thread is not None:
+                os.write(self._wakeup_write, b'\0')
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._subject.on_completed()
+
+    def _attach(self, comms):
+        """ Start reading the connection, called by Comms.connect() """
+        fd = comms.connection.fileno()
+        port = (comms, self.__name(comms))
+        self.__change(lambda selector: selector.register(fd, selectors.EVENT_READ, port))
+
+    def _detach(self, comms):
+        """ Stop reading the connection before it is closed, called by Comms.disconnect() """
+        def unregister(selector):
+            for key in list(selector.get_map().values()):
+                if key.data is not None and key.data[0] is comms:
+                    selector.unregister(key.fileobj)
+        self.__change(unregister)
+
+    def __change(self, change):
+        """ Apply a change to the selector on the bus thread, and wait for it to be done """
+        with self._lock:
+            if self._thread is None:
+                self.__start()
+            if self._thread is threading.current_thread():
+                change(self._selector)
+                return
+            future = Future()
+            self._changes.append((change, future))
+            os.write(self._wakeup_write, b'\0')
+        future.result()
+
+    def __start(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self.__run, args=(self._selector, self._wakeup_read, self._wakeup_write), daemon=True)
+        self._thread.start()
+
+    def __run(self, selector, wakeup_read, wakeup_write):
+        thread = threading.current_thread()
+        subject = self._subject
+        selector_map = selector.get_map()
+        while True:
+            events = selector.select()
+            self.wakeups += 1
+            for key, mask in events:
+                if key.data is None:
+                    os.read(wakeup_read, READ_SIZE)
+                    with self._lock:
+                        changes, self._changes = self._changes, []
+                        stopping = self._thread is not thread
+                    for change, future in changes:
+                        try:
+                            future.set_result(change(selector))
+                        except Exception as e:
+                            future.set_exception(e)
+                    if stopping:
+                        selector.close()
+                        os.close(wakeup_read)
+                        os.close(wakeup_write)
+                        return
+                    continue
+                if selector_map.get(key.fd) is not key:
+                    continue    # disconnected by an earlier event
+                comms, name = key.data
+                try:
+                    data = os.read(key.fd, READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b''
+                if len(data) == 0:
+                    # the port was unplugged, or the other end of a pseudo-terminal closed
+                    print("WARNING: connection lost: ", getattr(comms.connection, 'port', key.fd)) # TODO logging
+                    selector.unregister(key.fileobj)
+                    comms.is_running = False
+                    continue
+                start = time.perf_counter_ns()
+                frames = comms._receive(data)
+                comms._deliver(frames)
+                if len(frames) > 0 and subject.observers:
+                    for f in frames:
+                        subject.on_next(BusFrame(name, f))
+                comms.metrics.process_time.record(time.perf_counter_ns() - start)
+
+    def __name(self, comms):
+        for name, motors in self._ports.items():
+            if motors.connection is comms:
+                return name
+        return None
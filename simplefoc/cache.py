@@ -0,0 +1,115 @@
+#
+# Shadow copies of register values, to answer reads without a round trip to the driver
+#
+# A RegisterCache keeps the last known value of a motor's registers: the values written to them, the values
+# in register responses, and the values decoded from telemetry. Reads of values younger than max_age are
+# answered from the cache, and writes of values the register already has can be skipped:
+#
+#   cache = motor.enable_cache(max_age=0.5, skip_unchanged=True)
+#   limit = motor.get_register(SimpleFOCRegisters.REG_VOLTAGE_LIMIT)     # only the first read goes to the driver
+#   print(cache.hits, cache.misses, cache.skipped)
+#
+
+import time, struct
+from .registers import SimpleFOCRegisters
+
+
+# registers which are never cached: the motor address and the telemetry configuration belong to the driver,
+# not to a motor
+UNCACHED = { SimpleFOCRegisters.REG_MOTOR_ADDRESS.id, SimpleFOCRegisters.REG_TELEMETRY_REG.id,
+             SimpleFOCRegisters.REG_TELEMETRY_CTRL.id, SimpleFOCRegisters.REG_TELEMETRY_DOWNSAMPLE.id }
+
+
+
+class RegisterCache:
+    """ Shadow copy of the register values of one motor
+
+        Values are kept as they are returned by register reads: a single value, or a list for registers with
+        several values. Written values are stored as the driver stores them, e.g. floats rounded to 32 bits.
+        Each value is timestamped with the time it was written or received (time.monotonic_ns()), and is only
+        used while it is younger than max_age seconds.
+
+        Registers which the driver changes by itself (e.g. REG_TARGET in some control modes) can be out of date
+        by up to max_age, choose it accordingly or invalidate() them. The counters hits, misses (reads sent to
+        the driver) and skipped (unchanged values not written) show how effective the cache is.
+
+        Typically, you will get a RegisterCache by calling motor.enable_cache()
+
+        @param max_age: the maximum age in seconds of the values used, or None to use them until replaced
+        @param skip_unchanged: don't send writes of the value the register has in the cache
+    """
+    def __init__(self, max_age:float=1.0, skip_unchanged:bool=False):
+        self.max_age = max_age
+        self.skip_unchanged = skip_unchanged
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._values = {}
+        self._formats = {}
+
+    def get(self, reg):
+        """ Return (True, value) if the cache has a value for the register younger than max_age, else (False, None).
+            Counts a hit or a miss.
+        """
+        found, value = self.__fresh(reg)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+
+    def put(self, reg, value, timestamp=None):
+        """ Record a value read from the register, a single value or a list of values """
+        if reg.id in UNCACHED:
+            return
+        self._values[reg.id] = (value, timestamp if timestamp is not None else time.monotonic_ns())
+
+    def written(self, reg, values) -> bool:
+        """ Record a list of values about to be written to the register.
+            Returns False if the write can be skipped, because the register already has these values.
+        """
+        fmt = self.__format(reg)
+        if fmt is None or len(values) != len(reg.write_types):
+            self._values.pop(reg.id, None)      # the value read back can't be predicted, forget it
+            return True
+        try:
+            packed = struct.pack(fmt, *values)
+        except struct.error:
+            self._values.pop(reg.id, None)
+            return True
+        if self.skip_unchanged:
+            found, cached = self.__fresh(reg)
+            if found and self.__pack(fmt, cached) == packed:
+                self.skipped += 1
+                return False
+        stored = struct.unpack(fmt, packed)
+        self._values[reg.id] = (stored[0] if len(stored) == 1 else list(stored), time.monotonic_ns())
+        return True
+
+    def invalidate(self, reg=None):
+        """ Forget the value of the register, or of all registers """
+        if reg is None:
+            self._values.clear()
+        else:
+            self._values.pop(reg.id, None)
+
+    def __fresh(self, reg):
+        entry = self._values.get(reg.id)
+        if entry is None or (self.max_age is not None and time.monotonic_ns() - entry[1] > self.max_age * 1e9):
+            return False, None
+        return True, entry[0]
+
+    def __pack(self, fmt, value):
+        # compare values as the driver stores them, e.g. a float from an ASCII response rounded to 32 bits
+        try:
+            return struct.pack(fmt, *(value if isinstance(value, list) else [value]))
+        except struct.error:
+            return None
+
+    def __format(self, reg):
+        # struct format to round values to their stored precision, or None if the register can't be cached
+        fmt = self._formats.get(reg.id, False)
+        if fmt is False:
+            cacheable = reg.id not in UNCACHED and len(reg.write_types) > 0 and reg.write_types == reg.read_types
+            fmt = self._formats[reg.id] = ('<' + reg.write_format()) if cacheable else None
+        return fmt
@@ -0,0 +1,310 @@
+#
+# High rate telemetry capture, with the decoding done by worker processes
+#
+# Decoding the telemetry of several drivers at 2Mbaud keeps one python process busy, and the decoding of all
+# the ports shares the same GIL. A ProcessCapture instead hands the raw bytes received on each port to a pool
+# of worker processes, which run the BinaryComms frame scanner and telemetry decoding, and write the decoded
+# samples into a SharedRing per port (see ring.py). The main process reads the samples from the rings
+# without copying them:
+#
+#   capture = simplefoc.capture.ProcessCapture(workers=4)
+#   bus = MotorBus()
+#   left = capture.serial('/dev/ttyUSB0', 2000000, bus=bus)
+#   right = capture.serial('/dev/ttyUSB1', 2000000, bus=bus)
+#   bus.connect()
+#   reader = capture.ring(left).reader()
+#   timestamps, values = reader.read()
+#   ...
+#   bus.disconnect()
+#   capture.stop()
+#
+# Each port is decoded by one worker, so the samples of a port stay in order. All other frames (register
+# responses, headers, alerts, telemetry of other telemetry ids) are passed back to the main process, and
+# delivered to the port's Motors as usual.
+#
+
+import os, threading
+import multiprocessing
+from multiprocessing import connection as mp_connection
+import serial as ser
+from .packets import BinaryComms
+from .motors import Motors
+from .ring import SharedRing, RING_CAPACITY, RING_WIDTH
+from .registers import SimpleFOCRegisters
+from .telemetry import telemetry_dtype, np
+from simplefoc import FrameType, READ_TIMEOUT
+try:
+    from numpy.lib.recfunctions import structured_to_unstructured
+except ModuleNotFoundError:
+    structured_to_unstructured = None
+
+
+# message types sent to the workers, followed by the port index (2 bytes) and the data
+_OPEN = 0
+_DATA = 1
+_CLOSE = 2
+
+
+
+class ProcessCapture(object):
+    """ Decodes the binary telemetry of many connections in a pool of worker processes
+
+        Ports are assigned to the workers in turn as they are added. The telemetry samples of the captured
+        telemetry id are written to the port's SharedRing, they are not delivered to the Motors' subscribers.
+        Samples which don't match the header are counted in the ring's errors.
+
+        The workers are started when the first port is connected. Registers added with add_register() are
+        passed to the workers when they start, so add them before connecting.
+
+        @param workers: the number of worker processes, by default one per CPU
+        @param capacity: the number of samples kept in each port's ring
+        @param width: the maximum number of values per sample in the rings
+        @param telemetryid: the telemetry id to capture
+    """
+    def __init__(self, workers=None, capacity=RING_CAPACITY, width=RING_WIDTH, telemetryid=0):
+        if np is None:
+            raise ModuleNotFoundError("numpy is required for ProcessCapture, please install it")
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self.capacity = capacity
+        self.width = width
+        self.telemetryid = telemetryid
+        self._ports = []
+        self._names = {}
+        self._chunks = []
+        self._processes = []
+        self._results_thread = None
+        self._lock = threading.Lock()
+
+    def serial(self, port, baud, name=None, bus=None) -> Motors:
+        """ Add a binary serial connection to a SimpleFOC driver, and return a Motors instance to interact with it.
+            The serial port is not opened until you call motors.connect(), or bus.connect().
+
+            @param port: the serial port to connect to
+            @param baud: the baud rate to use
+            @param name: the name of the port, by default the port itself
+            @param bus: a MotorBus to read the port, instead of a reader thread
+        """
+        ser_conn = ser.Serial()
+        ser_conn.port = port
+        ser_conn.baudrate = baud
+        return self.add(ser_conn, name if name is not None else port, bus)
+
+    def add(self, connection, name=None, bus=None) -> Motors:
+        """ Add a connection, and return a Motors instance to interact with it
+
+            @param connection: the serial connection, or an object with the same API, not yet opened
+            @param name: the name of the port, by default the connection's port
+            @param bus: a MotorBus to read the connection, instead of a reader thread
+        """
+        if name is None:
+            name = getattr(connection, 'port', None)
+        if name is None or name in self._names:
+            raise ValueError("Each captured connection needs a unique name: {}".format(name))
+        comms = CaptureComms(connection, self, len(self._ports), READ_TIMEOUT if bus is None else None)
+        self._ports.append(comms)
+        self._names[name] = comms
+        if bus is not None:
+            return bus.add(comms, name)
+        return Motors(comms)
+
+    def ring(self, port) -> SharedRing:
+        """ Return the SharedRing of a port, given by name or by its Motors object. The ring is created when the
+            port is connected, so this is None before. After the port is disconnected, the ring can still be read
+            until the port is connected again or the capture is stopped.
+        """
+        if isinstance(port, Motors):
+            return port.connection.ring
+        return self._names[port].ring
+
+    def names(self):
+        return list(self._names.keys())
+
+    def start(self):
+        """ Start the worker processes, this is done when the first port is connected """
+        with self._lock:
+            if len(self._processes) > 0:
+                return
+            context = multiprocessing.get_context('spawn')
+            registers = [(r.name, r.id, r.read_types, r.write_types) for r in SimpleFOCRegisters.registers()]
+            results = []
+            for i in range(self.workers):
+                chunks_in, chunks_out = context.Pipe(duplex=False)
+                results_in, results_out = context.Pipe(duplex=False)
+                process = context.Process(target=_decode_worker, args=(chunks_in, results_out, registers, self.telemetryid), daemon=True)
+                process.start()
+                chunks_in.close()
+                results_out.close()
+                self._processes.append(process)
+                self._chunks.append((chunks_out, threading.Lock()))
+                results.append(results_in)
+            self._results_thread = threading.Thread(target=self.__receive_results, args=(results,), daemon=True)
+            self._results_thread.start()
+
+    def stop(self):
+        """ Disconnect the ports, stop the workers, and remove the rings """
+        for comms in self._ports:
+            if comms.is_running:
+                comms.disconnect()
+        with self._lock:
+            processes, self._processes = self._processes, []
+            chunks, self._chunks = self._chunks, []
+        for chunks_out, lock in chunks:
+            with lock:
+                chunks_out.close()      # the workers exit at the end of their input
+        for process in processes:
+            process.join()
+        if self._results_thread is not None:
+            self._results_thread.join()
+            self._results_thread = None
+        for comms in self._ports:
+            if comms.ring is not None:
+                comms.ring.close()      # unlinked when the port was disconnected
+        self._ports = []
+        self._names = {}
+
+    def _send(self, index, kind, data=b''):
+        if len(self._chunks) == 0:
+            return      # stopped
+        chunks_out, lock = self._chunks[index % len(self._chunks)]
+        with lock:
+            chunks_out.send_bytes(bytes((kind, index & 0xFF, index >> 8)) + data)
+
+    def __receive_results(self, results):
+        while len(results) > 0:
+            for conn in mp_connection.wait(results):
+                try:
+                    index, frames = conn.recv()
+                except EOFError:
+                    results.remove(conn)
+                    continue
+                comms = self._ports[index]
+                comms.metrics.frames_in += len(frames)
+                comms._deliver(frames)
+
+
+
+class CaptureComms(BinaryComms):
+    """ BinaryComms passing the received bytes to a ProcessCapture worker for decoding
+
+        Typically, you will get a CaptureComms as the connection of the Motors returned by capture.serial()
+    """
+    def __init__(self, connection, capture, index, read_timeout=READ_TIMEOUT):
+        super().__init__(connection, read_timeout)
+        self.capture = capture
+        self.index = index
+        self.ring = None
+
+    def connect(self):
+        self.capture.start()
+        if self.ring is not None:
+            self.ring.close()   # from the previous connection
+        self.ring = SharedRing(create=True, capacity=self.capture.capacity, width=self.capture.width)
+        self.capture._send(self.index, _OPEN, self.ring.name.encode('utf-8'))
+        super().connect()
+
+    def disconnect(self):
+        super().disconnect()
+        self.capture._send(self.index, _CLOSE)
+        if self.ring is not None:
+            # removes the name only, the samples can be read until the ring is closed
+            try:
+                self.ring.unlink()
+            except FileNotFoundError:
+                pass    # disconnected before
+
+    def _receive(self, data):
+        self.metrics.reads += 1
+        self.metrics.bytes_in += len(data)
+        self.capture._send(self.index, _DATA, data)
+        return []
+
+
+
+def _decode_worker(chunks, results, registers, telemetryid):
+    """ Worker process: decode the chunks received for each port, until the input is closed """
+    for name, id, read_types, write_types in registers:
+        if SimpleFOCRegisters._by_id.get(id) is None:
+            SimpleFOCRegisters.add_register(name, id, read_types, write_types)
+    ports = {}
+    while True:
+        try:
+            message = chunks.recv_bytes()
+        except EOFError:
+            break
+        index = message[1] | (message[2] << 8)
+        if message[0] == _DATA:
+            port = ports.get(index)
+            if port is None:
+                continue
+            forward = port.receive(message[3:])
+            if len(forward) > 0:
+                results.send((index, forward))
+        elif message[0] == _OPEN:
+            try:
+                ports[index] = _WorkerPort(SharedRing(message[3:].decode('utf-8'), track=True), telemetryid)
+            except FileNotFoundError:
+                pass    # the port was disconnected again before the ring could be opened
+        elif message[0] == _CLOSE:
+            port = ports.pop(index, None)
+            if port is not None:
+                port.close()
+    for port in ports.values():
+        port.close()
+    results.close()
+
+
+class _WorkerPort:
+    """ Decoding state of one port in a worker process """
+    def __init__(self, ring, telemetryid):
+        self.ring = ring
+        self.telemetryid = telemetryid
+        self.codec = BinaryComms(None)
+        self.header = None
+        self.dtype = None
+        self._payloads = []
+        self._timestamps = []
+
+    def receive(self, data):
+        """ Decode a chunk of bytes, write the telemetry samples to the ring, and return the other frames """
+        forward = []
+        for frame in self.codec._process_bytes(data):
+            if frame.frame_type == FrameType.TELEMETRY and frame.telemetryid == self.telemetryid:
+                if self.dtype is not None:
+                    self._payloads.append(frame.payload)
+                    self._timestamps.append(frame.timestamp)
+                continue
+            if frame.frame_type == FrameType.HEADER and frame.telemetryid == self.telemetryid:
+                self.__flush()
+                self.__set_header(frame)
+            forward.append(frame)
+        self.__flush()
+        return forward
+
+    def close(self):
+        self.ring.close()
+
+    def __set_header(self, header):
+        try:
+            self.ring.set_header(header)
+        except ValueError as e:
+            print("WARNING: can't capture telemetry: ", e) # TODO logging
+            self.header = self.dtype = None
+            return
+        self.header = header
+        self.dtype = telemetry_dtype(header)
+
+    def __flush(self):
+        payloads = self._payloads
+        if len(payloads) == 0:
+            return
+        size = self.dtype.itemsize
+        timestamps = self._timestamps
+        if any(len(p) != size for p in payloads):
+            valid = [i for i, p in enumerate(payloads) if len(p) == size]
+            self.ring.errors += len(payloads) - len(valid)
+            payloads = [payloads[i] for i in valid]
+            timestamps = [timestamps[i] for i in valid]
+        samples = np.frombuffer(b''.join(payloads), dtype=self.dtype)
+        self.ring.append(np.array(timestamps, dtype=np.int64), structured_to_unstructured(samples, dtype=np.float64))
+        self._payloads = []
+        self._timestamps = []
@@ -1,9 +1,18 @@
 
-import time, re, threading, math, serial as ser
+import time, threading, math, serial as ser
+from contextlib import contextmanager
+import rx
 from rx.subject import Subject
 from rx import operators as ops
 from .registers import SimpleFOCRegisters as regs
-from simplefoc import Frame, FrameType
+from .pending import PendingRequests, gather
+from .dispatch import Dispatcher, DropPolicy, DISPATCH_QUEUE_SIZE
+from .metrics import LinkMetrics
+from simplefoc import READ_TIMEOUT, HeaderFrame, TelemetryFrame, VerboseMode
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
 
 MonitoringFlags = {
     regs.REG_TARGET.id : int('1000000',2),
@@ -15,20 +24,35 @@ MonitoringFlags = {
     regs.REG_ANGLE.id  : int('0000001',2)
 }
 
+# monitoring output lines start with a number, all other lines are console output
+MONITORING_START = frozenset('0123456789-')
 
+# maximum bytes per write when sending several commands at once, the size of the serial receive buffer on many MCUs
+MAX_WRITE = 64
 
+# default timeout for queries, in seconds
+QUERY_TIMEOUT = 1.0
 
-def serial(port, baud):
+
+
+
+def serial(port, baud, read_timeout=READ_TIMEOUT, max_write=MAX_WRITE, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
     """ Create a Commander instance using a serial port connection.
         Note that the connection is not opened until the connect() method is called on the Commander instance.
 
         @param port: the serial port name, e.g. '/dev/ttyUSB0'
         @param baud: the baud rate, e.g. 115200
+        @param read_timeout: the reader thread blocks on the port for up to this many seconds waiting for data,
+                             or use None to poll the port every millisecond instead
+        @param max_write: the maximum number of bytes per write when sending several commands at once
+        @param drop_policy: a DropPolicy to deliver the received lines from a separate dispatcher thread, through a
+                            queue of up to queue_size lines, or None to deliver them on the reader thread
+        @param queue_size: the maximum number of lines waiting in the dispatcher queue
     """
     ser_conn = ser.Serial()
     ser_conn.port = port
     ser_conn.baudrate = baud
-    return Commander(ser_conn)
+    return Commander(ser_conn, read_timeout, max_write, drop_policy, queue_size)
 
 
 
@@ -40,22 +64,51 @@ class Commander:
         Monitoring is supported for up to one motor, using the usual SimpleFOC monitoring.
 
         Normally, you will obtain a commander instace by calling commander.serial(port, baud)
+
+        By default the reader thread blocks in a read on the connection, with a timeout of read_timeout seconds.
+        Set read_timeout to None to poll the connection every millisecond instead.
+
+        Commands sent within a batch() are queued, and sent together when the batch ends, in as few writes of
+        at most max_write bytes as possible. The FullControl setters use this, so each call goes out in one burst.
+        The number of writes made so far is counted in writes.
+
+        Values can be read back with query(), which returns a future. Queries switch the driver to the
+        machine readable verbose mode, where each reply starts with the command it answers, so replies are
+        matched to their queries by command, and any number of queries can be in flight at the same time.
+
+        If a drop_policy is given, received lines and monitoring samples are delivered to the subscribers by a
+        separate dispatcher thread, through a queue of up to queue_size items, so slow subscribers don't hold
+        up the reading of the connection. Monitoring samples are dropped according to the policy when the
+        queue is full, console lines are never dropped. The counters are in self.dispatcher.
+
+        Traffic, errors and the reader's processing time are counted in self.metrics, see LinkMetrics. Received
+        lines are counted by type as 'console' or 'monitoring'.
     """
-    def __init__(self, connection):
+    def __init__(self, connection, read_timeout=READ_TIMEOUT, max_write=MAX_WRITE, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
         self.connection = connection
+        self.read_timeout = read_timeout
+        self.max_write = max_write
+        self.metrics = LinkMetrics()
+        self._pending = []
+        self._batch_depth = 0
+        self._tx_lock = threading.RLock()
+        self.verbose = None     # the driver's VerboseMode, if known
+        self._restore_verbose = None    # the VerboseMode to switch back to after the queued queries
+        self._queries = PendingRequests()
+        self._query_length = 0  # length of the longest command queried
+        self._buffer = bytearray()
         self._subject = Subject()
         self._observable = self._subject.pipe(
-            ops.filter(lambda x: not self.__is_monitoring_data(x)),
             ops.share()
         )
         self._monitoring_header = None
-        self._telemetry = self._subject.pipe(
-            ops.filter(lambda x: self._monitoring_header is not None),
-            ops.filter(lambda x: self.__is_monitoring_data(x)),
-            ops.map(lambda x: self.__parse_monitoring_data(x)),
-            ops.filter(lambda x: x is not None),
+        self._telemetry_subject = Subject()
+        self._telemetry = self._telemetry_subject.pipe(
             ops.share()
         )
+        self._monitoring_lines = Subject()
+        self._batching = 0      # the number of subscriptions to telemetry_batches()
+        self._batching_lock = threading.Lock()
         self._echosubject = Subject()
         self._echo = self._echosubject.pipe(
             ops.share()
@@ -63,13 +116,78 @@ class Commander:
         self._in_sync = False
         self.monitor_downsample = 0
         self.is_running = False
+        self.dispatcher = None
+        self._events = []
+        if drop_policy is not None:
+            self.dispatcher = Dispatcher(self.__deliver, queue_size, drop_policy, keep=self.__is_console_event)
+        self.metrics.dispatcher = self.dispatcher
+
+    @property
+    def writes(self):
+        """ The number of writes made to the connection """
+        return self.metrics.writes
+
+    @property
+    def monitoring_errors(self):
+        """ The number of monitoring lines not matching the monitoring registers """
+        return self.metrics.telemetry_errors
 
     def full_control(self, motor_letter):
         return FullControl(self, motor_letter)
 
     def send_command(self, command):
-        self.connection.writelines([command.encode('ascii'), '\n'.encode('ascii')])
-        self._echosubject.on_next(command)
+        with self._tx_lock:
+            if command[:1] == '@' and command[1:].isdigit():
+                try:
+                    self.verbose = VerboseMode(int(command[1:]))
+                except ValueError:
+                    self.verbose = None     # not a mode we know, the driver's mode is unknown
+                self._restore_verbose = None
+            self._pending.append(command)
+            if self._batch_depth == 0:
+                self.__flush()
+
+    @contextmanager
+    def batch(self):
+        """ Queue the commands sent within the with block, and send them in as few writes as possible when it ends:
+                with commander.batch():
+                    commander.send_command('MVP0.2')
+                    commander.send_command('MVI20')
+            Batches can be nested, the commands are sent when the outermost one ends.
+        """
+        with self._tx_lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._tx_lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.__flush()
+
+    def set_verbose(self, mode:VerboseMode):
+        self.send_command('@' + str(mode.value))
+
+    def query(self, command, timeout=QUERY_TIMEOUT):
+        """ Send a command without a value, to which the driver replies with the current value, and return a
+            concurrent.futures.Future for the value as a float, e.g.
+                p = commander.query('MVP').result()
+            The future fails with a TimeoutError if there is no reply within timeout seconds (None to wait forever).
+            Queries sent within a batch() go out together, and are answered in one burst.
+            The replies are only matched in machine readable mode, so the driver is switched to it before the
+            query, and switched back to the previous mode after it. If the previous mode isn't known, because it
+            was never set with set_verbose(), the driver is left in machine readable mode.
+        """
+        future = self._queries.expect(command, timeout)
+        with self._tx_lock:
+            self._query_length = max(self._query_length, len(command))
+            if self.verbose != VerboseMode.machine_readable:
+                previous = self.verbose
+                self.set_verbose(VerboseMode.machine_readable)
+                if previous is not None:
+                    self._restore_verbose = previous
+            self.send_command(command)
+        return future
 
     def scalar(self, letter, value):
         self.send_command(letter + str(value))
@@ -82,11 +200,12 @@ class Commander:
         if torque_limit!=None: cmdstr += ' ' + str(torque_limit)
 
     def pid(self, letter, p=None, i=None, d=None, ramp=None, limit=None):
-        if p!=None: self.send_command(letter + 'P' + str(p))
-        if i!=None: self.send_command(letter + 'I' + str(i))
-        if d!=None: self.send_command(letter + 'D' + str(d))
-        if ramp!=None: self.send_command(letter + 'R' + str(ramp))
-        if limit!=None: self.send_command(letter + 'L' + str(limit))
+        with self.batch():
+            if p!=None: self.send_command(letter + 'P' + str(p))
+            if i!=None: self.send_command(letter + 'I' + str(i))
+            if d!=None: self.send_command(letter + 'D' + str(d))
+            if ramp!=None: self.send_command(letter + 'R' + str(ramp))
+            if limit!=None: self.send_command(letter + 'L' + str(limit))
 
     def filter(self, letter, value):
         self.send_command(letter + 'F' + str(value))
@@ -101,15 +220,24 @@ class Commander:
         return self._observable
 
     def connect(self):
+        if self.read_timeout is not None:
+            self.connection.timeout = self.read_timeout
         self.connection.open()
+        if self.dispatcher is not None:
+            self.dispatcher.start()
         self.is_running = True
         self._read_thread = threading.Thread(target=self.__run)
         self._read_thread.start()
 
     def disconnect(self):
         self.is_running = False
+        if hasattr(self.connection, 'cancel_read'):
+            self.connection.cancel_read()   # wake up the reader thread if it is blocked in a read
         self._read_thread.join()
         self.connection.close()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        self._queries.cancel_all()
     
     def echo(self):
         return self._echo
@@ -121,41 +249,191 @@ class Commander:
 
     def telemetry(self):
         return self._telemetry
+
+    def telemetry_batches(self, count=1000, timespan=0.1):
+        """ Get an observable of batches of monitoring samples, converted in one go into numpy arrays.
+
+            Monitoring lines are collected until count lines have arrived or timespan seconds have passed,
+            and converted to a 2-dimensional float64 array with one row per sample, and one column per
+            monitoring register (in the order of the monitoring header). Requires numpy.
+
+            @param count: the maximum number of samples per batch
+            @param timespan: the maximum time to collect samples for, in seconds, or None to only batch by count
+
+            Monitoring lines are only collected while the observable has subscribers.
+        """
+        if np is None:
+            raise ModuleNotFoundError("numpy is required for batched monitoring, please install it")
+        def create(scheduler=None):
+            self.__batching(1)
+            return self._monitoring_lines.pipe(
+                ops.buffer_with_count(count) if timespan is None else ops.buffer_with_time_or_count(timespan, count),
+                ops.filter(lambda lines: len(lines) > 0),
+                ops.map(self.__parse_monitoring_batch),
+                ops.filter(lambda batch: batch is not None),
+                ops.finally_action(lambda: self.__batching(-1))
+            )
+        return rx.defer(create).pipe(ops.share())
+
+    def __batching(self, change):
+        with self._batching_lock:
+            self._batching += change
     
     def use_monitoring_registers(self, registers):
         regval = 0
         for reg in registers:
             if reg.id in MonitoringFlags:
                 regval |= MonitoringFlags[reg.id]
-        header = Frame(frame_type=FrameType.HEADER, registers=[], telemetryid=0)
+        header = HeaderFrame(0, [], [])
         for reg in [regs.REG_TARGET, regs.REG_VOLTAGE_Q, regs.REG_VOLTAGE_D, regs.REG_CURRENT_Q, regs.REG_CURRENT_D, regs.REG_VELOCITY, regs.REG_ANGLE]:
             if regval & MonitoringFlags[reg.id] != 0:
                 header.registers.append(reg)
+                header.motors.append(0)
         self._monitoring_header = header if len(header.registers) > 0 else None
-    
-    def __is_monitoring_data(self, line:str):
-        return re.match(r'[0-9-]', line)
 
-    def __parse_monitoring_data(self, line:str):
-        t = Frame(frame_type=FrameType.TELEMETRY, telemetryid=0, header=self._monitoring_header, values=[float(f) for f in line.split('\t')], timestamp=time.time())
-        if len(t.values) != len(t.header.registers):
+    def __flush(self):
+        # called with the tx lock held: pack the queued command lines into writes of at most max_write bytes,
+        # a single command longer than max_write still goes out in one write
+        pending = self._pending
+        if len(pending) == 0:
+            return
+        if self._restore_verbose is not None:
+            # the driver handles the lines in order, so the queries above are answered before the switch back
+            pending.append('@' + str(self._restore_verbose.value))
+            self.verbose = self._restore_verbose
+            self._restore_verbose = None
+        self._pending = []
+        data = bytearray()
+        count = 0
+        for command in pending:
+            line = command.encode('ascii') + b'\n'
+            if len(data) > 0 and len(data) + len(line) > self.max_write:
+                self.connection.write(data)
+                self.metrics.sent(len(data), count)
+                data = bytearray()
+                count = 0
+            data += line
+            count += 1
+        self.connection.write(data)
+        self.metrics.sent(len(data), count)
+        for command in pending:
+            self._echosubject.on_next(command)
+
+    def __resolve_query(self, line):
+        # machine readable replies are the command followed by the value, try the longest command first
+        for length in range(min(self._query_length, len(line) - 1), 0, -1):
+            try:
+                value = float(line[length:])
+            except ValueError:
+                continue
+            if self._queries.resolve(line[:length], value):
+                return
+
+    def __monitoring_values(self, line:str):
+        try:
+            values = list(map(float, line.split('\t')))
+        except ValueError:
+            return None
+        if len(values) != len(self._monitoring_header.registers):
+            return None
+        return values
+
+    def __parse_monitoring_data(self, line:str, timestamp=None):
+        values = self.__monitoring_values(line)
+        if values is None:
+            if self._batching == 0:     # otherwise the line is counted by __parse_monitoring_batch()
+                self.metrics.telemetry_errors += 1
+            return None
+        return TelemetryFrame(0, values, header=self._monitoring_header, timestamp=timestamp)
+
+    def __parse_monitoring_batch(self, lines):
+        header = self._monitoring_header
+        if header is None:
             return None
-        return t
+        tabs = len(header.registers) - 1
+        good = [line for line in lines if line.count('\t') == tabs]
+        try:
+            values = np.array('\t'.join(good).split('\t'), dtype=np.float64)
+        except ValueError:
+            # some fields aren't numbers, convert the lines one by one
+            rows = [self.__monitoring_values(line) for line in good]
+            good = [row for row in rows if row is not None]
+            values = np.array(good, dtype=np.float64)
+        self.metrics.telemetry_errors += len(lines) - len(good)     # each bad line is counted here only
+        if len(good) == 0:
+            return None
+        return values.reshape(len(good), tabs + 1)
+
+    def _process_bytes(self, data):
+        """ Split a chunk of received bytes into lines, and route each complete line once: monitoring data to
+            the telemetry streams, everything else to the console observable. The partial line at the end
+            is kept until the rest of it arrives.
+        """
+        metrics = self.metrics
+        metrics.reads += 1
+        metrics.bytes_in += len(data)
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return
+        text = buffer[:end].decode('ascii', errors='replace')
+        del buffer[:end + 1]
+        timestamp = time.monotonic_ns()
+        console = monitoring = 0
+        for line in text.split('\n'):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            if line[0] in MONITORING_START:
+                monitoring += 1
+                if self._monitoring_header is not None:
+                    if len(self._telemetry_subject.observers) > 0:    # only parse if someone is listening
+                        t = self.__parse_monitoring_data(line, timestamp)
+                        if t is not None:
+                            self.__emit(self._telemetry_subject, t)
+                    if self._batching:
+                        self.__emit(self._monitoring_lines, line)
+            else:
+                console += 1
+                if self._query_length > 0 and len(self._queries) > 0:
+                    self.__resolve_query(line)
+                self.__emit(self._subject, line)
+        metrics.frames_in += console + monitoring
+        metrics.frames_in_by_name['console'] += console
+        metrics.frames_in_by_name['monitoring'] += monitoring
+        if len(self._events) > 0:
+            self.dispatcher.put_all(self._events)
+            self._events = []
+
+    def __emit(self, subject, item):
+        if self.dispatcher is None:
+            subject.on_next(item)
+        else:
+            self._events.append((subject, item))
+
+    def __deliver(self, event):
+        event[0].on_next(event[1])
+
+    def __is_console_event(self, event):
+        return event[0] is self._subject
 
     def __run(self):
         while self.is_running:
-            if self.connection.in_waiting > 0:
-                self.__processLine()
+            if self.read_timeout is not None:
+                # blocks until at least one byte arrives, or the timeout expires
+                data = self.connection.read(max(1, self.connection.in_waiting))
+                if len(data) > 0:
+                    start = time.perf_counter_ns()
+                    self._process_bytes(data)
+                    self.metrics.process_time.record(time.perf_counter_ns() - start)
+            elif self.connection.in_waiting > 0:
+                start = time.perf_counter_ns()
+                self._process_bytes(self.connection.read(self.connection.in_waiting))
+                self.metrics.process_time.record(time.perf_counter_ns() - start)
             else:
                 time.sleep(0.001)
 
-    def __processLine(self):
-        line = self.connection.readline()
-        if line is not None:
-            line = line.decode('ascii').strip()
-            if len(line) > 0:
-                self._subject.on_next(line)
-
 
 
 
@@ -168,58 +446,110 @@ class FullControl:
         self.commander.send_command(self.letter + str(target))
 
     def set_mode(self, motion_control_type, torque_control_type):
-        # todo check types
-        self.commander.send_command(self.letter + 'C' + str(motion_control_type.value))
-        self.commander.send_command(self.letter + 'T' + str(torque_control_type.value))
+        with self.commander.batch():
+            # todo check types
+            self.commander.send_command(self.letter + 'C' + str(motion_control_type.value))
+            self.commander.send_command(self.letter + 'T' + str(torque_control_type.value))
 
     def set_limits(self, max_voltage:float=None, max_current:float=None, max_velocity:float=None, max_angle:float=None, min_angle:float=None):
-        if (max_voltage!=None): self.commander.send_command(self.letter + 'LU' + str(max_voltage))
-        if (max_current!=None): self.commander.send_command(self.letter + 'LC' + str(max_current))
-        if (max_velocity!=None): self.commander.send_command(self.letter + 'LV' + str(max_velocity))
-        # todo add max and min angle limits to SimpleFOC
-        #self.commander.send_command(self.letter + '' + str(max_angle))
-        #self.commander.send_command(self.letter + '' + str(min_angle))
+        with self.commander.batch():
+            if (max_voltage!=None): self.commander.send_command(self.letter + 'LU' + str(max_voltage))
+            if (max_current!=None): self.commander.send_command(self.letter + 'LC' + str(max_current))
+            if (max_velocity!=None): self.commander.send_command(self.letter + 'LV' + str(max_velocity))
+            # todo add max and min angle limits to SimpleFOC
+            #self.commander.send_command(self.letter + '' + str(max_angle))
+            #self.commander.send_command(self.letter + '' + str(min_angle))
 
     def set_motor_parameters(self, resistance:float=None, kv:float=None, inductance:float=None):
-        if kv != None: self.commander.send_command(self.letter + 'K' + str(kv))
-        if resistance != None: self.commander.send_command(self.letter + 'R' + str(resistance))
-        if inductance != None: self.commander.send_command(self.letter + 'I' + str(inductance))
+        with self.commander.batch():
+            if kv != None: self.commander.send_command(self.letter + 'K' + str(kv))
+            if resistance != None: self.commander.send_command(self.letter + 'R' + str(resistance))
+            if inductance != None: self.commander.send_command(self.letter + 'I' + str(inductance))
 
     def set_velocity_pid(self, p:float = None, i:float = None, d:float = None, limit:float = None, ramp:float = None, tf:float = None):
-        if p != None: self.commander.send_command(self.letter + 'VP' + str(p))
-        if i != None: self.commander.send_command(self.letter + 'VI' + str(i))
-        if d != None: self.commVnder.send_command(self.letter + 'VD' + str(d))
-        if limit != None: self.Vommander.send_command(self.letter + 'VL' + str(limit))
-        if ramp != None: self.commaVder.send_command(self.letter + 'VR' + str(ramp))
-        if tf != None: self.commanVer.send_command(self.letter + 'VF' + str(tf))
+        with self.commander.batch():
+            if p != None: self.commander.send_command(self.letter + 'VP' + str(p))
+            if i != None: self.commander.send_command(self.letter + 'VI' + str(i))
+            if d != None: self.commander.send_command(self.letter + 'VD' + str(d))
+            if limit != None: self.commander.send_command(self.letter + 'VL' + str(limit))
+            if ramp != None: self.commander.send_command(self.letter + 'VR' + str(ramp))
+            if tf != None: self.commander.send_command(self.letter + 'VF' + str(tf))
 
     def set_angle_pid(self, p:float = None, i:float = None, d:float = None, limit:float = None, ramp:float = None, tf:float = None):
-        if p != None: self.commander.send_command(self.letter + 'AP' + str(p))
-        if i != None: self.commander.send_command(self.letter + 'AI' + str(i))
-        if d != None: self.commander.send_command(self.letter + 'AD' + str(d))
-        if limit != None: self.commander.send_command(self.letter + 'AL' + str(limit))
-        if ramp != None: self.commander.send_command(self.letter + 'AR' + str(ramp))
-        if tf != None: self.commander.send_command(self.letter + 'AF' + str(tf))
+        with self.commander.batch():
+            if p != None: self.commander.send_command(self.letter + 'AP' + str(p))
+            if i != None: self.commander.send_command(self.letter + 'AI' + str(i))
+            if d != None: self.commander.send_command(self.letter + 'AD' + str(d))
+            if limit != None: self.commander.send_command(self.letter + 'AL' + str(limit))
+            if ramp != None: self.commander.send_command(self.letter + 'AR' + str(ramp))
+            if tf != None: self.commander.send_command(self.letter + 'AF' + str(tf))
 
     def set_current_q_pid(self, p:float = None, i:float = None, d:float = None, limit:float = None, ramp:float = None, tf:float = None):
-        if p != None: self.commander.send_command(self.letter + 'QP' + str(p))
-        if i != None: self.commander.send_command(self.letter + 'QI' + str(i))
-        if d != None: self.commander.send_command(self.letter + 'QD' + str(d))
-        if limit != None: self.commander.send_command(self.letter + 'QL' + str(limit))
-        if ramp != None: self.commander.send_command(self.letter + 'QR' + str(ramp))
-        if tf != None: self.commander.send_command(self.letter + 'QF' + str(tf))
+        with self.commander.batch():
+            if p != None: self.commander.send_command(self.letter + 'QP' + str(p))
+            if i != None: self.commander.send_command(self.letter + 'QI' + str(i))
+            if d != None: self.commander.send_command(self.letter + 'QD' + str(d))
+            if limit != None: self.commander.send_command(self.letter + 'QL' + str(limit))
+            if ramp != None: self.commander.send_command(self.letter + 'QR' + str(ramp))
+            if tf != None: self.commander.send_command(self.letter + 'QF' + str(tf))
 
     def set_current_p_pid(self, p:float = None, i:float = None, d:float = None, limit:float = None, ramp:float = None, tf:float = None):
-        if p != None: self.commander.send_command(self.letter + 'DP' + str(p))
-        if i != None: self.commander.send_command(self.letter + 'DI' + str(i))
-        if d != None: self.commander.send_command(self.letter + 'DD' + str(d))
-        if limit != None: self.commander.send_command(self.letter + 'DL' + str(limit))
-        if ramp != None: self.commander.send_command(self.letter + 'DR' + str(ramp))
-        if tf != None: self.commander.send_command(self.letter + 'DF' + str(tf))
+        with self.commander.batch():
+            if p != None: self.commander.send_command(self.letter + 'DP' + str(p))
+            if i != None: self.commander.send_command(self.letter + 'DI' + str(i))
+            if d != None: self.commander.send_command(self.letter + 'DD' + str(d))
+            if limit != None: self.commander.send_command(self.letter + 'DL' + str(limit))
+            if ramp != None: self.commander.send_command(self.letter + 'DR' + str(ramp))
+            if tf != None: self.commander.send_command(self.letter + 'DF' + str(tf))
 
     def set_sensor_offsets(self, offset:float=None, zero_electrical_angle:float=None):
-        if offset != None: self.commander.send_command(self.letter + 'SM' + str(offset))
-        if zero_electrical_angle != None: self.commander.send_command(self.letter + 'SE' + str(zero_electrical_angle))
+        with self.commander.batch():
+            if offset != None: self.commander.send_command(self.letter + 'SM' + str(offset))
+            if zero_electrical_angle != None: self.commander.send_command(self.letter + 'SE' + str(zero_electrical_angle))
+
+    def query(self, command, timeout=QUERY_TIMEOUT):
+        """ Query a value of this motor, e.g. query('VP') for the velocity P gain. Returns a future for the value. """
+        return self.commander.query(self.letter + command, timeout)
+
+    def get_target(self, timeout=QUERY_TIMEOUT):
+        return self.query('', timeout)
+
+    def get_limits(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [max_voltage, max_current, max_velocity] """
+        return self.__query_all(['LU', 'LC', 'LV'], timeout)
+
+    def get_motor_parameters(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [resistance, kv, inductance] """
+        return self.__query_all(['R', 'K', 'I'], timeout)
+
+    def get_velocity_pid(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [p, i, d, limit, ramp, tf] """
+        return self.__query_pid('V', timeout)
+
+    def get_angle_pid(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [p, i, d, limit, ramp, tf] """
+        return self.__query_pid('A', timeout)
+
+    def get_current_q_pid(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [p, i, d, limit, ramp, tf] """
+        return self.__query_pid('Q', timeout)
+
+    def get_current_d_pid(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [p, i, d, limit, ramp, tf] """
+        return self.__query_pid('D', timeout)
+
+    get_current_p_pid = get_current_d_pid   # mirrors set_current_p_pid()
+
+    def get_sensor_offsets(self, timeout=QUERY_TIMEOUT):
+        """ Returns a future for the list [offset, zero_electrical_angle] """
+        return self.__query_all(['SM', 'SE'], timeout)
+
+    def __query_pid(self, pid, timeout):
+        return self.__query_all([pid + c for c in 'PIDLRF'], timeout)
+
+    def __query_all(self, commands, timeout):
+        with self.commander.batch():
+            return gather([self.query(c, timeout) for c in commands])
 
     def disable(self):
         self.enable(False)
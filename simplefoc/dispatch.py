@@ -0,0 +1,140 @@
+#
+# Decoupled delivery of received frames to subscribers
+#
+# Normally the reader thread calls the subscribers directly, so a slow subscriber (a plot, a file write)
+# stalls the reading of the serial port, the OS buffer overflows and bytes are lost. A Dispatcher instead
+# puts the items into a bounded queue, and delivers them from a separate thread. When the queue is full,
+# its DropPolicy decides whether the oldest or the newest items are dropped, or the reader waits.
+#
+
+import threading
+from enum import Enum
+from collections import deque
+
+
+# default maximum number of items waiting in a dispatcher's queue
+DISPATCH_QUEUE_SIZE = 10000
+
+
+
+class DropPolicy(Enum):
+    drop_oldest = 0     # make room by dropping the oldest waiting item
+    drop_newest = 1     # drop the new item
+    block = 2           # wait until there is room, the reader is slowed down to the pace of the subscribers
+
+
+
+class Dispatcher:
+    """ Delivers items from a bounded queue on a separate thread
+
+        The reader thread adds items with put_all(), which doesn't wait for the subscribers (unless the policy
+        is block). The dispatcher thread takes all the waiting items at once, and calls deliver(item) for each.
+        The taken batch no longer counts against maxsize, so while it is being delivered, up to maxsize new
+        items can wait: the dispatcher holds at most 2 x maxsize items (plus the items kept), and a subscriber
+        can be that many items behind the reader.
+
+        Items for which keep(item) is true are never dropped, e.g. header frames and register responses, which
+        are rare but needed to make sense of the rest of the stream. They are queued even if the queue is full.
+
+        The counters queued, dropped, delivered and high_water (the largest queue length seen) can be read at
+        any time, len(dispatcher) is the number of items currently waiting.
+
+        @param deliver: the function called with each item, on the dispatcher thread
+        @param maxsize: the maximum number of waiting items, not counting the batch being delivered
+        @param policy: the DropPolicy to apply when the queue is full
+        @param keep: optional predicate for items which must not be dropped
+    """
+    def __init__(self, deliver, maxsize=DISPATCH_QUEUE_SIZE, policy=DropPolicy.drop_oldest, keep=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.deliver = deliver
+        self.maxsize = maxsize
+        self.policy = policy
+        self.keep = keep
+        self.queued = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.errors = 0
+        self.high_water = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self.__run, daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True):
+        """ Stop the dispatcher thread, after delivering the waiting items if drain is true """
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            if not drain:
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def put(self, item):
+        self.put_all((item,))
+
+    def put_all(self, items):
+        """ Queue the items, applying the drop policy if the queue is full """
+        keep = self.keep
+        with self._condition:
+            for item in items:
+                if len(self._queue) >= self.maxsize and not (keep is not None and keep(item)):
+                    if self.policy == DropPolicy.drop_newest:
+                        self.dropped += 1
+                        continue
+                    if self.policy == DropPolicy.block:
+                        while len(self._queue) >= self.maxsize and self._running:
+                            self._condition.wait()
+                    else:
+                        self.__drop_oldest()
+                self._queue.append(item)
+                self.queued += 1
+            if len(self._queue) > self.high_water:
+                self.high_water = len(self._queue)
+            self._condition.notify_all()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __drop_oldest(self):
+        queue = self._queue
+        if self.keep is None:
+            queue.popleft()
+        else:
+            for i, item in enumerate(queue):
+                if not self.keep(item):
+                    del queue[i]
+                    break
+            else:
+                return      # only items to keep are waiting, let the queue grow
+        self.dropped += 1
+
+    def __run(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and self._running:
+                    self._condition.wait()
+                if len(self._queue) == 0:
+                    return
+                batch = self._queue
+                self._queue = deque()
+                self._condition.notify_all()    # wake up a blocked reader
+            for item in batch:
+                try:
+                    self.deliver(item)
+                except Exception as e:
+                    self.errors += 1
+                    print("WARNING: subscriber failed in dispatcher: ", repr(e)) # TODO logging
+            self.delivered += len(batch)
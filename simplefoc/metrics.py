@@ -0,0 +1,182 @@
+#
+# Link and parser metrics
+#
+# Each connection (BinaryComms, ASCIIComms, Commander) counts the bytes and frames it receives and sends,
+# the problems seen by its parser, and how long its reader thread spends on each chunk of received bytes.
+# The counters are plain integers updated by the reader and writer threads, so keeping them is cheap:
+#
+#   metrics = motors.connection.metrics
+#   print(metrics.snapshot())
+#   metrics.observable(interval=5.0).subscribe(lambda m: alert() if m['rates']['resyncs'] > 0 else None)
+#
+
+import time
+import rx
+from collections import Counter
+from rx import operators as ops
+from simplefoc import FrameType
+
+
+# counters reported per second in the rates of the periodic snapshots
+RATE_COUNTERS = ['bytes_in', 'bytes_out', 'frames_in', 'frames_out', 'writes', 'parse_errors',
+                 'telemetry_errors', 'resyncs', 'overruns', 'unknown_registers']
+
+# frame types by the code of their type character, as counted in LinkMetrics.frames_in_by_code
+_FRAME_TYPES = { ord(t.value): t for t in FrameType }
+
+
+
+class LatencyHistogram:
+    """ Histogram of durations in nanoseconds, with power of two buckets
+
+        Bucket 0 counts durations up to 1024ns, bucket i durations up to 2^(10+i) ns, the last bucket also
+        counts everything longer. Recording a duration is a handful of integer operations.
+
+        @param buckets: the number of buckets, the default covers up to about 4 seconds
+    """
+    def __init__(self, buckets=23):
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, duration_ns:int):
+        index = duration_ns.bit_length() - 10
+        if index < 0:
+            index = 0
+        elif index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += duration_ns
+        if duration_ns > self.max:
+            self.max = duration_ns
+
+    def percentile(self, p:float) -> int:
+        """ Upper bound in nanoseconds of the bucket containing the p-th percentile, or 0 if nothing was recorded """
+        if self.count == 0:
+            return 0
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c > 0:
+                return min(1 << (10 + i), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1000.0 if self.count > 0 else 0.0,
+            'max_us': self.max / 1000.0,
+            'p50_us': self.percentile(50) / 1000.0,
+            'p90_us': self.percentile(90) / 1000.0,
+            'p99_us': self.percentile(99) / 1000.0,
+            'buckets_us': { (1 << (10 + i)) / 1000.0 : c for i, c in enumerate(self.counts) if c > 0 }
+        }
+
+
+
+class LinkMetrics:
+    """ Counters for one connection
+
+        bytes_in, bytes_out: bytes read from and written to the connection
+        frames_in, frames_out: frames (or lines, for Commander) received and sent
+        frames_in_by_type: received frames counted by type (FrameType, or 'console'/'monitoring' for Commander).
+                           The packet parsers count each frame as a plain integer in frames_in_by_code, indexed
+                           by the code of its type character, and Commander counts lines in frames_in_by_name.
+        writes: write calls made to the connection
+        parse_errors: received frames or lines which could not be parsed
+        telemetry_errors: telemetry or monitoring values not matching their header
+        resyncs: times the parser lost sync with the stream, and had to look for the start of the next frame
+        overruns: frames discarded because they exceeded the maximum frame length
+        unknown_registers: register ids received which are not in the register map
+        reads: chunks of bytes processed by the reader
+        process_time: histogram of the time the reader spent on each chunk, parsing and delivering the frames
+
+        Set dispatcher to include the counters of a Dispatcher in the snapshots.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames_in = 0
+        self.frames_out = 0
+        self.frames_in_by_code = [0] * 256
+        self.frames_in_by_name = Counter()
+        self.writes = 0
+        self.parse_errors = 0
+        self.telemetry_errors = 0
+        self.resyncs = 0
+        self.overruns = 0
+        self.unknown_registers = 0
+        self.reads = 0
+        self.process_time = LatencyHistogram()
+        self.dispatcher = None
+
+    def received(self, size, frames):
+        """ Count a chunk of size bytes, and the frames completed by it """
+        self.reads += 1
+        self.bytes_in += size
+        self.frames_in += len(frames)
+
+    @property
+    def frames_in_by_type(self) -> Counter:
+        counts = Counter(self.frames_in_by_name)
+        for code, c in enumerate(self.frames_in_by_code):
+            if c > 0:
+                counts[_FRAME_TYPES.get(code, chr(code))] += c
+        return counts
+
+    def sent(self, size, frames=1):
+        """ Count a write of size bytes carrying the given number of frames """
+        self.writes += 1
+        self.bytes_out += size
+        self.frames_out += frames
+
+    def snapshot(self) -> dict:
+        """ Return the current values of all counters as a dict """
+        now = time.monotonic()
+        result = {
+            'time': now,
+            'uptime': now - self.started,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'frames_in': self.frames_in,
+            'frames_out': self.frames_out,
+            'frames_in_by_type': { getattr(t, 'name', t) : c for t, c in self.frames_in_by_type.items() },
+            'writes': self.writes,
+            'parse_errors': self.parse_errors,
+            'telemetry_errors': self.telemetry_errors,
+            'resyncs': self.resyncs,
+            'overruns': self.overruns,
+            'unknown_registers': self.unknown_registers,
+            'reads': self.reads,
+            'process_time': self.process_time.snapshot()
+        }
+        if self.dispatcher is not None:
+            d = self.dispatcher
+            result['dispatch'] = { 'queued': d.queued, 'dropped': d.dropped, 'delivered': d.delivered,
+                                   'errors': d.errors, 'waiting': len(d), 'high_water': d.high_water }
+        return result
+
+    def observable(self, interval=1.0):
+        """ Get an observable of snapshots, taken every interval seconds. Each snapshot also contains 'rates',
+            the per second rates of the counters since the previous snapshot.
+        """
+        def create(scheduler=None):
+            last = [self.snapshot()]
+            def take(i):
+                current = self.snapshot()
+                elapsed = current['time'] - last[0]['time']
+                current['rates'] = { name: (current[name] - last[0][name]) / elapsed if elapsed > 0 else 0.0 for name in RATE_COUNTERS }
+                last[0] = current
+                return current
+            return rx.interval(interval).pipe(ops.map(take))
+        return rx.defer(create).pipe(ops.share())
@@ -1,6 +1,7 @@
 
-from .registers import SimpleFOCRegisters
+from .registers import SimpleFOCRegisters, parse_register
 from rx import operators as ops
+import struct
 
 class Motor:
     """ SimpleFOC Motor class
@@ -27,6 +28,110 @@ class Motor:
     def get_register(self, reg, timeout:float=1.0):
         return self.motors.get_register(self.motor_id, reg, timeout)
 
+    def request_register(self, reg, timeout:float=1.0, use_cache:bool=True):
+        return self.motors.request_register(self.motor_id, reg, timeout, use_cache)
+
+    def get_registers(self, regs, timeout:float=1.0, use_cache:bool=True):
+        return self.motors.get_registers(self.motor_id, regs, timeout, use_cache)
+
+    def enable_cache(self, max_age:float=1.0, skip_unchanged:bool=False):
+        """ Answer register reads from a shadow copy of the values written, read and received as telemetry,
+            while they are younger than max_age seconds. See Motors.enable_cache() and RegisterCache.
+        """
+        return self.motors.enable_cache(self.motor_id, max_age, skip_unchanged)
+
+    def disable_cache(self):
+        self.motors.disable_cache(self.motor_id)
+
+    def snapshot(self, timeout:float=1.0, strict:bool=True):
+        """ Read the full configuration and state of the motor, i.e. every readable register.
+
+            All the reads are in flight at the same time, and go to the driver even if the register cache is
+            enabled. Returns a dict of register name to value, which can be serialized (e.g. as JSON) and passed
+            to restore().
+
+            @param timeout: the timeout for the reads
+            @param strict: if True, raise a TimeoutError listing the registers the driver did not respond to
+                           within the timeout. If False, leave them out, e.g. for drivers which don't implement
+                           all the registers.
+        """
+        regs = self._snapshot_registers()
+        futures = [(r, self.request_register(r, timeout, use_cache=False)) for r in regs]
+        snapshot = {}
+        missing = []
+        for r, f in futures:
+            try:
+                snapshot[r.name] = f.result()
+            except TimeoutError:
+                missing.append(r.name)
+        return self._check_snapshot(snapshot, missing, strict)
+
+    def restore(self, snapshot, verify:bool=False, timeout:float=1.0):
+        """ Write back the writable registers of a snapshot, in one burst. REG_ENABLE is written last.
+
+            @param snapshot: a dict of register name (or Register) to value, as returned by snapshot(). Names of
+                             unknown registers are skipped, with a warning.
+            @param verify: if True, read the registers back from the driver, bypassing the register cache, and
+                           compare them to the snapshot
+            @param timeout: the timeout for the read back
+            @return: if verifying, a dict of register name to (expected, actual) for the registers which don't
+                     match, so an empty dict means the restore was successful. Otherwise None.
+        """
+        writes = self._restore_writes(snapshot)
+        self._write_snapshot(writes)
+        if not verify:
+            return None
+        actual = self.get_registers([reg for reg, value in writes], timeout, use_cache=False)
+        return self._mismatches(writes, actual)
+
+    def _snapshot_registers(self):
+        return [r for r in SimpleFOCRegisters.registers() if len(r.read_types) > 0 and r != SimpleFOCRegisters.REG_MOTOR_ADDRESS]
+
+    def _check_snapshot(self, snapshot, missing, strict):
+        if strict and len(missing) > 0:
+            raise TimeoutError("No response for {} of {} registers: {}".format(len(missing), len(snapshot) + len(missing), ', '.join(missing)))
+        return snapshot
+
+    def _restore_writes(self, snapshot):
+        # (register, value) pairs to write, with REG_ENABLE last
+        writes = []
+        for name, value in snapshot.items():
+            try:
+                reg = parse_register(name)
+            except AttributeError:
+                print("WARNING: unknown register in snapshot: ", name) # TODO logging
+                continue
+            if reg is None or len(reg.write_types) == 0 or reg == SimpleFOCRegisters.REG_MOTOR_ADDRESS:
+                continue
+            writes.append((reg, value))
+        writes.sort(key=lambda w: w[0] == SimpleFOCRegisters.REG_ENABLE)
+        return writes
+
+    def _write_snapshot(self, writes):
+        # forget the cached values first, so the whole snapshot is written even with skip_unchanged
+        cache = self.motors.register_cache(self.motor_id)
+        if cache is not None:
+            for reg, value in writes:
+                cache.invalidate(reg)
+        self.motors.set_registers(self.motor_id, writes)
+
+    def _mismatches(self, writes, actual):
+        mismatches = {}
+        for (reg, value), read in zip(writes, actual):
+            if not self.__same_value(reg, value, read):
+                mismatches[reg.name] = (value, read)
+        return mismatches
+
+    def __same_value(self, reg, a, b):
+        # compare as the driver stores them, e.g. floats as 32 bit
+        fmt = '<' + reg.read_format()
+        a = a if hasattr(a, "__len__") else [a]
+        b = b if hasattr(b, "__len__") else [b]
+        try:
+            return struct.pack(fmt, *a) == struct.pack(fmt, *b)
+        except struct.error:
+            return list(a) == list(b)
+
     def set_target(self, target):
         target = float(target)
         self.motors.set_register(self.motor_id, SimpleFOCRegisters.REG_TARGET, target)
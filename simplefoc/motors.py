@@ -2,6 +2,9 @@
 from .registers import parse_register, Register, SimpleFOCRegisters
 from .motor import Motor
 from .telemetry import Telemetry
+from .pending import PendingRequests
+from .cache import RegisterCache
+from concurrent.futures import Future
 from rx import operators as ops, Observable
 from simplefoc import FrameType, Frame
 
@@ -19,20 +22,35 @@ class Motors(object):
         Motor ids are integers, starting from 0. If you have only one motor, you can ignore the motor_id parameter, 
         it is defaulted to 0.
 
+        Register reads are pipelined: each read is a future in a table of pending requests, keyed by motor id and
+        register, and is resolved when the matching response arrives. Use request_register() or get_registers()
+        to have many reads in flight at once.
+
+        Reads can also be answered from a RegisterCache per motor, see enable_cache().
+
         @param connection: the packet-based connection (ASCIIComms or BinaryComms) object
     """
     def __init__(self, connection):
         self.connection = connection
         self.current_motor = -1
+        self._requests = PendingRequests()
         self._observable = self.connection.observable().pipe(
             ops.filter(lambda p: p.frame_type == FrameType.RESPONSE or p.frame_type == FrameType.ALERT),
             ops.do_action(self.__set_motor_id),
             ops.share()
         )
-        self._observable.subscribe()
+        self._observable.subscribe(self.__resolve_request)
+        self._caches = {}
+        self._cache_headers = {}
+        self._cache_subscription = None
+        # headers are tracked from the start, so telemetry configured before enable_cache() updates the caches
+        self.connection.observable().pipe(
+            ops.filter(lambda p: p.frame_type == FrameType.HEADER)
+        ).subscribe(self.__update_cache_headers)
 
     def disconnect(self):
         self.connection.disconnect()
+        self._requests.cancel_all()
 
     def connect(self):
         self.connection.connect()
@@ -40,38 +58,111 @@ class Motors(object):
     def motor(self, motor_id:int=0) -> Motor:
         return Motor(self, motor_id)
     
+    def enable_cache(self, motor_id:int, max_age:float=1.0, skip_unchanged:bool=False) -> RegisterCache:
+        """ Keep a shadow copy of the motor's register values, updated by writes, responses and telemetry, and
+            answer reads from it while the values are younger than max_age seconds.
+
+            @param motor_id: the motor to cache the registers of
+            @param max_age: the maximum age of the values used, in seconds, or None to use them until replaced
+            @param skip_unchanged: don't send writes of the value the register already has
+            @return: the RegisterCache, with the hits, misses and skipped counters
+        """
+        cache = self._caches[motor_id] = RegisterCache(max_age, skip_unchanged)
+        if self._cache_subscription is None:
+            self._cache_subscription = self.connection.observable().pipe(
+                ops.filter(lambda p: p.frame_type == FrameType.TELEMETRY)
+            ).subscribe(self.__update_caches)
+        return cache
+
+    def disable_cache(self, motor_id:int):
+        self._caches.pop(motor_id, None)
+
+    def register_cache(self, motor_id:int) -> RegisterCache:
+        """ Return the motor's RegisterCache, or None if caching is not enabled for it """
+        return self._caches.get(motor_id)
+
     def set_register(self, motor_id:int, reg:int|str|Register, values):
         if not hasattr(values, "__len__"):
             values = [values]
         if not isinstance(reg, Register):
             reg = parse_register(reg)
+        cache = self._caches.get(motor_id)
+        if cache is not None and not cache.written(reg, values):
+            return      # unchanged
         if self.current_motor != motor_id:
             self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=SimpleFOCRegisters.REG_MOTOR_ADDRESS, values=[motor_id]))
             self.current_motor = motor_id
         self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=reg, values=values))
 
+    def set_registers(self, motor_id:int, registers):
+        """ Write several registers in one burst, with a single write to the connection.
+
+            @param motor_id: the motor to write the registers of
+            @param registers: a dict, or list of (register, values) pairs
+        """
+        if isinstance(registers, dict):
+            registers = registers.items()
+        cache = self._caches.get(motor_id)
+        frames = []
+        if self.current_motor != motor_id:
+            frames.append(Frame(frame_type=FrameType.REGISTER, register=SimpleFOCRegisters.REG_MOTOR_ADDRESS, values=[motor_id]))
+            self.current_motor = motor_id
+        for reg, values in registers:
+            if not hasattr(values, "__len__"):
+                values = [values]
+            if not isinstance(reg, Register):
+                reg = parse_register(reg)
+            if cache is not None and not cache.written(reg, values):
+                continue    # unchanged
+            frames.append(Frame(frame_type=FrameType.REGISTER, register=reg, values=values))
+        if len(frames) > 0:
+            self.connection.send_frames(frames)
+
     def set_register_with_response(self, motor_id:int, reg:int|str|Register, values, timeout=1.0):
+        if not isinstance(reg, Register):
+            reg = parse_register(reg)
+        future = self._requests.expect((motor_id, reg.id), timeout)
+        cache = self._caches.get(motor_id)
+        if cache is not None:
+            cache.invalidate(reg)   # always send, the response is expected
         self.set_register(motor_id, reg, values)
-        return self.get_response(motor_id, reg, timeout)
+        return future.result()
 
     def get_register(self, motor_id:int, reg:int|str|Register, timeout=None):
+        if timeout is not None:
+            return self.request_register(motor_id, reg, timeout).result()
         if not isinstance(reg, Register):
             reg = parse_register(reg)
-        if self.current_motor != motor_id:
-            self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=SimpleFOCRegisters.REG_MOTOR_ADDRESS, values=[motor_id]))
-            self.current_motor = motor_id
-        self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=reg, values=[]))
-        if timeout is not None:
-            return self.get_response(motor_id, reg, timeout)
+        self.__send_read(motor_id, reg)
+
+    def request_register(self, motor_id:int, reg:int|str|Register, timeout=1.0, use_cache:bool=True) -> Future:
+        """ Send a read request for the register, and return a future for its value, without waiting for the response.
+            The future fails with a TimeoutError if there is no response within timeout seconds.
+            If the motor's register cache has a recent value, the future is already resolved with it, unless
+            use_cache is False.
+        """
+        if not isinstance(reg, Register):
+            reg = parse_register(reg)
+        cache = self._caches.get(motor_id)
+        if cache is not None and use_cache:
+            found, value = cache.get(reg)
+            if found:
+                future = Future()
+                future.set_result(value)
+                return future
+        future = self._requests.expect((motor_id, reg.id), timeout)
+        self.__send_read(motor_id, reg)
+        return future
+
+    def get_registers(self, motor_id:int, regs, timeout=1.0, use_cache:bool=True):
+        """ Read several registers, with all the requests in flight at the same time. Returns the list of values. """
+        futures = [self.request_register(motor_id, reg, timeout, use_cache) for reg in regs]
+        return [f.result() for f in futures]
         
     def get_response(self, motor_id:int, reg:int|str|Register, timeout=None):
-        return self.observable().pipe(
-            ops.filter(lambda p: p.frame_type == FrameType.RESPONSE and p.motor_id == motor_id and p.register == reg),
-            ops.filter(lambda p: p.values is not None and len(p.values) > 0),
-            ops.first(),
-            ops.map(lambda p: p.values if len(p.values) > 1 else p.values[0]),
-            ops.timeout(float(timeout))
-        ).run()
+        if not isinstance(reg, Register):
+            reg = parse_register(reg)
+        return self._requests.expect((motor_id, reg.id), timeout).result()
     
     def telemetry(self) -> Telemetry:
         return Telemetry(self)
@@ -87,6 +178,44 @@ class Motors(object):
             ops.merge(self.echo())
         )
     
+    def __send_read(self, motor_id, reg):
+        if self.current_motor != motor_id:
+            self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=SimpleFOCRegisters.REG_MOTOR_ADDRESS, values=[motor_id]))
+            self.current_motor = motor_id
+        self.connection.send_frame(Frame(frame_type=FrameType.REGISTER, register=reg, values=[]))
+
+    def __resolve_request(self, packet):
+        if packet.frame_type == FrameType.RESPONSE and packet.values is not None and len(packet.values) > 0:
+            value = packet.values if len(packet.values) > 1 else packet.values[0]
+            cache = self._caches.get(packet.motor_id)
+            if cache is not None:
+                cache.put(packet.register, value, packet.timestamp)
+            self._requests.resolve((packet.motor_id, packet.register.id), value)
+
+    def __update_cache_headers(self, packet):
+        # where each register's values are in the telemetry of this header
+        layout = []
+        pos = 0
+        for reg, motor in zip(packet.registers, packet.motors):
+            size = len(reg.read_types) if reg is not None else 0
+            if reg is not None:
+                layout.append((motor, reg, pos, size))
+            pos += size
+        self._cache_headers[packet.telemetryid] = (packet, layout)
+
+    def __update_caches(self, packet):
+        header = self._cache_headers.get(packet.telemetryid)
+        if header is None or len(self._caches) == 0:
+            return
+        header, layout = header
+        if packet.header is not header and self.connection.parse_telemetry(packet, header) is None:
+            return
+        values = packet.values
+        for motor, reg, pos, size in layout:
+            cache = self._caches.get(motor)
+            if cache is not None and pos + size <= len(values):
+                cache.put(reg, values[pos] if size == 1 else values[pos:pos + size], packet.timestamp)
+
     def __set_motor_id(self, packet):
         if packet.frame_type == FrameType.RESPONSE:
             if packet.register == SimpleFOCRegisters.REG_MOTOR_ADDRESS:
@@ -9,10 +9,14 @@ from enum import Enum
 from .registers import parse_register, Register, SimpleFOCRegisters
 import serial as ser
 import time, struct, threading
+from collections import deque
 from .motors import Motors
+from .telemetry import telemetry_dtype, telemetry_array, np
+from .dispatch import Dispatcher, DropPolicy, DISPATCH_QUEUE_SIZE
+from .metrics import LinkMetrics
 from rx.subject import Subject
 from rx import operators as ops
-from simplefoc import Frame, FrameType
+from simplefoc import Frame, FrameType, READ_TIMEOUT, RegisterFrame, TelemetryFrame, HeaderFrame, SyncFrame, AlertFrame
 
 
 
@@ -24,7 +28,7 @@ MARKER = 0xA5
 
 
 
-def serial(port, baud, protocol=ProtocolType.binary):
+def serial(port, baud, protocol=ProtocolType.binary, read_timeout=READ_TIMEOUT, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
     """ Create a serial connection to a SimpleFOC driver, and return a Motors instance to interact with it. 
         The connection is packet-based, and uses either ASCII or binary protocol.
         
@@ -33,15 +37,20 @@ def serial(port, baud, protocol=ProtocolType.binary):
         @param port: the serial port to connect to
         @param baud: the baud rate to use
         @param protocol: the protocol to use (binary or ascii)
+        @param read_timeout: the reader thread blocks on the port for up to this many seconds waiting for data,
+                             or use None to poll the port every millisecond instead
+        @param drop_policy: a DropPolicy to deliver the frames from a separate dispatcher thread, through a queue of
+                            up to queue_size frames, or None to deliver them on the reader thread
+        @param queue_size: the maximum number of frames waiting in the dispatcher queue
     """
     ser_conn = ser.Serial()
     ser_conn.port = port
     ser_conn.baudrate = baud
     comms = None
     if protocol == ProtocolType.binary:
-        comms = BinaryComms(ser_conn)
+        comms = BinaryComms(ser_conn, read_timeout, drop_policy, queue_size)
     elif protocol == ProtocolType.ascii:
-        comms = ASCIIComms(ser_conn)
+        comms = ASCIIComms(ser_conn, read_timeout, drop_policy, queue_size)
     else:
         raise ValueError("Unknown protocol type")
     return Motors(comms)
@@ -49,6 +58,33 @@ def serial(port, baud, protocol=ProtocolType.binary):
 
 
 
+def decode_telemetry_batch(payloads, header, columns=False, metrics=None):
+    """ Decode many binary telemetry payloads for the same header in one go, using numpy.
+
+        @param payloads: a list of the raw payloads of the telemetry frames (the bytes following the telemetry id),
+                         or a single buffer containing the payloads one after the other
+        @param header: the telemetry header frame describing the payloads
+        @param columns: if True, return a dict of column name to values instead of the structured array
+        @param metrics: optional LinkMetrics, in which skipped payloads are counted as telemetry_errors
+        @return: a numpy structured array with one field per header register, see telemetry_dtype().
+                 As in BinaryComms.parse_telemetry(), only the leading bytes of longer payloads are decoded.
+                 Payloads shorter than the header's size are skipped, since the array can't hold missing values.
+    """
+    dtype = telemetry_dtype(header)
+    if isinstance(payloads, (bytes, bytearray, memoryview)):
+        buffer = payloads
+    else:
+        size = dtype.itemsize
+        complete = [p[:size] for p in payloads if len(p) >= size]
+        if metrics is not None:
+            metrics.telemetry_errors += len(payloads) - len(complete)
+        buffer = b''.join(complete)
+    array = np.frombuffer(buffer, dtype=dtype, count=len(buffer) // dtype.itemsize)
+    if columns:
+        return { name: array[name] for name in dtype.names }
+    return array
+
+
 def parse_value(valuestr):
     if valuestr.startswith('0x'):
         return int(valuestr, 16)
@@ -59,11 +95,53 @@ def parse_value(valuestr):
     return int(valuestr)    
 
 
+def _parse_float(valuestr):
+    # the fast path for typed telemetry columns, falling back to parse_value() for its other formats
+    try:
+        return float(valuestr)
+    except ValueError:
+        return parse_value(valuestr)
+
+
+def _parse_int(valuestr):
+    try:
+        return int(valuestr)
+    except ValueError:
+        return parse_value(valuestr)    # hex, binary or float formatted values, as parse_value() accepts
+
+
+_telemetry_values = TelemetryFrame.values     # the slot holding the values
+
+
+class ASCIITelemetryFrame(TelemetryFrame):
+    """ An ASCII telemetry sample. payload holds the text of the values, and values is parsed from it with
+        parse_value() when first used, unless ASCIIComms.parse_telemetry() has already converted it using
+        the types from the header. Raises ValueError if the text can't be parsed.
+    """
+    __slots__ = ()
+
+    @property
+    def values(self):
+        values = _telemetry_values.__get__(self)
+        if values is None:
+            values = [parse_value(v) for v in self.payload.split(',')]
+            _telemetry_values.__set__(self, values)
+        return values
+
+    @values.setter
+    def values(self, values):
+        _telemetry_values.__set__(self, values)
+
+
+class UnknownRegisterError(ValueError):
+    pass
+
+
 def parse_register_and_values(command:str):
     regstr, valuesstr = command.split('=')[0:2]
     reg = parse_register(int(regstr))
     if reg is None:
-        raise ValueError("Unknown register: {}".format(regstr))
+        raise UnknownRegisterError("Unknown register: {}".format(regstr))
     values = [parse_value(v) for v in valuesstr.split(',')]
     return reg, values
 
@@ -71,34 +149,112 @@ def parse_register_and_values(command:str):
 
 
 class Comms(object):
-    def __init__(self, connection):
+    """ Base class for the packet based protocols.
+
+        By default the reader thread blocks in a read on the connection, with a timeout of read_timeout seconds,
+        so frames are delivered as soon as their bytes arrive. Set read_timeout to None to use the old
+        behaviour of polling the connection and sleeping for 1ms whenever it is empty.
+
+        Frames are passed to the subscribers on the reader thread, unless a drop_policy is given. Then they are
+        queued, and delivered by a separate dispatcher thread, so slow subscribers don't hold up the reading
+        of the connection. If more than queue_size frames are waiting, telemetry frames are dropped according
+        to the policy. The dispatcher's counters (queued, dropped, delivered, high_water) are in self.dispatcher.
+
+        Traffic, parser problems and the reader's processing time are counted in self.metrics, see LinkMetrics.
+
+        Connections added to a MotorBus (see bus.py) have no reader thread, the bus reads them from its I/O loop.
+
+        @param connection: the serial connection, or an object with the same API
+        @param read_timeout: timeout in seconds for the reader thread's blocking reads, or None to poll
+        @param drop_policy: the DropPolicy of the dispatcher queue, or None to deliver frames on the reader thread
+        @param queue_size: the maximum number of frames waiting in the dispatcher queue
+    """
+    def __init__(self, connection, read_timeout=READ_TIMEOUT, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
         self.connection = connection
+        self.read_timeout = read_timeout
         self._subject = Subject()
         self._observable = self._subject.pipe(
             ops.share()
         )
+        self.dispatcher = None
+        if drop_policy is not None:
+            self.dispatcher = Dispatcher(self._subject.on_next, queue_size, drop_policy, keep=_is_control_frame)
+        self.metrics = LinkMetrics()
+        self.metrics.dispatcher = self.dispatcher
         self._echosubject = Subject()
         self._echo = self._echosubject.pipe(
             ops.share()
         )
         self._in_sync = False
         self.is_running = False
+        self._frames = deque()
+        self._tx_lock = threading.Lock()
+        self._bus = None        # the MotorBus reading the connection instead of a reader thread, see bus.py
 
     def disconnect(self):
         if self.is_running:
             self.is_running = False
-            self._read_thread.join()
+            if self._bus is not None:
+                self._bus._detach(self)
+            else:
+                if hasattr(self.connection, 'cancel_read'):
+                    self.connection.cancel_read()   # wake up the reader thread if it is blocked in a read
+                self._read_thread.join()
         self.connection.close()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
         self._subject.on_completed()
 
     def connect(self):
+        if self.read_timeout is not None:
+            self.connection.timeout = self.read_timeout
         self.connection.open()
+        if self.dispatcher is not None:
+            self.dispatcher.start()
         self.is_running = True
-        self._read_thread = threading.Thread(target=self.__run)
-        self._read_thread.start()
+        if self._bus is not None:
+            self._bus._attach(self)
+        else:
+            self._read_thread = threading.Thread(target=self.__run)
+            self._read_thread.start()
         self.send_frame(Frame(frame_type=FrameType.SYNC))
 
     def get_frame(self):
+        while len(self._frames) == 0 and self.connection.in_waiting > 0:
+            self._frames.extend(self._receive(self.connection.read(self.connection.in_waiting)))
+        if len(self._frames) > 0:
+            return self._frames.popleft()
+        return None
+
+    def get_frames(self):
+        """ Return a list of all the frames that can be completed from the bytes currently waiting on the connection. """
+        frames = list(self._frames)
+        self._frames.clear()
+        waiting = self.connection.in_waiting
+        if waiting > 0:
+            frames.extend(self._receive(self.connection.read(waiting)))
+        return frames
+
+    def _receive(self, data):
+        """ Process a chunk of received bytes, count it in the metrics, and return the list of frames completed by it. """
+        frames = self._process_bytes(data)
+        self.metrics.received(len(data), frames)
+        return frames
+
+    def _process_bytes(self, data):
+        """ Process a chunk of received bytes, and return the list of frames completed by it. """
+        raise NotImplementedError()
+
+    def _write(self, data, frames=1):
+        """ Write the encoded frames to the connection, and count them in the metrics. Call with the tx lock held. """
+        self.metrics.sent(len(data), frames)
+        self.connection.write(data)
+
+    def send_frame(self, frame):
+        raise NotImplementedError()
+
+    def send_frames(self, frames):
+        """ Send several frames, with a single write to the connection """
         raise NotImplementedError()
 
     def get_frame_blocking(self, timeout=0.0):
@@ -116,88 +272,173 @@ class Comms(object):
 
     def __run(self):
         while self.is_running:
-            if self.connection.in_waiting > 0:
-                f = self.get_frame()
-                if f is not None:
-                    self._subject.on_next(f)
+            if self.read_timeout is not None:
+                # blocks until at least one byte arrives, or the timeout expires
+                data = self.connection.read(max(1, self.connection.in_waiting))
+                if len(data) > 0:
+                    start = time.perf_counter_ns()
+                    self._deliver(self._receive(data))
+                    self.metrics.process_time.record(time.perf_counter_ns() - start)
+            elif self.connection.in_waiting > 0:
+                start = time.perf_counter_ns()
+                self._deliver(self.get_frames())
+                self.metrics.process_time.record(time.perf_counter_ns() - start)
             else:
                 time.sleep(0.001)
 
+    def _deliver(self, frames):
+        """ Pass received frames to the subscribers, or to the dispatcher queue """
+        if self.dispatcher is not None:
+            self.dispatcher.put_all(frames)
+        else:
+            for f in frames:
+                self._subject.on_next(f)
 
 
+def _is_control_frame(frame):
+    # everything except telemetry is rare, and needed to make sense of the stream, so it is never dropped
+    return frame.frame_type != FrameType.TELEMETRY
 
-class ASCIIComms(Comms):
-    def __init__(self, connection):
-        super().__init__(connection)
-        self._buffer = ''
 
-    def get_frame(self):
-        while self.connection.in_waiting > 0:
-            character = self.connection.read().decode('ascii')
-            if character == '\n':
-                if self._in_sync:
-                    frame = self.__parseFrame(self._buffer)
-                    self._buffer = ''
-                    return frame
-                else:
-                    self._buffer = ''
-                    self._in_sync = True
-                    self.send_frame(Frame(frame_type=FrameType.SYNC))
-            elif character == '\r':
-                pass
+
+
+class ASCIIComms(Comms):
+    def __init__(self, connection, read_timeout=READ_TIMEOUT, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
+        super().__init__(connection, read_timeout, drop_policy, queue_size)
+        self._buffer = bytearray()
+        self._telemetry_converters = {}
+
+    @property
+    def telemetry_errors(self):
+        """ The number of telemetry lines rejected by parse_telemetry """
+        return self.metrics.telemetry_errors
+
+    def _process_bytes(self, data):
+        """ Process a chunk of received bytes, and return the list of frames completed by it.
+
+            The complete lines in the chunk are split off and parsed in one go, and the partial line at the
+            end is kept in self._buffer until the rest of it arrives. Carriage returns are ignored. The first
+            newline received while out of sync only resynchronizes: the text before it is discarded, and a
+            SYNC frame is sent. Lines which can't be parsed are counted in the metrics, and skipped.
+        """
+        frames = []
+        buffer = self._buffer
+        buffer += data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return frames
+        text = buffer[:end].decode('ascii', errors='replace')
+        del buffer[:end + 1]
+        if '\r' in text:
+            text = text.replace('\r', '')
+        lines = text.split('\n')
+        if not self._in_sync:
+            lines = lines[1:]
+            self._in_sync = True
+            self.send_frame(Frame(frame_type=FrameType.SYNC))
+        timestamp = time.monotonic_ns()
+        counts = self.metrics.frames_in_by_code
+        for line in lines:
+            if len(line) == 0:
+                continue
+            try:
+                frame = self.__parseFrame(line, timestamp)
+            except UnknownRegisterError:
+                self.metrics.unknown_registers += 1
+                frame = None
+            except (ValueError, IndexError):
+                frame = None
+            if frame is not None:
+                frames.append(frame)
+                counts[ord(line[0])] += 1
             else:
-                self._buffer += character
-        return None
+                self.metrics.parse_errors += 1
+        return frames
 
     def send_frame(self, frame):
-        framestr = ""
+        framestr = self.__format_frame(frame)
+        with self._tx_lock:
+            self._write((framestr + '\n').encode('ascii'))
+        self._echosubject.on_next(framestr)
+
+    def send_frames(self, frames):
+        framestrs = [self.__format_frame(frame) for frame in frames]
+        with self._tx_lock:
+            self._write(''.join([f + '\n' for f in framestrs]).encode('ascii'), len(framestrs))
+        for framestr in framestrs:
+            self._echosubject.on_next(framestr)
+
+    def __format_frame(self, frame):
         match frame.frame_type:
             case FrameType.REGISTER:
-                framestr += 'R'
-                framestr += str(frame.register.id)
                 if frame.values is not None and len(frame.values) > 0:
-                    framestr += '='
-                    framestr += ','.join([str(v) for v in frame.values])
+                    return f"R{int(frame.register)}={self.__format_values(frame.values)}"
+                return f"R{int(frame.register)}"
             case FrameType.SYNC:
-                framestr += 'S'
-                framestr += '1' if self._in_sync else '0'
+                return 'S1' if self._in_sync else 'S0'
             case FrameType.ALERT:
-                framestr += 'A'
-                framestr += str(frame.alert)
+                return f"A{frame.alert}"
             case FrameType.RESPONSE:
-                framestr += 'r'
-                framestr += str(frame.register)
-                framestr += '='
-                framestr += ','.join([str(v) for v in frame.values])
+                return f"r{int(frame.register)}={self.__format_values(frame.values)}"
             case FrameType.TELEMETRY:
-                framestr += 'T'
-                framestr += str(frame.telemetryid)
-                framestr += '='
-                framestr += ','.join([str(v) for v in frame.values])
+                return f"T{frame.telemetryid}={self.__format_values(frame.values)}"
             case FrameType.HEADER:
-                framestr += 'H'
-                framestr += str(frame.telemetryid)
-                framestr += '='
-                framestr += ','.join([(str(v[0]) +":"+ str[int(v[1])]) for v in frame.registers])
-        framestr += '\n'
-        self.connection.write(framestr.encode('ascii'))
-        self._echosubject.on_next(framestr[:-1])
+                return f"H{frame.telemetryid}=" + ','.join([f"{m}:{int(r)}" for m, r in zip(frame.motors, frame.registers)])
+        return ''
+
+    def __format_values(self, values):
+        return ','.join([str(v) for v in values])
 
     def parse_telemetry(self, packet, header):
+        """ Convert the values of a telemetry frame to the types given by the header.
+
+            Returns the frame, or None if the line doesn't match the header (the wrong number of values, or
+            values which can't be converted), in which case telemetry_errors is incremented.
+        """
         packet.header = header
-        return packet # nothing to do here, ascii telemetry can parse the values during parsing the frame
+        text = getattr(packet, 'payload', None)   # the raw text is kept, so parsing again is harmless
+        if text is None:
+            return packet   # constructed with parsed values
+        converters = self.__telemetry_converters(header)
+        fields = text.split(',')
+        if converters is None or len(fields) != len(converters):
+            self.metrics.telemetry_errors += 1
+            return None
+        try:
+            packet.values = [convert(f) for convert, f in zip(converters, fields)]
+        except ValueError:
+            self.metrics.telemetry_errors += 1
+            return None
+        return packet
+
+    def parse_telemetry_batch(self, packets, header):
+        """ Convert a list of telemetry frames for the same header to a numpy structured array, see telemetry_dtype() """
+        parsed = [self.parse_telemetry(p, header) for p in packets]
+        return telemetry_array([p.values for p in parsed if p is not None], header)
+
+    def __telemetry_converters(self, header):
+        # the converters for each telemetry id are made once from the header's register types, and
+        # made again when a new header frame is received for that id
+        cached = self._telemetry_converters.get(header.telemetryid)
+        if cached is not None and cached[0] is header:
+            return cached[1]
+        converters = None
+        if all(reg is not None for reg in header.registers):
+            converters = [_parse_float if t == 'f' else _parse_int for reg in header.registers for t in reg.read_types]
+        self._telemetry_converters[header.telemetryid] = (header, converters)
+        return converters
     
-    def __parseFrame(self, framestr):
+    def __parseFrame(self, framestr, timestamp=None):
         if framestr.startswith('R'):
             reg, values = parse_register_and_values(framestr[1:])
-            return Frame(frame_type=FrameType.REGISTER, register=reg, values=values)
+            return RegisterFrame(FrameType.REGISTER, reg, values, timestamp=timestamp)
         if framestr.startswith('r'):
             reg, values = parse_register_and_values(framestr[1:])
-            return Frame(frame_type=FrameType.RESPONSE, register=reg, values=values)
+            return RegisterFrame(FrameType.RESPONSE, reg, values, timestamp=timestamp)
         if framestr.startswith('T'):
-            telemetryid, valuesstr = framestr[1:].split('=')[0:2]
-            values = [parse_value(v) for v in valuesstr.split(',')]
-            return Frame(frame_type=FrameType.TELEMETRY, values=values, telemetryid=int(telemetryid))
+            # the values are converted by parse_telemetry(), using the types from the header
+            telemetryid, _, valuesstr = framestr[1:].partition('=')
+            return ASCIITelemetryFrame(int(telemetryid), None, payload=valuesstr, timestamp=timestamp)
         if framestr.startswith('H'):
             telemetryid, valuesstr = framestr[1:].split('=')[0:2]
             registers = []
@@ -208,175 +449,241 @@ class ASCIIComms(Comms):
                 rr = SimpleFOCRegisters.by_id(int(reg))
                 if rr is None:
                     print("WARNING: header register not found ", reg)
+                    self.metrics.unknown_registers += 1
                 registers.append(rr)
-            return Frame(frame_type=FrameType.HEADER, telemetryid=int(telemetryid), registers=registers, motors=motors)
+            return HeaderFrame(int(telemetryid), registers, motors, timestamp=timestamp)
         if framestr.startswith('S'):
             remote_in_sync = (framestr[1] != '0')
-            return Frame(frame_type=FrameType.SYNC, values=[remote_in_sync])
+            return SyncFrame([remote_in_sync], timestamp=timestamp)
         if framestr.startswith('A'):
             alert = framestr[1:]
-            return Frame(frame_type=FrameType.ALERT, alert=alert)
+            return AlertFrame(alert, timestamp=timestamp)
         return None
 
 
 
 
 class BinaryComms(Comms):
-    def __init__(self, connection):
-        super().__init__(connection)
+    def __init__(self, connection, read_timeout=READ_TIMEOUT, drop_policy=None, queue_size=DISPATCH_QUEUE_SIZE):
+        super().__init__(connection, read_timeout, drop_policy, queue_size)
         self._expected = 0
         self._marker = False
         self._buffer = bytearray()
-
-    def get_frame(self):
-        while self.connection.in_waiting > 0:
-            byte = self.connection.read()
-            frame = self.__processByte(byte[0])
-            if frame is not None:
-                return frame
-        return None
+        self._telemetry_decoders = {}
+        self._value_encoders = {}
+        self._tx_buffer = bytearray()
 
     def send_frame(self, frame):
-        self.connection.write(MARKER.to_bytes(1))
-        fsize = self.__frame_size(frame)
-        print("Sending frame of size ", fsize)
-        self.connection.write(fsize.to_bytes(1))
+        with self._tx_lock:
+            buffer = self._tx_buffer
+            buffer.clear()
+            self.__encode_frame(frame, buffer)
+            self._write(buffer)
+        self._echosubject.on_next(frame)
+
+    def send_frames(self, frames):
+        with self._tx_lock:
+            buffer = self._tx_buffer
+            buffer.clear()
+            for frame in frames:
+                self.__encode_frame(frame, buffer)
+            self._write(buffer, len(frames))
+        for frame in frames:
+            self._echosubject.on_next(frame)
+
+    def __encode_frame(self, frame, buffer):
+        # frames are assembled in the buffer, with the size byte filled in once the payload is known
+        start = len(buffer)
+        buffer.append(MARKER)
+        buffer.append(0)
         match frame.frame_type:
-            case FrameType.REGISTER:
-                self.connection.write(b'R')
-                self.connection.write(int(frame.register).to_bytes(1))
-                self.__write_values(frame)
+            case FrameType.REGISTER | FrameType.RESPONSE:
+                if not isinstance(frame.register, Register):
+                    frame.register = parse_register(frame.register)
+                buffer += b'R' if frame.frame_type == FrameType.REGISTER else b'r'
+                buffer.append(frame.register.id)
+                self.__encode_values(frame, buffer)
             case FrameType.SYNC:
-                self.connection.write(b'S')
-                self.connection.write(int(1 if self._in_sync else 0).to_bytes(1))
+                buffer += b'S'
+                buffer.append(1 if self._in_sync else 0)
             case FrameType.ALERT:
-                self.connection.write(b'A')
-                self.connection.write(str(frame.alert).encode('ascii'))
-            case FrameType.RESPONSE:
-                self.connection.write(b'r')
-                self.connection.write(int(frame.register).to_bytes(1))
-                self.__write_values(frame)
+                buffer += b'A'
+                buffer += str(frame.alert).encode('ascii')
             case FrameType.TELEMETRY:
-                self.connection.write(b'T')
-                self.connection.write(int(frame.telemetryid).to_bytes(1))
-                self.__write_values(frame) # todo finish this, telemetry isn't a single register - don't really need to write telemetry frames though for normal use
+                buffer += b'T'
+                buffer.append(frame.telemetryid)
+                header = getattr(frame, 'header', None)
+                if header is not None and frame.values is not None:
+                    buffer += self.__telemetry_decoder(header).pack(*frame.values)
             case FrameType.HEADER:
-                self.connection.write(b'H')
-                self.connection.write(int(frame.telemetryid).to_bytes(1))
+                buffer += b'H'
+                buffer.append(frame.telemetryid)
                 for i in range(0, len(frame.registers)):
-                    self.connection.write(frame.motors[i].to_bytes(1))
-                    self.connection.write(frame.registers[i].id.to_bytes(1))
-        self._echosubject.on_next(frame)
+                    buffer.append(frame.motors[i])
+                    buffer.append(int(frame.registers[i]))
+        size = len(buffer) - start - 2
+        if size > 255:
+            raise ValueError("Frame too large: {} bytes".format(size))
+        buffer[start + 1] = size
+
+    def __encode_values(self, frame, buffer):
+        values = frame.values
+        if values is None or len(values) == 0:
+            return
+        if frame.register == SimpleFOCRegisters.REG_TELEMETRY_REG:
+            if isinstance(values[0], (list, tuple)):
+                # motor/register pairs, as returned when parsing telemetry register responses
+                buffer.append(len(values))
+                for m, r in values:
+                    buffer.append(int(m))
+                    buffer.append(int(r))
+            else:
+                buffer += bytes([int(v) for v in values])
+            return
+        # register frames carry values to write, response frames carry the values read from the register
+        encoder, converters = self.__value_encoder(frame.register, frame.frame_type == FrameType.RESPONSE)
+        buffer += encoder.pack(*[convert(v) for convert, v in zip(converters, values)])
+
+    def __value_encoder(self, reg, response=False):
+        # the encoding templates for each register are precomputed from its write (or read) types
+        encoder = self._value_encoders.get((reg.id, response))
+        if encoder is None:
+            types = reg.read_types if response else reg.write_types
+            for t in types:
+                if t not in ('f', 'i', 'b'):
+                    raise Exception("Unsupported value type")
+            fmt = reg.read_format() if response else reg.write_format()
+            encoder = (struct.Struct('<' + fmt), [float if t == 'f' else int for t in types])
+            self._value_encoders[(reg.id, response)] = encoder
+        return encoder
 
     def parse_telemetry(self, packet, header):
         packet.header = header
         values = []
-        #print("Parsing telemetry ", packet)
+        payload = getattr(packet, 'payload', None) # the raw bytes are kept, so parsing again is harmless
+        if payload is None:
+            payload = packet.values
         if header is not None:
-            pos = 0
-            for reg in header.registers:
-                # TODO some registers can't be used in telemetry, should we check for that here?
-                for t in reg.read_types:
-                    val, size = self.__parse_value(packet.values, pos, t)
-                    pos += size
-                    values.append(val)
+            decoder = self.__telemetry_decoder(header)
+            if len(payload) >= decoder.size:
+                values = list(decoder.unpack_from(payload))
+            else:
+                values = self.__parse_telemetry_values(payload, header) # short frame, missing values are None
+                self.metrics.telemetry_errors += 1
         packet.values = values
-        #print("Parsed telemetry ", packet)
         return packet
 
-    def __write_values(self, frame, offset=0):
-        if frame.values is not None and len(frame.values) > 0:
-            if frame.register == SimpleFOCRegisters.REG_TELEMETRY_REG:
-                for i in range(0, len(frame.values)):
-                    self.connection.write(int(frame.values[i]).to_bytes(1))
-            else:
-                for i, t in enumerate(frame.register.write_types):
-                    match t:
-                        case 'f':
-                            self.connection.write(struct.pack('<f', float(frame.values[offset+i])))
-                        case 'i':
-                            self.connection.write(int(frame.values[offset+i]).to_bytes(4, 'little'))
-                        case 'b':
-                            self.connection.write(int(frame.values[offset+i]).to_bytes(1))
-                        case _:
-                            raise Exception("Unsupported value type")
-
-    def __frame_size(self, frame):
-        match frame.frame_type:
-            case FrameType.REGISTER:
-                size = 2  # type, register
-                if not isinstance(frame.register, Register):
-                    frame.register = Register.by_id(frame.register)
-                if frame.values is not None and len(frame.values) > 0:
-                    if frame.register == SimpleFOCRegisters.REG_TELEMETRY_REG:
-                        size += len(frame.values)
-                    else:
-                        size += sum((1 if t == 'b' else 4) for t in frame.register.write_types)
-                return size
-            case FrameType.SYNC:
-                return 2  # type, status byte
-            case FrameType.ALERT:
-                return 1 + len(frame.alert)
-            case FrameType.RESPONSE:
-                size = 2  # type, register
-                if not isinstance(frame.register, Register):
-                    frame.register = Register.by_id(frame.register)
-                if frame.values is not None and len(frame.values) > 0:
-                    if frame.register == SimpleFOCRegisters.REG_TELEMETRY_REG:
-                        size += 1 + len(frame.values)
-                    else:
-                        size += sum((1 if t == 'b' else 4) for t in frame.register.write_types)
-                return size
-            case FrameType.TELEMETRY:
-                size = 2
-                # todo correct length for TELEMETRY frame... but writing telemetry isn't really needed for normal use
-                return size
-            case FrameType.HEADER:
-                size = 1 + 2 * len(frame.registers)
-                return size
-
-    def __processByte(self, byte):
-        if byte == MARKER:
-            if self._expected == 0:
-                if self._marker:
-                    self._expected = byte
-                    self._marker = False
+    def parse_telemetry_batch(self, packets, header):
+        """ Decode a list of telemetry frames for the same header at once, see decode_telemetry_batch() """
+        return decode_telemetry_batch([p.values if getattr(p, 'payload', None) is None else p.payload for p in packets],
+                                      header, metrics=self.metrics)
+
+    def __telemetry_decoder(self, header):
+        # the decoder for each telemetry id is compiled once from the header's register types, and
+        # recompiled when a new header frame is received for that id
+        cached = self._telemetry_decoders.get(header.telemetryid)
+        if cached is not None and cached[0] is header:
+            return cached[1]
+        # TODO some registers can't be used in telemetry, should we check for that here?
+        decoder = struct.Struct('<' + ''.join([reg.read_format() for reg in header.registers]))
+        self._telemetry_decoders[header.telemetryid] = (header, decoder)
+        return decoder
+
+    def __parse_telemetry_values(self, buffer, header):
+        values = []
+        pos = 0
+        for reg in header.registers:
+            for t in reg.read_types:
+                val, size = self.__parse_value(buffer, pos, t)
+                pos += size
+                values.append(val)
+        return values
+
+    def _process_bytes(self, data):
+        """ Scan a chunk of received bytes, and return the list of frames completed by it.
+
+            This is equivalent to feeding the bytes one at a time through the framing state machine, but
+            frame payloads are copied in bulk using the length byte, and the marker is located with find()
+            while hunting for sync. Partial frames are kept in self._buffer until the next chunk arrives.
+            As before, a frame is only complete once the marker of the following frame has been received.
+        """
+        frames = []
+        buffer = self._buffer
+        timestamp = time.monotonic_ns()
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._expected > 0:
+                need = self._expected - len(buffer)
+                if need > 0:
+                    if len(buffer) == 0 and pos + need < end and data[pos + need] == MARKER:
+                        # the whole frame is in this chunk, parse it without going through the buffer
+                        frames.append(self.__complete_frame(data[pos:pos + need], timestamp))
+                        pos += need + 1
+                        continue
+                    chunk = data[pos:pos + need]
+                    buffer += chunk
+                    pos += len(chunk)
+                    continue
+                if data[pos] == MARKER:
+                    frames.append(self.__complete_frame(buffer, timestamp))
                 else:
+                    print("WARNING: buffer overrun") # TODO logging
+                    self.metrics.overruns += 1
+                    self.metrics.resyncs += 1
                     self._in_sync = False
-                    self._marker = True
-                    self._buffer.clear()
-                return None
-            if len(self._buffer) == self._expected:
-                self._in_sync = True
-                frame = self.__parseFrame(self._buffer)
-                if frame is None:
-                    print("WARNING: failed to parse frame: ", self._buffer) # TODO logging
-                    self._in_sync = False
-                #else:
-                #    print("Parsed frame: ", frame.frame_type)
-                self._expected = 0
-                self._marker = True
-                self._buffer.clear()
-                return frame
+                    self._expected = 0
+                    buffer.clear()
+                pos += 1
+            elif self._marker:
+                self._expected = data[pos]
+                self._marker = False
+                pos += 1
             else:
-                self._buffer.append(byte)
-                return None
-        elif ( len(self._buffer) >= self._expected and self._expected > 0 ) or len(self._buffer) >= 255:
-            print("WARNING: buffer overrun") # TODO logging
+                # out of sync, look for the next marker and discard everything before it
+                idx = data.find(MARKER, pos)
+                if idx < 0:
+                    idx = end
+                if idx > pos:
+                    buffer += data[pos:idx]
+                    overruns = len(buffer) // 256
+                    if overruns > 0:
+                        for i in range(overruns):
+                            print("WARNING: buffer overrun") # TODO logging
+                        self.metrics.overruns += overruns
+                        self._in_sync = False
+                        del buffer[:len(buffer) - len(buffer) % 256]
+                if idx < end:
+                    self._in_sync = False
+                    self._marker = True
+                    buffer.clear()
+                pos = idx + 1
+        return [f for f in frames if f is not None]
+
+    def __complete_frame(self, buffer, timestamp=None):
+        self._in_sync = True
+        try:
+            frame = self.__parseFrame(buffer, timestamp)
+        except (IndexError, struct.error, UnicodeDecodeError):
+            frame = None    # truncated or garbled frame
+        if frame is not None:
+            self.metrics.frames_in_by_code[buffer[0]] += 1
+        else:
+            print("WARNING: failed to parse frame: ", buffer) # TODO logging
+            self.metrics.parse_errors += 1
+            self.metrics.resyncs += 1
             self._in_sync = False
-            self._expected = 0
-            self._buffer.clear()
-            return None
-        if self._marker:
-            self._expected = byte
-            self._marker = False
-            return None
-        self._buffer.append(byte)
-        return None
+        self._expected = 0
+        self._marker = True
+        self._buffer.clear()
+        return frame
     
-    def __parseFrame(self, buffer):
+    def __parseFrame(self, buffer, timestamp=None):
         if buffer[0] == ord('R'):
             reg = SimpleFOCRegisters.by_id(buffer[1])
+            if reg is None:
+                self.metrics.unknown_registers += 1
+                return None
             values = []
             pos = 2
             if reg == SimpleFOCRegisters.REG_TELEMETRY_REG:       #TODO extract this to a function
@@ -392,9 +699,12 @@ class BinaryComms(Comms):
                     val, size = self.__parse_value(buffer, pos, t)
                     pos += size
                     values.append(val)
-            return Frame(frame_type=FrameType.REGISTER, register=reg, values=values)
+            return RegisterFrame(FrameType.REGISTER, reg, values, timestamp=timestamp)
         if buffer[0] == ord('r'):
             reg = SimpleFOCRegisters.by_id(buffer[1])
+            if reg is None:
+                self.metrics.unknown_registers += 1
+                return None
             values = []
             pos = 2
             if reg == SimpleFOCRegisters.REG_TELEMETRY_REG:       #TODO extract this to a function
@@ -410,10 +720,11 @@ class BinaryComms(Comms):
                     val, size = self.__parse_value(buffer, pos, t)
                     pos += size
                     values.append(val)
-            return Frame(frame_type=FrameType.RESPONSE, register=reg, values=values)
+            return RegisterFrame(FrameType.RESPONSE, reg, values, timestamp=timestamp)
         if buffer[0] == ord('T'):
             id = buffer[1] # we can read the id byte, but we don't yet have the header to parse the values
-            return Frame(frame_type=FrameType.TELEMETRY, telemetryid=id, values=buffer[2:])
+            payload = bytes(buffer[2:])
+            return TelemetryFrame(id, payload, payload=payload, timestamp=timestamp)
         if buffer[0] == ord('H'):
             telemetryid = buffer[1]
             registers = []
@@ -421,13 +732,15 @@ class BinaryComms(Comms):
             for i in range(2, len(buffer), 2):
                 motors.append(buffer[i])
                 registers.append(SimpleFOCRegisters.by_id(buffer[i+1]))
-            return Frame(frame_type=FrameType.HEADER, telemetryid=telemetryid, registers=registers, motors=motors)
+                if registers[-1] is None:
+                    self.metrics.unknown_registers += 1
+            return HeaderFrame(telemetryid, registers, motors, timestamp=timestamp)
         if buffer[0] == ord('S'):
             remote_in_sync = (buffer[1] != 0)
-            return Frame(frame_type=FrameType.SYNC, values=[remote_in_sync])
+            return SyncFrame([remote_in_sync], timestamp=timestamp)
         if buffer[0] == ord('A'):
             alert = buffer[1:].decode('ascii')
-            return Frame(frame_type=FrameType.ALERT, alert=alert)
+            return AlertFrame(alert, timestamp=timestamp)
         return None
 
     def __parse_value(self, buffer, pos, t):
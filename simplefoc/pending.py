@@ -0,0 +1,184 @@
+#
+# Correlation of requests and their responses
+#
+# Pending requests are futures, kept in a table keyed by whatever identifies the response (e.g. motor id
+# and register), so any number of requests can be in flight and each incoming response is matched in O(1).
+# Timeouts for all pending requests are handled by a single shared timer wheel thread.
+#
+
+import threading, time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+
+
+
+class TimerWheel:
+    """ A hashed timer wheel, serviced by a single background thread
+
+        Timers are placed in one of the wheel's slots according to their deadline. The thread advances through
+        the slots once per tick, and fires the timers which have expired. Scheduling and cancelling are O(1),
+        and the thread only runs while there are timers scheduled.
+
+        @param tick: the resolution of the timers, in seconds
+        @param slots: the number of slots in the wheel
+    """
+    def __init__(self, tick=0.005, slots=512):
+        self.tick = tick
+        self.slots = slots
+        self._wheel = [set() for i in range(slots)]
+        self._timers = {}
+        self._count = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._last_tick = None
+
+    def schedule(self, delay, callback):
+        """ Call callback() after delay seconds, on the timer thread. Returns a timer which can be cancelled. """
+        deadline = time.monotonic() + delay
+        with self._condition:
+            tick = int(deadline / self.tick) + 1
+            if self._last_tick is not None and tick <= self._last_tick:
+                tick = self._last_tick + 1
+            timer = [deadline, callback, tick % self.slots]
+            self._wheel[timer[2]].add(id(timer))
+            self._timers[id(timer)] = timer
+            self._count += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return timer
+
+    def cancel(self, timer):
+        with self._condition:
+            if self._timers.pop(id(timer), None) is not None:
+                self._wheel[timer[2]].discard(id(timer))
+                self._count -= 1
+
+    def __run(self):
+        while True:
+            expired = []
+            with self._condition:
+                while self._count == 0:
+                    self._last_tick = None
+                    self._condition.wait()
+                if self._last_tick is None:
+                    self._last_tick = int(time.monotonic() / self.tick)
+                now = time.monotonic()
+                current = int(now / self.tick)
+                # visit each slot passed since the last tick, at most once around the wheel
+                for tick in range(max(self._last_tick + 1, current - self.slots + 1), current + 1):
+                    slot = self._wheel[tick % self.slots]
+                    for key in list(slot):
+                        timer = self._timers[key]
+                        if timer[0] <= now:
+                            slot.discard(key)
+                            del self._timers[key]
+                            self._count -= 1
+                            expired.append(timer)
+                self._last_tick = current
+            for timer in expired:
+                timer[1]()
+            time.sleep(self.tick)
+
+
+TIMERS = TimerWheel()
+
+
+
+class PendingRequests:
+    """ Table of pending requests, each represented by a concurrent.futures.Future
+
+        Several requests may be pending for the same key, they are resolved in the order they were made.
+
+        @param timers: the TimerWheel to use for the timeouts, by default the shared one
+    """
+    def __init__(self, timers=None):
+        self._timers = timers if timers is not None else TIMERS
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def expect(self, key, timeout=None) -> Future:
+        """ Add a pending request for key, and return its future.
+            If timeout is given, the future fails with a TimeoutError if it is not resolved within timeout seconds.
+        """
+        future = Future()
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = deque()
+            pending.append(future)
+        if timeout is not None:
+            timer = self._timers.schedule(float(timeout), lambda: self.__expire(key, future))
+            future.add_done_callback(lambda f: self._timers.cancel(timer))
+        return future
+
+    def resolve(self, key, value) -> bool:
+        """ Resolve the oldest pending request for key with value. Returns False if there was no pending request. """
+        while True:
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    return False
+                future = pending.popleft()
+                if len(pending) == 0:
+                    del self._pending[key]
+            try:
+                future.set_result(value)
+                return True
+            except InvalidStateError:
+                pass    # cancelled or timed out in the meantime, try the next one
+
+    def cancel_all(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        for futures in pending.values():
+            for f in futures:
+                f.cancel()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(p) for p in self._pending.values())
+
+    def __expire(self, key, future):
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None and future in pending:
+                pending.remove(future)
+                if len(pending) == 0:
+                    del self._pending[key]
+        try:
+            future.set_exception(TimeoutError("No response for {}".format(key)))
+        except InvalidStateError:
+            pass
+
+
+
+def gather(futures) -> Future:
+    """ Combine several futures into one, which resolves to the list of their results, in the same order.
+        It fails with the exception of the first of the futures to fail.
+    """
+    combined = Future()
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+    def done(f):
+        try:
+            f.result()
+        except BaseException as e:
+            try:
+                combined.set_exception(e)
+            except InvalidStateError:
+                pass
+            return
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            combined.set_result([f.result() for f in futures])
+    if len(futures) == 0:
+        combined.set_result([])
+    for f in futures:
+        f.add_done_callback(done)
+    return combined
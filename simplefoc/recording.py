@@ -0,0 +1,342 @@
+#
+# Recording and replay of SimpleFOC telemetry
+#
+# Recordings are append-only binary files containing the telemetry HEADER frames and the raw TELEMETRY
+# payloads, each with its timestamp. A sidecar index file (the recording's path plus ".idx") holds a time
+# index, so that a recording can be opened via mmap and positioned to any point in time without scanning it:
+#
+#   recorder = motors.telemetry().record('capture.sftr')
+#   ...
+#   recorder.close()
+#
+#   motors = simplefoc.recording.replay('capture.sftr', speed=10.0)
+#   motors.telemetry().observable().subscribe(print)
+#   motors.connect()
+#
+# File layout, all values little-endian:
+#   file header:  b'SFTR', version (uint8), 3 reserved bytes, wall clock time_ns (int64), monotonic_ns (int64)
+#                 at the start of the recording
+#   records:      type (b'H' or b'T'), telemetry id (uint8), payload length (uint16), timestamp in
+#                 monotonic ns (int64), payload. Header payloads are (motor, register id) byte pairs, as in
+#                 the binary protocol, and telemetry payloads are the binary encoded values.
+#   index:        entries of timestamp (int64), file offset (uint64). At each index point the recorder writes
+#                 the current headers again, so reading can start at any indexed offset.
+#
+# Telemetry received via the ASCII protocol is encoded to the binary format when it is recorded.
+#
+
+import mmap, os, struct, threading, time
+from bisect import bisect_right
+from simplefoc import FrameType, HeaderFrame, TelemetryFrame
+from .registers import SimpleFOCRegisters
+from .packets import BinaryComms
+from .motors import Motors
+
+
+MAGIC = b'SFTR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB3xqq')
+RECORD = struct.Struct('<cBHq')
+INDEX_ENTRY = struct.Struct('<qQ')
+INDEX_SUFFIX = '.idx'
+
+
+
+def replay(path, speed=1.0, start=None, end=None) -> Motors:
+    """ Replay a recording, and return a Motors instance to receive its telemetry.
+
+        The replay starts when you call motors.connect(). Commands sent to the motors are ignored.
+
+        @param path: the recording file
+        @param speed: 1.0 to replay at the original speed, N to replay N times faster, or None to replay
+                      as fast as possible
+        @param start: the time to start from, in seconds since the start of the recording
+        @param end: the time to stop at, in seconds since the start of the recording
+    """
+    return Motors(ReplayComms(Recording(path), speed, start, end))
+
+
+
+class Recorder:
+    """ Writes telemetry HEADER and TELEMETRY frames to a recording file, see the top of this module.
+
+        Frames can be written by calling write(frame), or the recorder can subscribe to an observable of frames.
+        Typically, you will get a Recorder by calling telemetry.record(path), which records all the telemetry
+        received on the connection.
+
+        @param path: the recording file to create, the index is written to path + ".idx"
+        @param index_interval: the time between index points, in seconds
+        @param source: an observable of frames to record, or None
+    """
+    def __init__(self, path, index_interval=1.0, source=None):
+        self.path = path
+        self.index_interval = int(index_interval * 1e9)
+        self.frames_written = 0
+        self._file = open(path, 'wb')
+        self._index = open(path + INDEX_SUFFIX, 'wb')
+        self._offset = self._file.write(FILE_HEADER.pack(MAGIC, VERSION, time.time_ns(), time.monotonic_ns()))
+        self._headers = {}
+        self._encoders = {}
+        self._next_index = None
+        self._lock = threading.Lock()
+        self._subscription = None
+        if source is not None:
+            self._subscription = source.subscribe(self.write)
+
+    def write(self, frame):
+        """ Record a frame. Frames other than HEADER and TELEMETRY frames are ignored. """
+        if frame.frame_type != FrameType.HEADER and frame.frame_type != FrameType.TELEMETRY:
+            return
+        with self._lock:
+            if self._file is None:
+                return
+            if self._next_index is None or frame.timestamp >= self._next_index:
+                self.__write_index(frame.timestamp)
+            if frame.frame_type == FrameType.HEADER:
+                self._headers[frame.telemetryid] = frame
+                self.__write_header(frame, frame.timestamp)
+            else:
+                header = getattr(frame, 'header', None)
+                if header is not None and self._headers.get(frame.telemetryid) is not header:
+                    # parsed telemetry, e.g. from telemetry.observable(), carries its header
+                    self._headers[frame.telemetryid] = header
+                    self.__write_header(header, frame.timestamp)
+                self.__write_record(b'T', frame.telemetryid, frame.timestamp, self.__payload(frame))
+            self.frames_written += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._index.flush()
+
+    def close(self):
+        if self._subscription is not None:
+            self._subscription.dispose()
+            self._subscription = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._index.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __payload(self, frame):
+        payload = getattr(frame, 'payload', None)
+        if isinstance(payload, (bytes, bytearray)):
+            return payload
+        values = frame.values   # ASCII telemetry is parsed on first use
+        header = self._headers.get(frame.telemetryid)
+        if header is None:
+            return b''  # no header to encode the values with
+        cached = self._encoders.get(frame.telemetryid)
+        if cached is None or cached[0] is not header:
+            types = ''.join(''.join(reg.read_types) for reg in header.registers)
+            fmt = struct.Struct('<' + ''.join(reg.read_format() for reg in header.registers))
+            cached = (header, fmt, [float if t == 'f' else int for t in types])
+            self._encoders[frame.telemetryid] = cached
+        header, fmt, converters = cached
+        if len(values) != len(converters) or any(v is None for v in values):
+            return b''  # incomplete sample
+        return fmt.pack(*[convert(v) for convert, v in zip(converters, values)])
+
+    def __write_index(self, timestamp):
+        self._index.write(INDEX_ENTRY.pack(timestamp, self._offset))
+        for header in self._headers.values():
+            self.__write_header(header, timestamp)
+        self._next_index = timestamp + self.index_interval
+
+    def __write_header(self, header, timestamp):
+        payload = bytearray()
+        for motor, reg in zip(header.motors, header.registers):
+            payload.append(motor)
+            payload.append(int(reg))
+        self.__write_record(b'H', header.telemetryid, timestamp, payload)
+
+    def __write_record(self, type, telemetryid, timestamp, payload):
+        self._file.write(RECORD.pack(type, telemetryid, len(payload), timestamp))
+        self._file.write(payload)
+        self._offset += RECORD.size + len(payload)
+
+
+
+class Recording:
+    """ A recording file, opened for reading via mmap.
+
+        Times are given in seconds since the start of the recording, frame timestamps are the recorded
+        monotonic ns values. Use wall_time(timestamp) to convert them to wall clock time.
+
+        If the index file is missing, it is rebuilt by scanning the recording.
+
+        @param path: the recording file
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._wall_ns, self._mono_ns = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a SimpleFOC telemetry recording: {}".format(path))
+        self.__load_index()
+        self.start_time = self._timestamps[0] if len(self._timestamps) > 0 else self._mono_ns
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self.frames()
+
+    def duration(self):
+        """ Return the time between the first and last records, in seconds """
+        last = None
+        start = self._offsets[-1] if len(self._offsets) > 0 else FILE_HEADER.size
+        for last in self.__records(start):
+            pass
+        return (last[2] - self.start_time) / 1e9 if last is not None else 0.0
+
+    def wall_time(self, timestamp):
+        """ Convert a recorded timestamp to wall clock time, in seconds since the epoch """
+        return (self._wall_ns + timestamp - self._mono_ns) / 1e9
+
+    def seek(self, t):
+        """ Return the file offset of the last index point at or before time t """
+        i = bisect_right(self._timestamps, self.start_time + int(t * 1e9)) - 1
+        return self._offsets[i] if i >= 0 else FILE_HEADER.size
+
+    def frames(self, start=None, end=None):
+        """ Iterate over the recorded frames, optionally from time start until time end.
+
+            Header frames are always returned, so the telemetry can be decoded. Telemetry frames are
+            returned undecoded, with the raw payload as their values, as received from BinaryComms.
+        """
+        offset = self.seek(start) if start is not None else FILE_HEADER.size
+        start_ns = self.start_time + int(start * 1e9) if start is not None else None
+        end_ns = self.start_time + int(end * 1e9) if end is not None else None
+        headers = {}
+        for type, telemetryid, timestamp, payload in self.__records(offset):
+            if end_ns is not None and timestamp >= end_ns:
+                return
+            if type == b'H':
+                header = headers.get(telemetryid)
+                if header is not None and header.motors == list(payload[0::2]) and [r.id for r in header.registers] == list(payload[1::2]):
+                    continue    # repeated at an index point
+                header = HeaderFrame(telemetryid, [SimpleFOCRegisters.by_id(r) for r in payload[1::2]], list(payload[0::2]), timestamp=timestamp)
+                headers[telemetryid] = header
+                yield header
+            elif start_ns is None or timestamp >= start_ns:
+                payload = bytes(payload)
+                yield TelemetryFrame(telemetryid, payload, payload=payload, timestamp=timestamp)
+
+    def __records(self, offset):
+        data = self._mmap
+        size = len(data)
+        while offset + RECORD.size <= size:
+            type, telemetryid, length, timestamp = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + length > size:
+                return  # incomplete last record
+            yield type, telemetryid, timestamp, memoryview(data)[offset:offset + length]
+            offset += length
+
+    def __load_index(self):
+        self._timestamps = []
+        self._offsets = []
+        size = len(self._mmap)
+        try:
+            with open(self.path + INDEX_SUFFIX, 'rb') as f:
+                index = f.read()
+            for timestamp, offset in INDEX_ENTRY.iter_unpack(index[:len(index) - len(index) % INDEX_ENTRY.size]):
+                if offset < size:
+                    self._timestamps.append(timestamp)
+                    self._offsets.append(offset)
+        except FileNotFoundError:
+            self.__rebuild_index()
+
+    def __rebuild_index(self):
+        # the recorder writes the headers again at each index point, so runs of header records are index points
+        offset = FILE_HEADER.size
+        previous = None
+        for type, telemetryid, timestamp, payload in self.__records(offset):
+            if type == b'H' and previous != b'H' or previous is None:
+                self._timestamps.append(timestamp)
+                self._offsets.append(offset)
+            previous = type
+            offset += RECORD.size + len(payload)
+
+
+
+class ReplayComms(BinaryComms):
+    """ Replays a recording as if it was received from a driver, for use with Motors and Telemetry.
+
+        Frames are emitted by a thread started on connect(), paced according to their recorded timestamps.
+        The observable completes when the end of the replay is reached. Sent frames are ignored.
+
+        @param recording: the Recording to replay
+        @param speed: 1.0 to replay at the original speed, N to replay N times faster, or None to replay
+                      as fast as possible
+        @param start: the time to start from, in seconds since the start of the recording
+        @param end: the time to stop at, in seconds since the start of the recording
+    """
+    def __init__(self, recording, speed=1.0, start=None, end=None):
+        super().__init__(None, None)
+        self.recording = recording
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self._completed = False
+
+    def connect(self):
+        self.is_running = True
+        self._read_thread = threading.Thread(target=self.__run, daemon=True)
+        self._read_thread.start()
+
+    def disconnect(self):
+        self.is_running = False
+        thread = getattr(self, '_read_thread', None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.__complete()
+
+    def wait(self, timeout=None):
+        """ Wait until the replay has finished """
+        self._read_thread.join(timeout)
+
+    def send_frame(self, frame):
+        pass
+
+    def send_frames(self, frames):
+        pass
+
+    def __complete(self):
+        if not self._completed:
+            self._completed = True
+            self._subject.on_completed()
+
+    def __run(self):
+        first = None
+        began = time.monotonic_ns()
+        for frame in self.recording.frames(self.start, self.end):
+            if not self.is_running:
+                return
+            if self.speed is not None and frame.frame_type == FrameType.TELEMETRY:
+                if first is None:
+                    first = frame.timestamp
+                delay = (frame.timestamp - first) / self.speed - (time.monotonic_ns() - began)
+                if delay > 1000000:
+                    time.sleep(delay / 1e9)
+            self._subject.on_next(frame)
+        self.is_running = False
+        self.__complete()
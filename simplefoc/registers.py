@@ -5,6 +5,20 @@ SIZES = {
     'f': 4 
 }
 
+# struct module format characters for the register value types, used with little-endian byte order
+FORMATS = {
+    'b': 'B',
+    'i': 'I',
+    'f': 'f'
+}
+
+# numpy dtypes for the register value types
+DTYPES = {
+    'b': 'u1',
+    'i': '<u4',
+    'f': '<f4'
+}
+
 class Register:
     """ 
         Register class 
@@ -48,14 +62,26 @@ class Register:
     def __int__(self):
         return self.id
 
+    def __reduce__(self):
+        # unpickle as the registered instance, e.g. for frames passed between processes
+        return (_unpickle_register, (self.name, self.id, self.read_types, self.write_types))
+
     def read_size(self):
         return sum([SIZES[t] for t in self.read_types])
     
     def write_size(self):
         return sum([SIZES[t] for t in self.write_types])
 
+    def read_format(self):
+        """ Return the struct format characters (without byte order) for the values read from this register """
+        return ''.join([FORMATS[t] for t in self.read_types])
+
+    def write_format(self):
+        """ Return the struct format characters (without byte order) for the values written to this register """
+        return ''.join([FORMATS[t] for t in self.write_types])
+
     def short_name(self):
-        self.name[4:] if self.name.startswith('REG_') else self.name
+        return self.name[4:] if self.name.startswith('REG_') else self.name
 
 
 class SimpleFOCRegisters(object):
@@ -75,22 +101,43 @@ class SimpleFOCRegisters(object):
             SimpleFOCRegisters.add_register('REG_MY_REGISTER', 0x80, ['f'], ['f'])
 
     """
+    _by_id = {}
+    _by_name = {}
+
     @classmethod
-    def add_register(cls, name, id, read_types, write_types):
+    def add_register(cls, name, id, read_types, write_types=None):
+        if write_types is None:
+            write_types = []
         if getattr(cls, name, None) is not None:
             raise Exception("Register {} already exists".format(name))
-        for n, r in cls.items():
-            if r.id == id:
-                raise Exception("Can't add register {}, the id {} already exists as: {}".format(name, id, n))
-        setattr(cls, name, Register(name, id, read_types, write_types))
-
-    def by_id(id:int):
-        for k in SimpleFOCRegisters.__dict__:      # TODO improve this
-            r = SimpleFOCRegisters.__dict__[k]
-            if isinstance(r, Register) and r.id == id:
-                return r
-        print("WARNING: Register id {} not found".format(id))
-        return None
+        if id in cls._by_id:
+            raise Exception("Can't add register {}, the id {} already exists as: {}".format(name, id, cls._by_id[id].name))
+        reg = Register(name, id, read_types, write_types)
+        setattr(cls, name, reg)
+        cls._index(reg)
+        return reg
+
+    @classmethod
+    def by_id(cls, id:int):
+        r = cls._by_id.get(id)
+        if r is None:
+            print("WARNING: Register id {} not found".format(id))
+        return r
+
+    @classmethod
+    def by_name(cls, name:str):
+        """ Return the register with the given name, e.g. 'REG_STATUS', or None if there is no such register """
+        return cls._by_name.get(name)
+
+    @classmethod
+    def registers(cls):
+        """ Return a list of all the registers, including any added with add_register(), ordered by id """
+        return sorted(cls._by_id.values(), key=lambda r: r.id)
+
+    @classmethod
+    def _index(cls, reg):
+        cls._by_id[reg.id] = reg
+        cls._by_name[reg.name] = reg
 
     REG_STATUS = Register('REG_STATUS',0x00,['b'],[])
     REG_MOTOR_ADDRESS = Register('REG_MOTOR_ADDRESS',0x01,['b'],['b'])
@@ -158,6 +205,11 @@ class SimpleFOCRegisters(object):
     REG_SYS_TIME = Register('REG_SYS_TIME',0x71,['i'],[])
 
 
+for _reg in list(vars(SimpleFOCRegisters).values()):
+    if isinstance(_reg, Register):
+        SimpleFOCRegisters._index(_reg)
+del _reg
+
 
 def parse_register(regstr:str|int):
     """ Parse a register string or int to a Register object """
@@ -169,8 +221,15 @@ def parse_register(regstr:str|int):
         return SimpleFOCRegisters.by_id(int(regstr, 16))
     if regstr.isdigit():
         return SimpleFOCRegisters.by_id(int(regstr))
-    if regstr.startswith('REG_'):
-        return SimpleFOCRegisters.__getattribute__(SimpleFOCRegisters, regstr.upper())
-    return SimpleFOCRegisters.__getattribute__(SimpleFOCRegisters, "REG_"+regstr.upper())
-
-        
+    name = regstr.upper() if regstr.upper().startswith('REG_') else "REG_"+regstr.upper()
+    reg = SimpleFOCRegisters.by_name(name)
+    if reg is None:
+        raise AttributeError("Unknown register: {}".format(regstr))
+    return reg
+
+
+def _unpickle_register(name, id, read_types, write_types):
+    reg = SimpleFOCRegisters._by_id.get(id)
+    if reg is None or reg.name != name:
+        return Register(name, id, read_types, write_types)
+    return reg
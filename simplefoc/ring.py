@@ -0,0 +1,284 @@
+#
+# Ring buffer of telemetry samples in shared memory
+#
+# One process writes timestamped samples into the ring, and any number of readers, in the same or in other
+# processes, read them without copying: they get numpy views of the shared memory. The writer never waits
+# for the readers. Two counters in the ring tell the readers what happened since they last looked:
+#
+#  - the sequence counts the samples written. A reader which falls more than the capacity behind has been
+#    lapped, it skips the overwritten samples and counts them in lost.
+#  - the generation counts the header changes. The registers and motors of the value columns are kept in
+#    the ring, and when they change, the samples written before the change are no longer given to readers.
+#
+#   ring = SharedRing(create=True, capacity=65536)     # writer
+#   ring = SharedRing(name)                            # reader, e.g. in another process
+#   reader = ring.reader()
+#   timestamps, values = reader.read()
+#
+
+from multiprocessing import shared_memory, resource_tracker
+from .registers import SimpleFOCRegisters
+from .telemetry import column_name, np
+from simplefoc import HeaderFrame
+
+
+RING_CAPACITY = 65536
+RING_WIDTH = 16
+
+_MAGIC = 0x52464f4653        # marks the memory block as a SharedRing
+# slots of the int64 control block at the start of the shared memory
+_MAGIC_SLOT, _CAPACITY, _WIDTH, _SEQUENCE, _WRITING, _GENERATION, _GENERATION_START, _REGISTERS, _TELEMETRYID, _ERRORS = range(10)
+_CONTROL_SIZE = 16
+
+
+
+class SharedRing:
+    """ Single writer ring buffer of timestamped telemetry samples in multiprocessing.shared_memory
+
+        Each sample is an int64 timestamp (time.monotonic_ns(), as in the frames) and a row of float64 values,
+        one per register value of the current header, like the columns of a TelemetryBuffer. Values missing
+        from a sample are NaN.
+
+        Create the ring with create=True in the writing process, and open it by name elsewhere. The writer
+        must close() and unlink() the ring when done, the readers only close() it.
+
+        @param name: the name of the shared memory block, None for a new unique name when creating the ring
+        @param create: create a new ring, instead of opening an existing one
+        @param capacity: the number of samples kept, when creating the ring
+        @param width: the maximum number of values per sample, when creating the ring
+        @param track: when opening an existing ring, register it with this process' resource tracker, which
+                      removes it when the process exits. Only processes started by the ring's creator, which
+                      share its resource tracker, should do this.
+    """
+    def __init__(self, name=None, create=False, capacity=RING_CAPACITY, width=RING_WIDTH, track=False):
+        if np is None:
+            raise ModuleNotFoundError("numpy is required for SharedRing, please install it")
+        if create:
+            size = (_CONTROL_SIZE + 2 * width + capacity + capacity * width) * 8
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self._shm = _open_shared_memory(name, track)
+        self._control = np.ndarray((_CONTROL_SIZE,), dtype=np.int64, buffer=self._shm.buf)
+        if create:
+            self._control[:] = 0
+            self._control[_CAPACITY] = capacity
+            self._control[_WIDTH] = width
+            self._control[_MAGIC_SLOT] = _MAGIC
+        elif self._control[_MAGIC_SLOT] != _MAGIC:
+            self._shm.close()
+            raise ValueError("Shared memory {} is not a SharedRing".format(name))
+        self.capacity = capacity = int(self._control[_CAPACITY])
+        self.width = width = int(self._control[_WIDTH])
+        offset = _CONTROL_SIZE * 8
+        self._registers = np.ndarray((width, 2), dtype=np.int64, buffer=self._shm.buf, offset=offset)
+        offset += width * 2 * 8
+        self._timestamps = np.ndarray((capacity,), dtype=np.int64, buffer=self._shm.buf, offset=offset)
+        offset += capacity * 8
+        self._values = np.ndarray((capacity, width), dtype=np.float64, buffer=self._shm.buf, offset=offset)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def sequence(self):
+        """ The number of samples written so far """
+        return int(self._control[_SEQUENCE])
+
+    @property
+    def generation(self):
+        """ The number of header changes so far """
+        return int(self._control[_GENERATION]) // 2
+
+    @property
+    def errors(self):
+        """ Samples the writer could not store, e.g. because they didn't match the header """
+        return int(self._control[_ERRORS])
+
+    @errors.setter
+    def errors(self, value):
+        self._control[_ERRORS] = value
+
+    def set_header(self, header):
+        """ Set the registers and motors of the value columns, from a telemetry header frame.
+            Samples written before are no longer given to the readers.
+        """
+        registers = list(zip(header.registers, header.motors))
+        if any(reg is None for reg, motor in registers):
+            raise ValueError("Header contains unknown registers")
+        if sum(len(reg.read_types) for reg, motor in registers) > self.width:
+            raise ValueError("Header has more values than the ring's width of {}".format(self.width))
+        control = self._control
+        # an odd generation tells the readers the header is being changed
+        control[_GENERATION] += 1
+        for i, (reg, motor) in enumerate(registers):
+            self._registers[i] = (reg.id, motor)
+        control[_REGISTERS] = len(registers)
+        control[_TELEMETRYID] = header.telemetryid
+        control[_GENERATION_START] = control[_SEQUENCE]
+        control[_GENERATION] += 1
+
+    def append(self, timestamps, values):
+        """ Write samples: an array of n timestamps, and an n x k array of values, with k up to the width """
+        n = len(timestamps)
+        if n == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        control = self._control
+        sequence = int(control[_SEQUENCE])
+        # announce the slots about to be overwritten, so readers can tell if their views were overwritten
+        control[_WRITING] = sequence + n
+        if n > self.capacity:
+            # only the last capacity samples fit, the ones before are overwritten straight away
+            timestamps, values = timestamps[-self.capacity:], values[-self.capacity:]
+            sequence += n - self.capacity
+            n = self.capacity
+        start = sequence % self.capacity
+        first = min(n, self.capacity - start)
+        k = values.shape[1]
+        self._timestamps[start:start + first] = timestamps[:first]
+        self._values[start:start + first, :k] = values[:first]
+        if first < n:
+            self._timestamps[:n - first] = timestamps[first:]
+            self._values[:n - first, :k] = values[first:]
+        if k < self.width:
+            self._values[start:start + first, k:] = np.nan
+            if first < n:
+                self._values[:n - first, k:] = np.nan
+        control[_SEQUENCE] = sequence + n
+
+    def append_sample(self, timestamp, values):
+        """ Write a single sample, values is a sequence of up to width numbers """
+        control = self._control
+        sequence = int(control[_SEQUENCE])
+        control[_WRITING] = sequence + 1
+        i = sequence % self.capacity
+        self._timestamps[i] = timestamp
+        self._values[i, :len(values)] = values
+        self._values[i, len(values):] = np.nan
+        control[_SEQUENCE] = sequence + 1
+
+    def reader(self, latest=False) -> 'RingReader':
+        """ Get a reader, starting with the oldest sample available, or with the next sample if latest is true """
+        return RingReader(self, latest)
+
+    def close(self):
+        """ Close this process' access to the ring. Views returned by readers must not be used afterwards. """
+        self._control = self._registers = self._timestamps = self._values = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass    # views are still referenced, the memory is released when they are gone
+
+    def unlink(self):
+        """ Remove the ring, once all processes have closed it. Call this only in the writer. """
+        self._shm.unlink()
+
+
+
+def _open_shared_memory(name, track):
+    if track:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # python 3.13 and later
+    except TypeError:
+        pass
+    # older versions always register the memory with the resource tracker, which would remove the ring
+    # when this process exits, so skip the registration
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+
+class RingReader:
+    """ Reads the samples of a SharedRing in order, without copying them
+
+        read() returns numpy views of the ring's memory, which the writer overwrites once it has gone around
+        the ring. Use the views (or copy them) right away, and call overwritten() afterwards to find out if
+        the writer has overwritten any of them in the meantime.
+
+        lost counts the samples overwritten before they could be read. When the header changes, header and
+        columns are updated and generation is incremented, the samples written before the change are skipped.
+
+        Typically, you will get a RingReader by calling ring.reader()
+
+        @param ring: the SharedRing to read
+        @param latest: start with the next sample written, instead of the oldest one available
+    """
+    def __init__(self, ring, latest=False):
+        self.ring = ring
+        self.lost = 0
+        self.generation = 0
+        self.header = None
+        self.columns = {}
+        self._width = 0
+        self._generation = -1
+        self._block = (0, 0)
+        control = ring._control
+        self.position = int(control[_SEQUENCE]) if latest else max(0, int(control[_WRITING]) - ring.capacity)
+
+    def available(self):
+        """ Return the number of samples waiting to be read """
+        return max(0, self.ring.sequence - self.position)
+
+    def read(self, max_samples=None):
+        """ Return views (timestamps, values) of the next samples, at most up to the end of the ring's memory, so
+            call again until no samples are returned to read all of them. values has one column per value.
+        """
+        ring = self.ring
+        control = ring._control
+        capacity = ring.capacity
+        generation = int(control[_GENERATION])
+        if generation != self._generation:
+            if not self.__update_header(generation):
+                return ring._timestamps[:0], ring._values[:0, :0]
+        sequence = int(control[_SEQUENCE])
+        oldest = int(control[_WRITING]) - capacity
+        if self.position < oldest:
+            self.lost += oldest - self.position
+            self.position = oldest
+        count = sequence - self.position
+        start = self.position % capacity
+        count = min(count, capacity - start)
+        if max_samples is not None:
+            count = min(count, max_samples)
+        count = max(count, 0)
+        self._block = (self.position, count)
+        self.position += count
+        return ring._timestamps[start:start + count], ring._values[start:start + count, :self._width]
+
+    def overwritten(self) -> int:
+        """ Return the number of samples of the last read() which have been overwritten by the writer since """
+        first, count = self._block
+        return max(0, min(count, int(self.ring._control[_WRITING]) - self.ring.capacity - first))
+
+    def __update_header(self, generation):
+        control = self.ring._control
+        if generation % 2 == 1:
+            return False        # being changed, try again next time
+        ids = [(int(r), int(m)) for r, m in self.ring._registers[:int(control[_REGISTERS])]]
+        telemetryid = int(control[_TELEMETRYID])
+        start = int(control[_GENERATION_START])
+        if int(control[_GENERATION]) != generation:
+            return False
+        registers = [SimpleFOCRegisters.by_id(r) for r, m in ids]
+        motors = [m for r, m in ids]
+        if any(reg is None for reg in registers):
+            return False        # registers added with add_register() must also be added in the reading process
+        columns = {}
+        pos = 0
+        for reg, motor in zip(registers, motors):
+            columns[column_name(reg, motor)] = (pos, pos + len(reg.read_types))
+            pos += len(reg.read_types)
+        self.header = HeaderFrame(telemetryid, registers, motors) if generation > 0 else None
+        self.columns = columns
+        self.generation = generation // 2
+        self._width = pos
+        self._generation = generation
+        if self.position < start:
+            self.position = start
+        return True
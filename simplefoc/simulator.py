@@ -0,0 +1,707 @@
+#
+# Simulated SimpleFOC driver, for testing and benchmarking without hardware
+#
+# The simulated driver implements the SimpleFOCRegisters register map for one or more motors, driven by a
+# simple motor model, and speaks the binary or ASCII packet protocol, or the Commander protocol. Telemetry
+# (or Commander monitoring) is generated at loop_rate / downsample samples per second.
+#
+# The driver is attached either via an in-memory object with the pyserial API, which can be passed straight
+# to BinaryComms, ASCIIComms or Commander, via a pseudo-terminal (POSIX only), or via a socket:
+#
+#   motors = simplefoc.simulator.serial()                   # Motors connected to a simulated binary driver
+#   motors.connect()
+#
+#   driver = SimulatedDriver(ProtocolType.ascii, num_motors=2)
+#   motors = Motors(ASCIIComms(driver.port))
+#
+#   driver = SimulatedDriver(COMMANDER)
+#   port_name = driver.pty()                                # e.g. /dev/pts/5, for use with any serial library
+#
+#   driver = SimulatedDriver()
+#   reader, writer = await asyncio.open_connection(sock=driver.socket())    # for simplefoc.aio.streams()
+#
+
+import math, os, select, socket, struct, threading, time
+from .packets import ProtocolType, BinaryComms, ASCIIComms, parse_value, MARKER
+from .registers import SimpleFOCRegisters as regs
+from .motors import Motors
+from .commander import Commander, MonitoringFlags
+from simplefoc import FrameType, RegisterFrame, TelemetryFrame, HeaderFrame, SyncFrame
+
+
+# protocol value for SimulatedDriver, to simulate a driver using the Commander protocol
+COMMANDER = 'commander'
+
+MAX_TELEMETRY_IDS = 8
+
+# initial values of the configuration registers, other registers start at zero
+DEFAULTS = {
+    regs.REG_STATUS.id: [4],    # FOCMotorStatus.motor_ready
+    regs.REG_CONTROL_MODE.id: [2],  # MotionControlType.angle
+    regs.REG_VEL_PID_P.id: [0.5],
+    regs.REG_VEL_PID_I.id: [10.0],
+    regs.REG_VEL_LPF_T.id: [0.005],
+    regs.REG_ANG_PID_P.id: [20.0],
+    regs.REG_VEL_LIMIT.id: [20.0],
+    regs.REG_VEL_MAX_RAMP.id: [1000.0],
+    regs.REG_CURQ_PID_P.id: [3.0],
+    regs.REG_CURQ_PID_I.id: [300.0],
+    regs.REG_CURQ_LPF_T.id: [0.005],
+    regs.REG_CURD_PID_P.id: [3.0],
+    regs.REG_CURD_PID_I.id: [300.0],
+    regs.REG_CURD_LPF_T.id: [0.005],
+    regs.REG_VOLTAGE_LIMIT.id: [12.0],
+    regs.REG_CURRENT_LIMIT.id: [2.0],
+    regs.REG_DRIVER_VOLTAGE_LIMIT.id: [12.0],
+    regs.REG_PWM_FREQUENCY.id: [25000],
+    regs.REG_VOLTAGE_SENSOR_ALIGN.id: [3.0],
+    regs.REG_SENSOR_DIRECTION.id: [1],
+    regs.REG_POLE_PAIRS.id: [7],
+    regs.REG_PHASE_RESISTANCE.id: [5.0],
+    regs.REG_KV.id: [100.0],
+    regs.REG_INDUCTANCE.id: [0.001],
+}
+
+# Commander command letters mapped to registers, for the commands the register map covers
+COMMANDER_REGISTERS = {
+    'VP': regs.REG_VEL_PID_P, 'VI': regs.REG_VEL_PID_I, 'VD': regs.REG_VEL_PID_D, 'VF': regs.REG_VEL_LPF_T,
+    'VR': regs.REG_VEL_MAX_RAMP, 'AP': regs.REG_ANG_PID_P, 'AL': regs.REG_VEL_LIMIT,
+    'QP': regs.REG_CURQ_PID_P, 'QI': regs.REG_CURQ_PID_I, 'QD': regs.REG_CURQ_PID_D, 'QF': regs.REG_CURQ_LPF_T,
+    'DP': regs.REG_CURD_PID_P, 'DI': regs.REG_CURD_PID_I, 'DD': regs.REG_CURD_PID_D, 'DF': regs.REG_CURD_LPF_T,
+    'LU': regs.REG_VOLTAGE_LIMIT, 'LC': regs.REG_CURRENT_LIMIT, 'LV': regs.REG_VEL_LIMIT,
+    'R': regs.REG_PHASE_RESISTANCE, 'K': regs.REG_KV, 'I': regs.REG_INDUCTANCE,
+    'SM': regs.REG_ZERO_OFFSET, 'SE': regs.REG_ZERO_ELECTRIC_ANGLE,
+    'E': regs.REG_ENABLE, 'C': regs.REG_CONTROL_MODE, 'T': regs.REG_TORQUE_MODE,
+}
+
+# Commander settings which have no register in the register map, with their labels and initial values
+COMMANDER_SETTINGS = {
+    'VL': ('limit', 12.0), 'AI': ('I', 0.0), 'AD': ('D', 0.0), 'AR': ('ramp', 0.0), 'AF': ('Tf', 0.0),
+    'QL': ('limit', 12.0), 'QR': ('ramp', 0.0), 'DL': ('limit', 12.0), 'DR': ('ramp', 0.0),
+}
+
+# Commander monitoring variables, in output order
+MONITORING_REGISTERS = [regs.REG_TARGET, regs.REG_VOLTAGE_Q, regs.REG_VOLTAGE_D, regs.REG_CURRENT_Q,
+                        regs.REG_CURRENT_D, regs.REG_VELOCITY, regs.REG_ANGLE]
+
+
+
+def serial(protocol=ProtocolType.binary, **kwargs) -> Motors:
+    """ Create a simulated driver, and return a Motors instance connected to it.
+        Like packets.serial(), the connection is not opened until you call motors.connect().
+
+        @param protocol: the protocol to use (binary or ascii)
+        @param kwargs: further arguments for SimulatedDriver
+    """
+    driver = SimulatedDriver(protocol, **kwargs)
+    if protocol == ProtocolType.binary:
+        return Motors(BinaryComms(driver.port))
+    return Motors(ASCIIComms(driver.port))
+
+
+def commander(**kwargs) -> Commander:
+    """ Create a simulated driver using the Commander protocol, and return a Commander instance connected to it.
+
+        @param kwargs: further arguments for SimulatedDriver
+    """
+    return Commander(SimulatedDriver(COMMANDER, **kwargs).port)
+
+
+
+class SimulatedPort:
+    """ In-memory stand-in for a pyserial Serial object, connected to a SimulatedDriver.
+
+        Supports the parts of the pyserial API used by the library: open(), close(), read(), readline(),
+        write(), writelines(), in_waiting, timeout and cancel_read(). Reads block for up to timeout seconds,
+        as with pyserial. Opening the port starts the simulated driver, and closing it stops the driver.
+    """
+    def __init__(self, driver):
+        self.driver = driver
+        self.port = 'simulated'
+        self.baudrate = 115200
+        self.timeout = None
+        self.is_open = False
+        self._rx = bytearray()
+        self._condition = threading.Condition()
+        self._cancelled = False
+
+    def open(self):
+        self.is_open = True
+        self.driver.start()
+
+    def close(self):
+        self.is_open = False
+        self.driver.stop()
+        self.cancel_read()
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def read(self, size=1):
+        return self.__read(lambda: size if len(self._rx) >= size else -1, size)
+
+    def readline(self):
+        return self.__read(lambda: self._rx.find(b'\n') + 1 or -1, None)
+
+    def write(self, data):
+        self.driver.receive(bytes(data))
+        return len(data)
+
+    def writelines(self, lines):
+        self.write(b''.join(lines))
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._condition:
+            self._rx.clear()
+
+    def cancel_read(self):
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def _put(self, data):
+        with self._condition:
+            self._rx += data
+            self._condition.notify_all()
+
+    def __read(self, available, limit):
+        # available() returns the number of bytes which complete the read, or -1
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while available() < 0 and not self._cancelled:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            self._cancelled = False
+            n = available()
+            if n < 0:
+                n = len(self._rx) if limit is None else min(limit, len(self._rx))
+            data = bytes(self._rx[:n])
+            del self._rx[:n]
+            return data
+
+
+
+class SimulatedMotor:
+    """ Register values and a simple motor model for one simulated motor.
+
+        The model is deliberately simple: the velocity follows a first order response with time constant tau
+        towards the setpoint of the selected motion control mode, limited by the voltage and velocity limits.
+    """
+    def __init__(self, tau=0.02):
+        self.tau = tau
+        self.values = { id: list(v) for id, v in DEFAULTS.items() }
+        self.settings = { key: value for key, (label, value) in COMMANDER_SETTINGS.items() }
+        self.angle = 0.0
+        self.velocity = 0.0
+        self.voltage_q = 0.0
+        self.current_q = 0.0
+
+    def get(self, reg):
+        match reg.id:
+            case regs.REG_ANGLE.id:
+                return [self.angle]
+            case regs.REG_POSITION.id:
+                rotations = math.floor(self.angle / (2 * math.pi))
+                return [rotations & 0xFFFFFFFF, self.angle - rotations * 2 * math.pi]
+            case regs.REG_VELOCITY.id:
+                return [self.velocity]
+            case regs.REG_SENSOR_ANGLE.id:
+                return [self.angle % (2 * math.pi)]
+            case regs.REG_VOLTAGE_Q.id:
+                return [self.voltage_q]
+            case regs.REG_CURRENT_Q.id:
+                return [self.current_q]
+            case regs.REG_CURRENT_A.id | regs.REG_CURRENT_B.id | regs.REG_CURRENT_C.id:
+                return [self.__phase_currents()[reg.id - regs.REG_CURRENT_A.id]]
+            case regs.REG_CURRENT_ABC.id:
+                return self.__phase_currents()
+            case regs.REG_CURRENT_DC.id:
+                return [abs(self.current_q), 0.0]
+        values = self.values.get(reg.id)
+        if values is None:
+            values = [0.0 if t == 'f' else 0 for t in reg.read_types]
+        return values
+
+    def set(self, reg, values):
+        if len(reg.write_types) > 0 and len(values) == len(reg.write_types):
+            self.values[reg.id] = [float(v) if t == 'f' else int(v) for t, v in zip(reg.write_types, values)]
+
+    def value(self, reg):
+        return self.get(reg)[0]
+
+    def update(self, dt):
+        if dt <= 0:
+            return
+        kv = max(self.value(regs.REG_KV), 1.0) * 2 * math.pi / 60   # rad/s per volt
+        voltage_limit = self.value(regs.REG_VOLTAGE_LIMIT)
+        velocity_limit = self.value(regs.REG_VEL_LIMIT)
+        target = self.value(regs.REG_TARGET)
+        alpha = 1.0 - math.exp(-dt / self.tau)
+        if self.value(regs.REG_ENABLE) == 0:
+            self.voltage_q = 0.0
+            self.velocity -= self.velocity * alpha
+        else:
+            match self.value(regs.REG_CONTROL_MODE):
+                case 0:     # torque, as voltage
+                    self.voltage_q = _clip(target, voltage_limit)
+                    self.velocity += (self.voltage_q * kv - self.velocity) * alpha
+                case 3:     # velocity open loop
+                    self.velocity = _clip(target, velocity_limit)
+                    self.voltage_q = _clip(self.velocity / kv, voltage_limit)
+                case 4:     # angle open loop
+                    self.velocity = _clip((target - self.angle) / dt, velocity_limit)
+                    self.voltage_q = _clip(self.velocity / kv, voltage_limit)
+                case mode:
+                    if mode == 2:   # angle
+                        setpoint = _clip(self.value(regs.REG_ANG_PID_P) * (target - self.angle), velocity_limit)
+                    else:           # velocity
+                        setpoint = _clip(target, velocity_limit)
+                    setpoint = _clip(setpoint, voltage_limit * kv)
+                    self.velocity += (setpoint - self.velocity) * alpha
+                    self.voltage_q = _clip(self.velocity / kv + self.value(regs.REG_VEL_PID_P) * (setpoint - self.velocity), voltage_limit)
+        resistance = self.value(regs.REG_PHASE_RESISTANCE)
+        self.current_q = (self.voltage_q - self.velocity / kv) / resistance if resistance > 0 else 0.0
+        self.angle += self.velocity * dt
+
+    def __phase_currents(self):
+        electrical = self.angle * self.value(regs.REG_POLE_PAIRS) * self.value(regs.REG_SENSOR_DIRECTION) - self.value(regs.REG_ZERO_ELECTRIC_ANGLE)
+        return [-self.current_q * math.sin(electrical),
+                -self.current_q * math.sin(electrical - 2 * math.pi / 3),
+                -self.current_q * math.sin(electrical + 2 * math.pi / 3)]
+
+
+
+class _TelemetryConfig:
+    def __init__(self, telemetryid):
+        self.telemetryid = telemetryid
+        self.registers = []     # (motor, register) pairs
+        self.downsample = 100
+        self.next_iteration = 0.0
+        self.header = None
+
+
+
+class SimulatedDriver:
+    """ A simulated SimpleFOC driver.
+
+        Implements the register map (reading and writing registers, REG_MOTOR_ADDRESS to switch between
+        motors, REG_TELEMETRY_CTRL, REG_TELEMETRY_REG and REG_TELEMETRY_DOWNSAMPLE to configure telemetry)
+        for the binary and ASCII packet protocols, and the motor commands and monitoring of the Commander
+        protocol. Register writes are answered with the new register value, like the firmware's echo option.
+
+        The driver runs its control loop at loop_rate iterations per second of real time, while it is
+        started, and sends telemetry every downsample iterations.
+
+        Note that BinaryComms completes a frame when the marker of the following frame arrives. So that
+        responses are received promptly while no telemetry is running, the driver follows each batch of
+        binary responses with a SYNC frame. Set sync_after_response=False to disable this.
+
+        @param protocol: ProtocolType.binary, ProtocolType.ascii, or COMMANDER
+        @param num_motors: the number of motors
+        @param loop_rate: the simulated control loop iterations per second
+        @param commander_letters: the Commander command letter of each motor
+        @param sync_after_response: send a SYNC frame after each batch of binary responses
+    """
+    def __init__(self, protocol=ProtocolType.binary, num_motors=1, loop_rate=10000, commander_letters='MNOP', sync_after_response=True):
+        if protocol not in (ProtocolType.binary, ProtocolType.ascii, COMMANDER):
+            raise ValueError("Unknown protocol type")
+        self.protocol = protocol
+        self.loop_rate = loop_rate
+        self.sync_after_response = sync_after_response
+        self.motors = [SimulatedMotor() for i in range(num_motors)]
+        self.letters = commander_letters[:num_motors]
+        self.current_motor = 0
+        self.telemetry = [_TelemetryConfig(i) for i in range(MAX_TELEMETRY_IDS)]
+        self.telemetry_ctrl = 0
+        self.verbose = 2        # Commander VerboseMode.user_friendly
+        self.monitoring = [(0, 0, 0.0) for i in range(num_motors)]     # (variables, downsample, next iteration)
+        self.port = SimulatedPort(self)
+        self._output = self.port._put
+        self._codec = BinaryComms(self)
+        self._codec._in_sync = True
+        self._input = bytearray()
+        self._lock = threading.RLock()
+        self._thread = None
+        self._running = False
+        self._serve_thread = None
+        self._detach = None
+        self._iteration = 0.0
+        self._start_time = None
+
+    def start(self):
+        """ Start the simulated control loop, this is done when the port is opened """
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._start_time = time.monotonic()
+            self._iteration = 0.0
+            self._thread = threading.Thread(target=self.__run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """ Stop the simulated control loop. If the driver is attached to a pseudo-terminal or socket, it is
+            detached and the terminal or socket is closed.
+        """
+        with self._lock:
+            self._running = False
+            thread = self._thread
+            serve_thread, detach = self._serve_thread, self._detach
+            self._serve_thread = self._detach = None
+        for t in (serve_thread, thread):
+            if t is not None and t is not threading.current_thread():
+                t.join()
+        if detach is not None:
+            self._output = self.port._put
+            detach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def pty(self):
+        """ Attach the driver to a new pseudo-terminal, start it, and return the name of the terminal device.
+            Any serial library can open the device, e.g. packets.serial(driver.pty(), 115200).
+            The terminal is closed by stop().
+        """
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        def close():
+            os.close(master)
+            os.close(slave)
+        self.__attach(master, lambda: os.read(master, 4096), lambda data: os.write(master, data), close)
+        return os.ttyname(slave)
+
+    def socket(self):
+        """ Attach the driver to one end of a new socket pair, start it, and return the other end, e.g. for use
+            with asyncio: reader, writer = await asyncio.open_connection(sock=driver.socket())
+            The driver's end is closed by stop().
+        """
+        host, device = socket.socketpair()
+        self.__attach(device, lambda: device.recv(4096), device.sendall, device.close)
+        return host
+
+    def write(self, data):
+        """ Output of the frame encoder """
+        self._output(bytes(data))
+        return len(data)
+
+    def receive(self, data):
+        """ Handle bytes sent by the host """
+        with self._lock:
+            self.__advance()
+            self._input += data
+            if self.protocol == ProtocolType.binary:
+                self.__receive_binary()
+            else:
+                self.__receive_lines()
+
+    #
+    # binary protocol
+    #
+    def __receive_binary(self):
+        buffer = self._input
+        responded = False
+        while len(buffer) >= 2:
+            if buffer[0] != MARKER:
+                idx = buffer.find(MARKER)
+                del buffer[:idx if idx >= 0 else len(buffer)]
+                continue
+            size = buffer[1]
+            if len(buffer) < size + 2:
+                break
+            frame = bytes(buffer[2:size + 2])
+            del buffer[:size + 2]
+            if len(frame) < 1:
+                continue
+            if frame[0] == ord('S'):
+                self._codec.send_frame(SyncFrame([True]))
+            elif frame[0] == ord('R') and len(frame) >= 2:
+                reg = regs.by_id(frame[1])
+                if reg is not None:
+                    self.__binary_register(reg, frame[2:])
+                    responded = True
+        if responded and self.sync_after_response:
+            self._codec.send_frame(SyncFrame([True]))
+
+    def __binary_register(self, reg, payload):
+        if len(payload) > 0:
+            if reg == regs.REG_TELEMETRY_REG:
+                count = payload[0]
+                values = [count] + list(payload[1:1 + 2 * count])
+            else:
+                try:
+                    values = list(struct.unpack_from('<' + reg.write_format(), payload))
+                except struct.error:
+                    return  # wrong size
+            self.__write_register(reg, values)
+        self._codec.send_frame(self.__response(reg))
+
+    def __response(self, reg):
+        if reg == regs.REG_TELEMETRY_REG:
+            values = [[m, r.id] for m, r in self.telemetry[self.telemetry_ctrl].registers]
+            return RegisterFrame(FrameType.RESPONSE, reg, values)
+        return RegisterFrame(FrameType.RESPONSE, reg, self.__read_register(reg))
+
+    #
+    # ASCII and Commander protocols
+    #
+    def __receive_lines(self):
+        while True:
+            idx = self._input.find(b'\n')
+            if idx < 0:
+                break
+            line = self._input[:idx].decode('ascii', errors='replace').strip()
+            del self._input[:idx + 1]
+            if len(line) == 0:
+                continue
+            if self.protocol == COMMANDER:
+                self.__commander_line(line)
+            else:
+                self.__ascii_line(line)
+
+    def __ascii_line(self, line):
+        if line[0] == 'S':
+            self._output(b'S1\n')
+        elif line[0] == 'R':
+            regstr, _, valuesstr = line[1:].partition('=')
+            try:
+                reg = regs.by_id(int(regstr))
+                values = [parse_value(v) for v in valuesstr.split(',')] if len(valuesstr) > 0 else []
+            except ValueError:
+                return
+            if reg is None:
+                return
+            if len(values) > 0:
+                self.__write_register(reg, values)
+            if reg == regs.REG_TELEMETRY_REG:
+                pairs = self.telemetry[self.telemetry_ctrl].registers
+                values = [len(pairs)] + [v for m, r in pairs for v in (m, r.id)]
+            else:
+                values = self.__read_register(reg)
+            self._output("r{}={}\n".format(reg.id, _ascii_values(values)).encode('ascii'))
+
+    def __commander_line(self, line):
+        if line[0] == '@':
+            if len(line) > 1 and line[1].isdigit():
+                self.verbose = int(line[1])
+            return
+        motor_index = self.letters.find(line[0])
+        if motor_index < 0:
+            self.__println("err")
+            return
+        motor = self.motors[motor_index]
+        command = line[1:]
+        if len(command) == 0 or command[0] in '-.0123456789':
+            if len(command) > 0:
+                motor.set(regs.REG_TARGET, [float(command)])
+            self.__println(self.__prefix(line[0], "Target: "), motor.value(regs.REG_TARGET))
+            return
+        if command[0] == 'M':
+            self.__commander_monitoring(motor_index, line)
+            return
+        key = command[:2] if command[:2] in COMMANDER_REGISTERS or command[:2] in COMMANDER_SETTINGS else command[:1]
+        reg = COMMANDER_REGISTERS.get(key)
+        if reg is None and key not in COMMANDER_SETTINGS:
+            self.__println("err")
+            return
+        value = command[len(key):].strip()
+        if len(value) > 0:
+            try:
+                if reg is not None:
+                    motor.set(reg, [float(value)])
+                else:
+                    motor.settings[key] = float(value)
+            except ValueError:
+                self.__println("err")
+                return
+        if reg is not None:
+            self.__println(self.__prefix(line[:1 + len(key)], reg.short_name() + ": "), motor.value(reg))
+        else:
+            self.__println(self.__prefix(line[:1 + len(key)], COMMANDER_SETTINGS[key][0] + ": "), motor.settings[key])
+
+    def __commander_monitoring(self, motor_index, line):
+        variables, downsample, next_iteration = self.monitoring[motor_index]
+        sub, value = line[2:3], line[3:].strip()
+        if sub == 'S' and len(value) > 0:
+            variables = int(value, 2)
+        elif sub == 'D' and len(value) > 0:
+            downsample = int(value)
+            next_iteration = self._iteration + downsample
+        elif sub == 'C':
+            variables = 0
+        elif sub == 'G' and len(value) > 0:
+            reg = MONITORING_REGISTERS[int(value)] if int(value) < len(MONITORING_REGISTERS) else None
+            if reg is not None:
+                self.__println(self.__prefix(line, reg.short_name() + ": "), self.motors[motor_index].value(reg))
+            return
+        self.monitoring[motor_index] = (variables, downsample, next_iteration)
+        self.__println(self.__prefix(line[:3], "Monitor: "), variables if sub == 'S' else downsample)
+
+    def __prefix(self, command, label):
+        match self.verbose:
+            case 2:
+                return label
+            case 3:
+                return command
+        return ''
+
+    def __println(self, prefix, value=None):
+        if self.verbose == 0:
+            return
+        text = prefix if value is None else prefix + ("{:.3f}".format(value) if isinstance(value, float) else str(value))
+        self._output((text + '\n').encode('ascii'))
+
+    #
+    # registers
+    #
+    def __read_register(self, reg):
+        match reg.id:
+            case regs.REG_MOTOR_ADDRESS.id:
+                return [self.current_motor]
+            case regs.REG_NUM_MOTORS.id:
+                return [len(self.motors)]
+            case regs.REG_TELEMETRY_CTRL.id:
+                return [self.telemetry_ctrl]
+            case regs.REG_TELEMETRY_DOWNSAMPLE.id:
+                return [self.telemetry[self.telemetry_ctrl].downsample]
+            case regs.REG_ITERATIONS_SEC.id:
+                return [int(self.loop_rate)]
+            case regs.REG_SYS_TIME.id:
+                return [int(self._iteration * 1000 / self.loop_rate) & 0xFFFFFFFF]
+        return self.motors[self.current_motor].get(reg)
+
+    def __write_register(self, reg, values):
+        match reg.id:
+            case regs.REG_MOTOR_ADDRESS.id:
+                if 0 <= int(values[0]) < len(self.motors):
+                    self.current_motor = int(values[0])
+            case regs.REG_TELEMETRY_CTRL.id:
+                if 0 <= int(values[0]) < MAX_TELEMETRY_IDS:
+                    self.telemetry_ctrl = int(values[0])
+            case regs.REG_TELEMETRY_DOWNSAMPLE.id:
+                config = self.telemetry[self.telemetry_ctrl]
+                config.downsample = int(values[0])
+                config.next_iteration = self._iteration + config.downsample
+            case regs.REG_TELEMETRY_REG.id:
+                config = self.telemetry[self.telemetry_ctrl]
+                count = int(values[0])
+                pairs = values[1:1 + 2 * count]
+                config.registers = [(int(pairs[i]), regs.by_id(int(pairs[i + 1]))) for i in range(0, len(pairs) - 1, 2)]
+                config.registers = [(m, r) for m, r in config.registers if r is not None and m < len(self.motors)]
+                config.header = HeaderFrame(config.telemetryid, [r for m, r in config.registers], [m for m, r in config.registers])
+                config.next_iteration = self._iteration + config.downsample
+                self.__send_header(config)
+            case regs.REG_ENABLE_ALL.id:
+                for motor in self.motors:
+                    motor.set(regs.REG_ENABLE, values)
+            case _:
+                self.motors[self.current_motor].set(reg, values)
+
+    #
+    # control loop and telemetry
+    #
+    def __run(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                self.__advance()
+            time.sleep(0.001)
+
+    def __advance(self):
+        if not self._running:
+            return
+        target = (time.monotonic() - self._start_time) * self.loop_rate
+        events = []
+        for config in self.telemetry:
+            if config.downsample > 0 and len(config.registers) > 0:
+                while config.next_iteration <= target:
+                    events.append((config.next_iteration, 0, config))
+                    config.next_iteration += config.downsample
+        for i, (variables, downsample, next_iteration) in enumerate(self.monitoring):
+            if downsample > 0 and variables != 0:
+                while next_iteration <= target:
+                    events.append((next_iteration, 1, i))
+                    next_iteration += downsample
+                self.monitoring[i] = (variables, downsample, next_iteration)
+        events.sort(key=lambda e: e[0])
+        output = []
+        for iteration, kind, what in events:
+            self.__step(iteration)
+            if kind == 0:
+                output.append(self.__telemetry_frame(what))
+            else:
+                output.append(self.__monitoring_line(what))
+        self.__step(target)
+        if len(output) > 0:
+            if self.protocol == ProtocolType.binary:
+                self._codec.send_frames(output)
+            else:
+                self._output(''.join(output).encode('ascii'))
+
+    def __step(self, iteration):
+        dt = (iteration - self._iteration) / self.loop_rate
+        if dt > 0:
+            for motor in self.motors:
+                motor.update(dt)
+            self._iteration = iteration
+
+    def __telemetry_frame(self, config):
+        values = []
+        for m, reg in config.registers:
+            values += self.motors[m].get(reg)
+        if self.protocol == ProtocolType.binary:
+            return TelemetryFrame(config.telemetryid, values, header=config.header)
+        return "T{}={}\n".format(config.telemetryid, _ascii_values(values))
+
+    def __monitoring_line(self, motor_index):
+        variables = self.monitoring[motor_index][0]
+        motor = self.motors[motor_index]
+        values = [motor.value(reg) for reg in MONITORING_REGISTERS if variables & MonitoringFlags[reg.id]]
+        return '\t'.join("{:.4f}".format(v) for v in values) + '\n'
+
+    def __send_header(self, config):
+        if self.protocol == ProtocolType.binary:
+            self._codec.send_frame(config.header)
+        elif self.protocol == ProtocolType.ascii:
+            pairs = ','.join("{}:{}".format(m, r.id) for m, r in config.registers)
+            self._output("H{}={}\n".format(config.telemetryid, pairs).encode('ascii'))
+
+    def __attach(self, fd, read, write, close):
+        self._output = write
+        self._detach = close
+        self._serve_thread = threading.Thread(target=self.__serve, args=(fd, read), daemon=True)
+        self.start()
+        self._serve_thread.start()
+
+    def __serve(self, fd, read):
+        while self._running:
+            try:
+                ready, _, _ = select.select([fd], [], [], 0.1)
+                if ready:
+                    data = read()
+                    if len(data) == 0:
+                        return  # closed by the host
+                    self.receive(data)
+            except OSError:
+                return
+
+
+
+def _clip(value, limit):
+    return max(-limit, min(limit, value))
+
+
+def _ascii_values(values):
+    # floats always include a decimal point, so the receiving side parses them as floats
+    return ','.join("{:.6f}".format(v) if isinstance(v, float) else str(v) for v in values)
@@ -3,13 +3,65 @@
 #
 
 from rx import operators as ops
-from .registers import SimpleFOCRegisters, parse_register, Register
+from .registers import SimpleFOCRegisters, parse_register, Register, DTYPES
 from simplefoc import FrameType
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
 
 
 MAX_TELEMTRY_IDS = 8
 
 
+def column_name(register, motor=0):
+    """ Name used for a telemetry value column: the register name, prefixed with the motor id if it is not motor 0 """
+    return register.name if motor == 0 else "{}:{}".format(motor, register.name)
+
+
+def telemetry_dtype(header):
+    """ Return the numpy structured dtype for the telemetry values described by a header frame.
+
+        The dtype matches the binary layout of the telemetry payload. There is one field per register, named
+        as by column_name(). Registers with several values of the same type are subarray fields, registers
+        with values of different types (e.g. REG_POSITION) are nested structures with fields '0', '1', ...
+    """
+    if np is None:
+        raise ModuleNotFoundError("numpy is required for batch telemetry decoding, please install it")
+    fields = []
+    for reg, motor in zip(header.registers, header.motors):
+        types = reg.read_types
+        if len(types) == 1:
+            fields.append((column_name(reg, motor), DTYPES[types[0]]))
+        elif all(t == types[0] for t in types):
+            fields.append((column_name(reg, motor), DTYPES[types[0]], (len(types),)))
+        else:
+            fields.append((column_name(reg, motor), [(str(i), DTYPES[t]) for i, t in enumerate(types)]))
+    return np.dtype(fields)
+
+
+def telemetry_array(values, header):
+    """ Convert a list of decoded telemetry value lists for a header into a numpy structured array, see telemetry_dtype() """
+    dtype = telemetry_dtype(header)
+    sizes = [len(reg.read_types) for reg in header.registers]
+    mixed = [len(set(reg.read_types)) > 1 for reg in header.registers]
+    expected = sum(sizes)
+    rows = []
+    for v in values:
+        if len(v) != expected:
+            continue
+        row = []
+        pos = 0
+        for size, is_mixed in zip(sizes, mixed):
+            if size == 1:
+                row.append(v[pos])
+            else:
+                row.append(tuple(v[pos:pos+size]) if is_mixed else v[pos:pos+size])
+            pos += size
+        rows.append(tuple(row))
+    return np.array(rows, dtype=dtype)
+
+
 class Telemetry:
     """ SimpleFOC Telemetry class
 
@@ -29,6 +81,7 @@ class Telemetry:
             ops.filter(lambda p: p.frame_type == FrameType.TELEMETRY),
             ops.filter(lambda p: self.headers[p.telemetryid] is not None),
             ops.map(lambda p: self.motors.connection.parse_telemetry(p, self.headers[p.telemetryid])),
+            ops.filter(lambda p: p is not None),    # rejected by the parser
             ops.share()
         )
         self._telemetry_ctrl = 0
@@ -88,5 +141,239 @@ class Telemetry:
     def listen(self, listener_func):
         self.observable().subscribe(listener_func)
 
+    def batches(self, count=1000, timespan=0.1, telemetryid=0):
+        """ Get an observable of batches of telemetry samples, decoded in one go into numpy structured arrays.
+
+            Telemetry frames are collected until count frames have arrived or timespan seconds have passed, and
+            then decoded together, see telemetry_dtype() for the array layout. If the header changes within
+            a batch, one array is emitted for each header. Requires numpy.
+
+            @param count: the maximum number of samples per batch
+            @param timespan: the maximum time to collect samples for, in seconds, or None to only batch by count
+            @param telemetryid: the telemetry id to decode
+        """
+        return self.motors.connection.observable().pipe(
+            ops.filter(lambda p: p.frame_type == FrameType.TELEMETRY and p.telemetryid == telemetryid),
+            ops.filter(lambda p: self.headers[p.telemetryid] is not None),
+            ops.map(lambda p: (p, self.headers[p.telemetryid])),
+            ops.buffer_with_count(count) if timespan is None else ops.buffer_with_time_or_count(timespan, count),
+            ops.filter(lambda batch: len(batch) > 0),
+            ops.flat_map(lambda batch: self.__decode_batch(batch)),
+            ops.share()
+        )
+
+    def buffer(self, capacity=100000, telemetryid=0) -> 'TelemetryBuffer':
+        """ Return a TelemetryBuffer recording the last capacity samples of this telemetry. Requires numpy. """
+        return TelemetryBuffer(self, capacity, telemetryid)
+
+    def publish(self, name=None, capacity=None, width=None, telemetryid=0) -> 'TelemetryPublisher':
+        """ Publish the decoded samples into a named shared memory ring, which any number of other processes on
+            this computer can read, see TelemetryPublisher. Requires numpy.
+        """
+        return TelemetryPublisher(self, name, capacity, width, telemetryid)
+
+    def record(self, path, index_interval=1.0):
+        """ Record all telemetry headers and samples received on the connection to a file, until the returned
+            Recorder is closed. See recording.py for the file format and for replaying recordings.
+        """
+        from .recording import Recorder
+        return Recorder(path, index_interval, source=self.motors.connection.observable())
+
     def __update_header(self, packet):
         self.headers[packet.telemetryid] = packet
+
+    def __decode_batch(self, batch):
+        arrays = []
+        start = 0
+        for i in range(1, len(batch) + 1):
+            if i == len(batch) or batch[i][1] is not batch[start][1]:
+                header = batch[start][1]
+                arrays.append(self.motors.connection.parse_telemetry_batch([p for p, h in batch[start:i]], header))
+                start = i
+        return arrays
+
+
+
+
+class TelemetryBuffer:
+    """ SimpleFOC TelemetryBuffer class
+
+        Records telemetry samples into a preallocated ring buffer of numpy arrays, one column per register in
+        the telemetry header plus a timestamp column. Memory use is fixed by the capacity, and recording a
+        sample doesn't allocate any per-sample objects beyond the decoded frame itself.
+
+        The column accessors return views into the buffer, not copies. The buffer keeps every sample twice,
+        so the latest n samples are always contiguous. Note that the views will be overwritten as new samples
+        arrive, so copy them (e.g. with numpy.copy) if you need to keep them.
+
+        Columns are float64 arrays, which represent all the register value types exactly. Registers with more
+        than one value (e.g. REG_CURRENT_ABC) have 2-dimensional columns, with one row per sample. Missing
+        values are recorded as NaN, and samples with the wrong number of values are counted in dropped.
+        Timestamps are int64 time.monotonic_ns() values, as recorded in the frames.
+
+        When a new header is received for the telemetry id, the buffer is cleared and the columns are
+        rearranged to match it.
+
+        Typically, you will get a TelemetryBuffer by calling telemetry.buffer(capacity)
+
+        @param telemetry: the Telemetry instance to record
+        @param capacity: the maximum number of samples to keep
+        @param telemetryid: the telemetry id to record
+    """
+    def __init__(self, telemetry, capacity=100000, telemetryid=0):
+        if np is None:
+            raise ModuleNotFoundError("numpy is required for TelemetryBuffer, please install it")
+        self.capacity = capacity
+        self.telemetryid = telemetryid
+        self.header = None
+        self.dropped = 0
+        self._columns = {}
+        self._values = np.empty((0, 2 * capacity), dtype=np.float64)
+        self._timestamps = np.empty(2 * capacity, dtype=np.int64)
+        self._count = 0
+        self._subscription = telemetry.observable().subscribe(self.__append)
+
+    def dispose(self):
+        """ Stop recording """
+        self._subscription.dispose()
+
+    def clear(self):
+        self._count = 0
+
+    def names(self):
+        """ Return the names of the value columns """
+        return list(self._columns.keys())
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def timestamps(self, n=None):
+        start, end = self.__window(n)
+        return self._timestamps[start:end]
+
+    def column(self, name, n=None):
+        """ Return a view of the latest n values (or all available values) of the named column """
+        start, end = self.__window(n)
+        first, last = self._columns[name]
+        if last - first == 1:
+            return self._values[first, start:end]
+        return self._values[first:last, start:end].T
+
+    def latest(self, n=None):
+        """ Return a dict of column name to a view of the latest n values, including the 'timestamp' column """
+        result = { 'timestamp': self.timestamps(n) }
+        for name in self._columns:
+            result[name] = self.column(name, n)
+        return result
+
+    def between(self, start_time, end_time):
+        """ Return a dict of column name to a view of the values with start_time <= timestamp < end_time (in monotonic ns) """
+        timestamps = self.timestamps()
+        start = int(np.searchsorted(timestamps, start_time, side='left'))
+        end = int(np.searchsorted(timestamps, end_time, side='left'))
+        offset = self.__window(None)[0]
+        result = { 'timestamp': self._timestamps[offset+start:offset+end] }
+        for name, (first, last) in self._columns.items():
+            if last - first == 1:
+                result[name] = self._values[first, offset+start:offset+end]
+            else:
+                result[name] = self._values[first:last, offset+start:offset+end].T
+        return result
+
+    def __window(self, n):
+        available = min(self._count, self.capacity)
+        if n is None or n > available:
+            n = available
+        end = (self._count - 1) % self.capacity + self.capacity + 1 if self._count > 0 else self.capacity
+        return end - n, end
+
+    def __reset(self, header):
+        columns = {}
+        pos = 0
+        for reg, motor in zip(header.registers, header.motors):
+            columns[column_name(reg, motor)] = (pos, pos + len(reg.read_types))
+            pos += len(reg.read_types)
+        if pos != self._values.shape[0]:
+            self._values = np.empty((pos, 2 * self.capacity), dtype=np.float64)
+        self._columns = columns
+        self.header = header
+        self._count = 0
+
+    def __append(self, frame):
+        if frame.telemetryid != self.telemetryid:
+            return
+        if frame.header is not self.header:
+            self.__reset(frame.header)
+        i = self._count % self.capacity
+        try:
+            self._values[:, i] = frame.values
+        except ValueError:
+            self.dropped += 1   # sample doesn't match the header
+            return
+        self._values[:, i + self.capacity] = self._values[:, i]
+        self._timestamps[i] = self._timestamps[i + self.capacity] = frame.timestamp
+        self._count += 1
+
+
+
+class TelemetryPublisher:
+    """ SimpleFOC TelemetryPublisher class
+
+        Only one process can open the driver's serial port. A TelemetryPublisher writes the decoded telemetry
+        samples into a SharedRing (see ring.py), so that plotting, logging or analysis running as separate
+        processes can read them at full rate, without a connection of their own, pickling or sockets:
+
+            publisher = motors.telemetry().publish('simplefoc-telemetry')
+
+            # in another process
+            reader = simplefoc.ring.SharedRing('simplefoc-telemetry').reader()
+            timestamps, values = reader.read()
+
+        The ring describes the columns of the values by the registers and motors of the current header. When
+        a new header is received, the readers see it in their header, columns and generation. Readers which
+        fall behind by more than the capacity are lapped, and count the skipped samples in lost. Samples with
+        the wrong number of values for the header are not published, but counted in the ring's errors.
+
+        Typically, you will get a TelemetryPublisher by calling telemetry.publish(name)
+
+        @param telemetry: the Telemetry instance to publish
+        @param name: the name of the shared memory, or None for a unique name, see publisher.name
+        @param capacity: the number of samples kept in the ring, by default RING_CAPACITY
+        @param width: the maximum number of values per sample, by default RING_WIDTH
+        @param telemetryid: the telemetry id to publish
+    """
+    def __init__(self, telemetry, name=None, capacity=None, width=None, telemetryid=0):
+        from .ring import SharedRing, RING_CAPACITY, RING_WIDTH
+        self.ring = SharedRing(name, create=True, capacity=capacity or RING_CAPACITY, width=width or RING_WIDTH)
+        self.telemetryid = telemetryid
+        self.header = None
+        self._size = None
+        self._subscription = telemetry.observable().subscribe(self.__publish)
+
+    @property
+    def name(self):
+        return self.ring.name
+
+    def close(self):
+        """ Stop publishing, and remove the ring. Readers which have it open can still read what was published. """
+        self._subscription.dispose()
+        self.ring.close()
+        self.ring.unlink()
+
+    def __publish(self, frame):
+        if frame.telemetryid != self.telemetryid:
+            return
+        if frame.header is not self.header:
+            self.header = frame.header
+            try:
+                self.ring.set_header(frame.header)
+                self._size = sum(len(reg.read_types) for reg in frame.header.registers)
+            except ValueError as e:
+                print("WARNING: can't publish telemetry: ", e) # TODO logging
+                self._size = None
+        if self._size is None:
+            return
+        if len(frame.values) != self._size:
+            self.ring.errors += 1
+            return
+        self.ring.append_sample(frame.timestamp, frame.values)
@@ -0,0 +1,30 @@
+import time
+import pytest
+from simplefoc.capture import ProcessCapture
+from simplefoc.packets import ProtocolType
+from simplefoc.registers import SimpleFOCRegisters
+from simplefoc.ring import SharedRing
+from simplefoc.simulator import SimulatedDriver
+
+
+def test_ring_lives_from_connect_to_disconnect():
+    capture = ProcessCapture(workers=1)
+    try:
+        motors = capture.add(SimulatedDriver(ProtocolType.binary).port, 'sim')
+        assert capture.ring(motors) is None
+        motors.connect()
+        ring = capture.ring(motors)
+        telemetry = motors.telemetry()
+        telemetry.set_registers([SimpleFOCRegisters.REG_TARGET], motors=[0])
+        telemetry.set_downsample(10)
+        deadline = time.monotonic() + 10.0
+        while ring.sequence == 0:
+            assert time.monotonic() < deadline, "no samples captured"
+            time.sleep(0.05)
+        motors.disconnect()
+        with pytest.raises(FileNotFoundError):
+            SharedRing(ring.name)
+        timestamps, values = ring.reader().read()
+        assert len(timestamps) > 0
+    finally:
+        capture.stop()
@@ -0,0 +1,57 @@
+import pytest
+from simplefoc import VerboseMode, simulator
+from simplefoc.commander import Commander
+from simplefoc.registers import SimpleFOCRegisters
+
+
+@pytest.fixture
+def commander():
+    commander = simulator.commander()
+    commander.connect()
+    yield commander
+    commander.disconnect()
+
+
+def test_unknown_verbose_mode_is_not_tracked(commander):
+    commander.set_verbose(VerboseMode.user_friendly)
+    commander.send_command('@7')
+    assert commander.verbose is None
+
+
+def test_query_restores_the_verbose_mode(commander):
+    commander.set_verbose(VerboseMode.user_friendly)
+    with commander.batch():
+        limit = commander.query('MLU')
+        target = commander.query('M')
+    assert limit.result(timeout=1.0) == 12.0
+    assert target.result(timeout=1.0) == 0.0
+    assert commander.verbose == VerboseMode.user_friendly
+    assert commander.connection.driver.verbose == VerboseMode.user_friendly.value
+
+
+def monitoring_commander():
+    commander = Commander(None)
+    commander.use_monitoring_registers([SimpleFOCRegisters.REG_TARGET, SimpleFOCRegisters.REG_VELOCITY])
+    return commander
+
+
+def test_telemetry_batches_stop_collecting_when_disposed():
+    commander = monitoring_commander()
+    batches = []
+    subscription = commander.telemetry_batches(count=2, timespan=None).subscribe(batches.append)
+    commander._process_bytes(b'1.0\t2.0\n3.0\t4.0\n')
+    assert commander._batching == 1
+    subscription.dispose()
+    assert commander._batching == 0
+    assert [batch.tolist() for batch in batches] == [[[1.0, 2.0], [3.0, 4.0]]]
+
+
+def test_bad_monitoring_lines_are_counted_once():
+    commander = monitoring_commander()
+    samples, batches = [], []
+    commander.telemetry().subscribe(samples.append)
+    commander.telemetry_batches(count=4, timespan=None).subscribe(batches.append)
+    commander._process_bytes(b'1.0\t2.0\n1.0\tx\n3.0\n5.0\t6.0\n')
+    assert len(samples) == 2
+    assert batches[0].tolist() == [[1.0, 2.0], [5.0, 6.0]]
+    assert commander.metrics.telemetry_errors == 2
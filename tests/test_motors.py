@@ -0,0 +1,71 @@
+import time
+import pytest
+from simplefoc import simulator
+from simplefoc.packets import ProtocolType
+from simplefoc.registers import SimpleFOCRegisters
+
+
+@pytest.fixture(params=[ProtocolType.binary, ProtocolType.ascii], ids=['binary', 'ascii'])
+def motors(request):
+    motors = simulator.serial(request.param)
+    motors.connect()
+    yield motors
+    motors.disconnect()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_registers_round_trip(motors):
+    motor = motors.motor(0)
+    assert motors.set_register_with_response(0, SimpleFOCRegisters.REG_VEL_PID_P, 0.75) == 0.75
+    assert motor.get_register(SimpleFOCRegisters.REG_VEL_PID_P) == 0.75
+    motor.set_register(SimpleFOCRegisters.REG_VOLTAGE_LIMIT, 6.0)
+    assert motor.get_register(SimpleFOCRegisters.REG_VOLTAGE_LIMIT) == 6.0
+
+
+def test_pipelined_reads_are_matched_to_their_registers(motors):
+    motor = motors.motor(0)
+    regs = [SimpleFOCRegisters.REG_VEL_PID_P, SimpleFOCRegisters.REG_VEL_PID_I, SimpleFOCRegisters.REG_VOLTAGE_LIMIT]
+    values = [0.5, 12.5, 7.0]
+    for reg, value in zip(regs, values):
+        motor.set_register(reg, value)
+    futures = [motor.request_register(reg) for reg in regs * 10]
+    assert [f.result(timeout=2.0) for f in futures] == values * 10
+
+
+def test_unanswered_read_times_out(motors):
+    with pytest.raises(TimeoutError, match="No response for"):
+        motors.get_response(0, SimpleFOCRegisters.REG_VEL_PID_D, timeout=0.1)
+
+
+def test_cache_uses_telemetry_configured_before_it_was_enabled(motors):
+    telemetry = motors.telemetry()
+    telemetry.set_registers([SimpleFOCRegisters.REG_VELOCITY], motors=[0])
+    telemetry.set_downsample(100)
+    samples = []
+    subscription = telemetry.observable().subscribe(samples.append)
+    wait_for(lambda: len(samples) > 0)
+    motor = motors.motor(0)
+    cache = motor.enable_cache(max_age=10.0)
+    wait_for(lambda: cache.get(SimpleFOCRegisters.REG_VELOCITY)[0])
+    subscription.dispose()
+
+
+def test_cache_skips_unchanged_writes(motors):
+    motor = motors.motor(0)
+    cache = motor.enable_cache(max_age=10.0, skip_unchanged=True)
+    limit = motor.get_register(SimpleFOCRegisters.REG_VOLTAGE_LIMIT)
+    assert motor.get_register(SimpleFOCRegisters.REG_VOLTAGE_LIMIT) == limit
+    assert (cache.hits, cache.misses) == (1, 1)
+    motor.set_target(1.0)
+    motor.set_target(1.0)
+    assert cache.skipped == 1
+    cache.invalidate(SimpleFOCRegisters.REG_TARGET)
+    motor.set_target(1.0)
+    assert cache.skipped == 1
+    assert motor.request_register(SimpleFOCRegisters.REG_TARGET, use_cache=False).result(timeout=1.0) == 1.0
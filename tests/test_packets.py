@@ -0,0 +1,79 @@
+import random, struct
+from simplefoc import FrameType, HeaderFrame, TelemetryFrame
+from simplefoc.packets import ASCIIComms, BinaryComms, MARKER
+from simplefoc.registers import SimpleFOCRegisters
+
+
+def frame(payload):
+    return bytes([MARKER, len(payload)]) + payload
+
+
+def response(reg, value):
+    return frame(b'r' + bytes([reg.id]) + struct.pack('<f', value))
+
+
+def receive(comms, data, chunk=None):
+    frames = []
+    chunk = chunk or len(data)
+    for i in range(0, len(data), chunk):
+        frames += comms._receive(data[i:i + chunk])
+    return frames
+
+
+def test_binary_malformed_frames_are_counted_and_skipped():
+    comms = BinaryComms(None)
+    data = response(SimpleFOCRegisters.REG_TARGET, 1.5)
+    data += frame(b'R') + frame(b'r') + frame(b'S') + frame(b'A\xff\xfe')
+    data += response(SimpleFOCRegisters.REG_TARGET, 2.5) + bytes([MARKER])
+    frames = receive(comms, data)
+    assert [f.values for f in frames] == [[1.5], [2.5]]
+    assert comms.metrics.parse_errors == 4
+
+
+def test_binary_resynchronises_after_garbage():
+    rnd = random.Random(1)
+    for i in range(200):
+        comms = BinaryComms(None)
+        garbage = bytes(rnd.randrange(256) for j in range(rnd.randrange(1, 600)))
+        truncated = frame(rnd.choice([b'R', b'r', b'S', b'A\x80', b'H']))
+        # a length byte in the garbage can swallow up to 255 bytes, the last valid frames must be received
+        valid = b''.join(response(SimpleFOCRegisters.REG_TARGET, float(k)) for k in range(40))
+        frames = receive(comms, garbage + truncated + valid + bytes([MARKER]), rnd.randrange(1, 64))
+        responses = [f.values[0] for f in frames if f.frame_type == FrameType.RESPONSE and f.register == SimpleFOCRegisters.REG_TARGET]
+        assert responses[-2:] == [38.0, 39.0]
+
+
+def ascii_comms():
+    comms = ASCIIComms(None)
+    header = comms._ASCIIComms__parseFrame("H0=0:{}".format(int(SimpleFOCRegisters.REG_VELOCITY)) +
+                                           ",0:{}".format(int(SimpleFOCRegisters.REG_STATUS)))
+    return comms, header
+
+
+def test_ascii_telemetry_values_are_a_list_before_parsing():
+    comms, header = ascii_comms()
+    frame = comms._ASCIIComms__parseFrame("T0=1.5,0x3")
+    assert frame.payload == "1.5,0x3"
+    assert frame.values == [1.5, 3]
+
+
+def test_ascii_telemetry_int_columns_accept_parse_value_formats():
+    comms, header = ascii_comms()
+    for text, expected in [("1,2", [1.0, 2]), ("2.5,0x4", [2.5, 4]), ("0.5,0b11", [0.5, 3])]:
+        frame = comms.parse_telemetry(comms._ASCIIComms__parseFrame("T0=" + text), header)
+        assert frame.values == expected
+        assert isinstance(frame.values[0], float)
+    assert comms.parse_telemetry(comms._ASCIIComms__parseFrame("T0=1.5"), header) is None
+    assert comms.metrics.telemetry_errors == 1
+
+
+def test_binary_batch_and_frame_decoding_agree():
+    comms = BinaryComms(None)
+    header = HeaderFrame(0, [SimpleFOCRegisters.REG_VELOCITY, SimpleFOCRegisters.REG_ANGLE], [0, 0])
+    good = struct.pack('<ff', 1.0, 2.0)
+    payloads = [good, good + b'\x00\x00', good[:6]]
+    frames = [comms.parse_telemetry(TelemetryFrame(0, p, payload=p), header) for p in payloads]
+    assert comms.metrics.telemetry_errors == 1
+    array = comms.parse_telemetry_batch([TelemetryFrame(0, p, payload=p) for p in payloads], header)
+    assert comms.metrics.telemetry_errors == 2
+    assert [list(row) for row in array.tolist()] == [f.values for f in frames[:2]]
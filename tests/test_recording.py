@@ -0,0 +1,42 @@
+import os, struct
+import pytest
+from simplefoc import HeaderFrame, TelemetryFrame
+from simplefoc.recording import Recorder, Recording
+from simplefoc.registers import SimpleFOCRegisters
+
+SECOND = 1000000000
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "capture.sftr")
+    header = HeaderFrame(0, [SimpleFOCRegisters.REG_TARGET], [0], timestamp=0)
+    with Recorder(path, index_interval=1.0) as recorder:
+        recorder.write(header)
+        for i in range(100):
+            payload = struct.pack('<f', float(i))
+            recorder.write(TelemetryFrame(0, payload, payload=payload, timestamp=i * SECOND // 10))
+    return path
+
+
+def values(frames):
+    return [struct.unpack('<f', f.payload)[0] for f in frames if isinstance(f, TelemetryFrame)]
+
+
+def test_seek_returns_the_header_and_the_frames_in_range(path):
+    with Recording(path) as recording:
+        frames = list(recording.frames(2.5, 3.0))
+        assert isinstance(frames[0], HeaderFrame)
+        assert len([f for f in frames if isinstance(f, HeaderFrame)]) == 1
+        assert values(frames) == [25.0, 26.0, 27.0, 28.0, 29.0]
+        assert recording.duration() == pytest.approx(9.9)
+
+
+def test_missing_index_is_rebuilt(path):
+    with Recording(path) as recording:
+        offsets = list(recording._offsets)
+        expected = values(recording.frames(4.05))
+    os.remove(path + ".idx")
+    with Recording(path) as recording:
+        assert recording._offsets == offsets
+        assert values(recording.frames(4.05)) == expected
@@ -0,0 +1,64 @@
+import math
+import numpy as np
+import pytest
+from simplefoc import HeaderFrame
+from simplefoc.ring import SharedRing
+from simplefoc.registers import SimpleFOCRegisters
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing(create=True, capacity=8, width=3)
+    ring.set_header(HeaderFrame(0, [SimpleFOCRegisters.REG_TARGET, SimpleFOCRegisters.REG_VELOCITY], [0, 0]))
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def read_all(reader):
+    timestamps = []
+    while True:
+        t, v = reader.read()
+        if len(t) == 0:
+            return timestamps
+        timestamps += t.tolist()
+
+
+def test_reader_counts_samples_lost_when_lapped(ring):
+    reader = ring.reader()
+    for i in range(5):
+        ring.append_sample(i, [float(i), 0.0])
+    assert read_all(reader) == [0, 1, 2, 3, 4]
+    for i in range(5, 25):
+        ring.append_sample(i, [float(i), 0.0])
+    assert read_all(reader) == list(range(17, 25))
+    assert reader.lost == 12
+
+
+def test_oversized_append_keeps_the_last_samples(ring):
+    reader = ring.reader()
+    ring.append(np.arange(20), np.zeros((20, 2)))
+    assert ring.sequence == 20
+    assert read_all(reader) == list(range(12, 20))
+    assert reader.lost == 12
+
+
+def test_header_change_skips_older_samples(ring):
+    reader = ring.reader()
+    ring.append_sample(1, [1.0, 2.0])
+    assert read_all(reader) == [1]
+    ring.append_sample(2, [3.0, 4.0])
+    ring.set_header(HeaderFrame(1, [SimpleFOCRegisters.REG_ANGLE], [0]))
+    ring.append_sample(3, [5.0])
+    t, v = reader.read()
+    assert t.tolist() == [3] and v.tolist() == [[5.0]]
+    assert reader.generation == 2
+
+
+def test_short_sample_clears_the_rest_of_the_row(ring):
+    reader = ring.reader()
+    for i in range(8):
+        ring.append_sample(i, [1.0, 2.0, 3.0])
+    read_all(reader)
+    ring.append_sample(8, [4.0])
+    assert math.isnan(ring._values[0, 1]) and math.isnan(ring._values[0, 2])
@@ -24,6 +24,8 @@ import argparse
 import sys
 import json
 import simplefoc.packets as packets
+from simplefoc.recording import Recorder
+from simplefoc.dispatch import DropPolicy
 from rx import operators as ops, Observable as rx
 try:
     from paho.mqtt import client as mqtt_client
@@ -46,6 +48,9 @@ parser.add_argument('--mqtt', type=str, help='MQTT server in the form: mqtt://us
 parser.add_argument('--influx', type=str, help='InfluxDB server', required=False)
 parser.add_argument('--nohup', type=bool, default=False, help='Don\'t stop telemetry')
 parser.add_argument('--header', action='store_true', help='Print header at start of output')
+parser.add_argument('--drop-policy', choices=['drop_oldest', 'drop_newest', 'block'], type=str, required=False,
+                    help='Deliver frames from a separate thread, so slow outputs don\'t stall the serial port, dropping frames by this policy if they can\'t keep up')
+parser.add_argument('--queue-size', type=int, default=10000, help='Maximum frames waiting for delivery, with --drop-policy')
 parser.add_argument('--echo', type=str, help='Print command responses to stdout', default=False) # TODO implement
 parser.add_argument('port', type=str, help='Serial port to use')
 parser.add_argument('registers', type=str, help='Set registers to monitor on MCU', nargs='*')
@@ -69,17 +74,17 @@ def format_frame(frame, format):
             return joinchar.join(str(x) for x in frame.values)
         elif format == 'json':
             return json.dumps(frame.values)
-        # elif format == 'binary':
-        #     pass # todo implement
     return str(frame) # in all other cases, return the string representation of the python object
 
 
+drop_policy = DropPolicy[args.drop_policy] if args.drop_policy is not None else None
+
 motors = None
 match args.type:
     case 'binary':
-        motors = packets.serial(args.port, args.baud)
+        motors = packets.serial(args.port, args.baud, drop_policy=drop_policy, queue_size=args.queue_size)
     case 'ascii':
-        motors = packets.serial(args.port, args.baud, protocol=packets.ProtocolType.ascii)
+        motors = packets.serial(args.port, args.baud, protocol=packets.ProtocolType.ascii, drop_policy=drop_policy, queue_size=args.queue_size)
     case _:
         print("Invalid protocol type.")
         sys.exit(1)
@@ -92,6 +97,9 @@ def signalhandler(signum):
     motors.disconnect()
     if args.verbose:
         print("Serial port closed.")
+        dispatcher = motors.connection.dispatcher
+        if dispatcher is not None:
+            print(f"Frames queued: {dispatcher.queued}, dropped: {dispatcher.dropped}, queue high water: {dispatcher.high_water}")
 
 
 telemetry = motors.telemetry()
@@ -116,7 +124,8 @@ if args.samples is not None and args.samples > 0:
 if args.seconds is not None and args.seconds > 0:
     pipeline.append(ops.take_until_with_time(args.seconds))
 
-pipeline.append(ops.map(lambda p: format_frame(p, args.format)))
+if args.format != 'binary':    # binary recordings are written from the frames
+    pipeline.append(ops.map(lambda p: format_frame(p, args.format)))
 
 if args.format == 'json':
     pipeline.append(ops.start_with('['))
@@ -124,7 +133,13 @@ if args.format == 'json':
 
 frames = telemetry.observable().pipe(*pipeline)
 
-if args.output is not None:
+if args.format == 'binary':
+    if args.output is None:
+        print("Binary format requires an output file, use --output.")
+        sys.exit(1)
+    recorder = Recorder(args.output)
+    frames.subscribe(on_next=recorder.write, on_completed=recorder.close)
+elif args.output is not None:
     with open(args.output, 'w') as file:
         frames.subscribe(on_next=lambda f: file.write(f, '\n'), on_completed=lambda: file.close())
 else: